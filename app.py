@@ -1,43 +1,91 @@
 # app.py
 
 import streamlit as st
-import pandas as pd
-import numpy as np
+import hashlib
 import os
-import io
-from document_parser import get_text_from_file
-from llm_handler import (
-    extract_data_from_text, 
-    normalize_and_group_items, 
-    generate_tender_insight,
-    generate_search_query,
-    analyze_search_results
-)
-from internet_search import google_search
+import threading
+import time
+from instrumentation import recorder
+from prompt_serializer import token_usage
+from llm_cache import llm_cache
+
+# Конвейер (pandas, PyMuPDF, python-docx, google.generativeai, googleapiclient) импортируется не при старте,
+# а в фоне после первой отрисовки и в обработчиках кнопок — страница открывается сразу
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
+@st.cache_data(show_spinner=False)
 def load_file_bytes(filepath):
     try:
         with open(filepath, "rb") as f: return f.read()
     except FileNotFoundError: return None
 
-def to_excel(df: pd.DataFrame):
-    output = io.BytesIO()
-    df_for_excel = df.fillna('')
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_for_excel.to_excel(writer, index=False, sheet_name='Сравнение')
-    return output.getvalue()
+@st.cache_data(show_spinner=False)
+def list_demo_files(directory):
+    try:
+        return sorted([f for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))])
+    except FileNotFoundError: return []
+
+def preload_pipeline():
+    # Модель создается при первом запросе: google.generativeai, загруженный заранее, замедляет каждый rerun
+    import pipeline, internet_search  # noqa: F401
+
+@st.cache_resource(show_spinner=False)
+def start_preloading():
+    """Фоновый импорт конвейера — один раз на процесс, пока пользователь выбирает файлы."""
+    thread = threading.Thread(target=preload_pipeline, daemon=True)
+    thread.start()
+    return thread
+
+def show_debug_panel():
+    """Панель диагностики: разбивка последнего запуска по этапам, токены и кэш."""
+    if not st.session_state.get('debug_mode'): return
+    with st.expander("🛠 Диагностика: время и токены по этапам"):
+        summary = recorder.summary()
+        if summary: st.dataframe(summary, use_container_width=True, hide_index=True)
+        else: st.caption("Замеров пока нет — запустите анализ.")
+        st.write("Токены по операциям:", token_usage.snapshot())
+        st.write("Кэш LLM:", llm_cache.stats())
+
+def show_price_history(item_names):
+    """История цен по каноничным товарам из прошлых тендеров (если включена история предложений)."""
+    from offer_store import offer_store
+    if not offer_store.enabled: return
+    import pandas as pd
+    with st.expander("📈 История цен по прошлым тендерам"):
+        query = st.text_input("Поиск по наименованию или артикулу", key="history_query")
+        names = offer_store.search(query) if query else item_names
+        if not names:
+            st.caption("Ничего не найдено."); return
+        selected = st.selectbox("Товар", names, key="history_item")
+        history = pd.DataFrame(offer_store.price_history(selected))
+        if history.empty:
+            st.caption("По этому товару истории пока нет."); return
+        history["created_at"] = pd.to_datetime(history["created_at"], unit="s")
+        history = history.rename(columns={"created_at": "Дата", "tender": "Тендер", "supplier": "Поставщик",
+                                          "name": "Наименование у поставщика", "price_per_unit": "Цена за ед."})
+        st.line_chart(history, x="Дата", y="Цена за ед.", color="Поставщик")
+        st.dataframe(history, use_container_width=True, hide_index=True)
 
 # --- UI Настройка ---
 st.set_page_config(layout="wide", page_title="Тендер-Эксперт")
 st.title("AI-анализатор Тендер-Эксперт")
 st.write("Интеллектуальный помощник для анализа коммерческих предложений и поиска лучших цен на рынке.")
+start_preloading()
 
 # --- Инициализация состояния сессии ---
 if 'demo_mode' not in st.session_state:
     st.session_state.demo_mode = False
 if 'analysis_results' not in st.session_state:
     st.session_state.analysis_results = None
+# Позиции уже обработанных файлов (по хэшу имени и содержимого): при изменении набора файлов
+# повторный анализ извлекает только новые и измененные файлы
+if 'file_results' not in st.session_state:
+    st.session_state.file_results = {}
+# Замеры диагностики у каждой сессии свои: каждый rerun идет в новом потоке, поэтому запуск сессии восстанавливаем
+if 'run_id' in st.session_state:
+    recorder.use_run(st.session_state.run_id)
+
+st.sidebar.checkbox("Режим диагностики", value=os.getenv("TENDER_DEBUG", "0") == "1", key="debug_mode")
 
 # --- Создание вкладок ---
 tab1, tab2 = st.tabs(["📁 Сравнение предложений", "🌐 Поиск по рынку"])
@@ -46,9 +94,7 @@ tab1, tab2 = st.tabs(["📁 Сравнение предложений", "🌐 П
 with tab1:
     st.header("Шаг 1: Выберите источник файлов")
     DEMO_FILES_DIR = "demo_files"
-    try:
-        demo_filenames = sorted([f for f in os.listdir(DEMO_FILES_DIR) if os.path.isfile(os.path.join(DEMO_FILES_DIR, f))])
-    except FileNotFoundError: demo_filenames = []
+    demo_filenames = list_demo_files(DEMO_FILES_DIR)
 
     if demo_filenames:
         with st.container(border=True):
@@ -57,7 +103,6 @@ with tab1:
             if st.button("Использовать демо-файлы", type="primary"):
                 st.session_state.demo_mode = True
                 st.session_state.uploader_key = (st.session_state.get('uploader_key', 0) + 1)
-                st.session_state.analysis_results = None # Сбрасываем старые результаты
                 st.rerun()
             
             st.markdown("Или скачайте их, чтобы посмотреть:"); cols = st.columns(len(demo_filenames))
@@ -79,7 +124,6 @@ with tab1:
     )
     if uploaded_files:
         st.session_state.demo_mode = False
-        st.session_state.analysis_results = None # Сбрасываем старые результаты
 
     files_to_process = []
     if st.session_state.demo_mode:
@@ -93,47 +137,71 @@ with tab1:
 
     if st.session_state.demo_mode: st.success("Выбран демо-режим. Нажмите 'Сравнить предложения', чтобы начать.")
 
+    # Результаты относятся к определенному набору файлов: если набор изменился, старую таблицу не показываем
+    # (группировку из них используем при следующем сравнении)
+    current_files = sorted((f["name"], hashlib.sha256(f["data"]).hexdigest()) for f in files_to_process)
+    if st.session_state.analysis_results and st.session_state.analysis_results.get("files") != current_files:
+        st.session_state.previous_grouping = st.session_state.analysis_results.get("grouping")
+        st.session_state.analysis_results = None
+
     st.header("Шаг 2: Запустите анализ")
+    with st.expander("Ограничения при разделении закупки"):
+        max_suppliers = st.number_input("Не больше поставщиков (0 — без ограничения)", min_value=0, value=0, step=1)
+        min_order = st.number_input("Минимальная сумма заказа у поставщика, ₽", min_value=0.0, value=0.0, step=1000.0)
+        full_coverage_only = st.checkbox("Лучший поставщик должен предлагать все позиции")
     if st.button("Сравнить предложения", disabled=not files_to_process, key="compare_button"):
+        import pandas as pd
+        from pipeline import extract_new_items, compare_items
+        st.session_state.run_id = recorder.start_run()
         with st.spinner("Выполняю полный анализ..."):
             all_items = []
             with st.status("Анализ документов...", expanded=True) as status:
-                for file_info in files_to_process:
-                    filename, file_data = file_info["name"], file_info["data"]
-                    st.write(f"Обработка файла: {filename}...")
-                    text = get_text_from_file(io.BytesIO(file_data), filename)
-                    supplier_name = filename.split('.')[0]
-                    extracted_items = extract_data_from_text(text, supplier_name)
-                    if extracted_items: all_items.extend(extracted_items)
+                st.write(f"Обработка файлов: {len(files_to_process)} шт. (параллельно)...")
+
+                live_table = st.empty()
+                live_rows, last_render = [], [0.0]
+
+                def show_file_progress(filename, extracted_items, complete):
+                    if not complete and extracted_items:
+                        st.warning(f"Файл {filename} обработан не полностью (ответ модели оборван или прерван ошибкой): найдено позиций — "
+                                   f"{len(extracted_items)}. При повторном анализе файл будет обработан заново.")
+                    elif extracted_items: st.write(f"Файл {filename}: найдено позиций — {len(extracted_items)}")
                     else: st.warning(f"Не удалось извлечь структурированные данные из файла: {filename}")
+
+                def render_live_rows():
+                    live_table.dataframe(pd.DataFrame(live_rows), use_container_width=True, hide_index=True)
+                    last_render[0] = time.monotonic()
+
+                def show_item(filename, item):
+                    # Позиции показываем сразу, как модель их выдала; перерисовываем не чаще раза в 0.3 с
+                    live_rows.append({"Поставщик": item.supplier, "Наименование": item.name,
+                                      "Кол-во": item.quantity, "Цена за ед.": item.price_per_unit})
+                    if time.monotonic() - last_render[0] > 0.3: render_live_rows()
+
+                # Результаты приходят в порядке входных файлов, независимо от того, какой файл обработан первым
+                for extracted_items in extract_new_items(files_to_process, st.session_state.file_results,
+                                                         on_progress=show_file_progress, on_item=show_item):
+                    all_items.extend(extracted_items)
+                if live_rows: render_live_rows()
                 status.update(label="✅ Документы проанализированы!", state="complete")
 
             if all_items:
-                normalized_data = normalize_and_group_items(all_items)
-                if normalized_data:
-                    suppliers = sorted(list(set(item['supplier'] for item in all_items)))
-                    table_data = []
-                    for group in normalized_data:
-                        row = {"Номенклатура": group['canonical_name']}
-                        offers_by_supplier = {offer['supplier']: offer.get('price_per_unit') for offer in group['offers']}
-                        for supplier in suppliers:
-                            price = offers_by_supplier.get(supplier)
-                            row[supplier] = float(price) if price is not None else np.nan
-                        table_data.append(row)
-                    df = pd.DataFrame(table_data)
-                    insight_text = generate_tender_insight(df.to_json(orient='records', force_ascii=False), {s: df[s].sum() for s in suppliers})
-                    
+                # Группировка, таблица и инсайт — тот же конвейер, что и в пакетном режиме (python pipeline.py)
+                previous_grouping = (st.session_state.analysis_results or {}).get("grouping") \
+                    or st.session_state.get("previous_grouping")
+                comparison = compare_items(all_items, previous_grouping, max_suppliers=int(max_suppliers) or None,
+                                           min_order=min_order, full_coverage_only=full_coverage_only)
+                if comparison:
                     # Сохраняем ВСЕ результаты в сессию
-                    st.session_state.analysis_results = {
-                        "df": df,
-                        "insight_text": insight_text,
-                        "suppliers": suppliers
-                    }
+                    comparison["files"] = current_files
+                    st.session_state.analysis_results = comparison
                 else: st.error("Не удалось сгруппировать позиции.")
             else: st.error("Не удалось извлечь данные ни из одного файла.")
+        recorder.export()
     
     # --- БЛОК ОТОБРАЖЕНИЯ РЕЗУЛЬТАТОВ (работает всегда, если есть данные в сессии) ---
     if st.session_state.analysis_results:
+        from pipeline import to_excel, add_market_median, MARKET_MEDIAN_COLUMN
         st.success("🎉 Анализ завершен! Результаты представлены ниже:")
         
         df = st.session_state.analysis_results["df"]
@@ -145,8 +213,21 @@ with tab1:
             min_val = s.min()
             return ['border: 2px solid #3c78e4; font-weight: bold;' if v == min_val else '' for v in s]
         
-        styled_df = df.style.apply(highlight_min_universal, axis=1, subset=suppliers).format({s: "{:,.2f}" for s in suppliers}, na_rep="—")
+        price_columns = suppliers + ([MARKET_MEDIAN_COLUMN] if MARKET_MEDIAN_COLUMN in df.columns else [])
+        styled_df = df.style.apply(highlight_min_universal, axis=1, subset=suppliers).format({s: "{:,.2f}" for s in price_columns}, na_rep="—")
         st.dataframe(styled_df, use_container_width=True, hide_index=True)
+
+        if MARKET_MEDIAN_COLUMN not in df.columns and st.button("🌐 Сравнить все позиции с рынком", key="market_button"):
+            # Все позиции проверяются параллельно: запрос, поиск и анализ выдачи для каждой
+            st.session_state.run_id = recorder.start_run()
+            progress = st.progress(0.0, text="Ищу цены на рынке...")
+            done = [0]
+            def show_market_progress(item_name, price):
+                done[0] += 1
+                progress.progress(done[0] / len(df), text=f"Проверено позиций: {done[0]} из {len(df)}")
+            st.session_state.analysis_results["df"] = add_market_median(df, on_progress=show_market_progress)
+            recorder.export()
+            st.rerun()
         
         excel_data = to_excel(df)
         st.download_button(label="📥 Скачать отчет в формате Excel", data=excel_data, file_name="tender_expert_report.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
@@ -161,8 +242,18 @@ with tab1:
             with cols[i]:
                 st.markdown(f"**{col_name}**"); st.markdown(totals.get(col_name, ''))
         
+        optimization = st.session_state.analysis_results.get("optimization")
+        if optimization and optimization.best_supplier:
+            st.markdown("---")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Лучший поставщик целиком", optimization.best_supplier, f"{optimization.best_supplier_total:,.2f} ₽", delta_color="off")
+            col2.metric("Оптимальное разделение", f"{optimization.split_total:,.2f} ₽", f"{len(optimization.split_allocation)} пост., {optimization.split_covered} из {optimization.rows} поз.", delta_color="off")
+            col3.metric("Экономия от разделения", f"{optimization.split_savings:,.2f} ₽")
+
         st.markdown("---")
         st.info(f"**Инсайт от AI-агента:**\n\n{insight_text}")
+        show_price_history(df["Номенклатура"].tolist())
+    show_debug_panel()
 
 # --- Логика для второй вкладки ---
 with tab2:
@@ -170,6 +261,10 @@ with tab2:
     st.header("Найдите лучшее предложение в интернете")
     item_to_search = st.text_input("Введите наименование товара:", placeholder="Например, Подшипник 6205-2RS")
     if st.button("🔍 Найти предложения", disabled=not item_to_search, key="search_button"):
+        from llm_handler import generate_search_query, stream_analyze_search_results
+        from internet_search import google_search
+        from pipeline import offer_prices
+        st.session_state.run_id = recorder.start_run()
         with st.spinner("Формирую поисковый запрос..."):
             search_query = generate_search_query(item_to_search)
             st.write(f"Ищем по запросу: *«{search_query}»*")
@@ -179,30 +274,40 @@ with tab2:
             st.error("Не удалось найти информацию по вашему запросу.")
         else:
             with st.spinner("Анализирую найденные предложения..."):
-                offers = analyze_search_results(search_results, item_to_search)
+                # Предложения показываем по мере того, как модель их находит
+                offers = []
+                live_offers = st.empty()
+                for offer in stream_analyze_search_results(search_results, item_to_search):
+                    offers.append(offer)
+                    with live_offers.container():
+                        st.caption(f"Найдено предложений: {len(offers)}")
+                        for found in offers:
+                            st.write(f"• {found.supplier_name or 'Неизвестный поставщик'} — {f'{found.price:,.2f} ₽' if found.price is not None else 'цена не найдена'}")
+                live_offers.empty()
             if not offers:
                 st.warning("Поиск дал результаты, но AI-агент не смог извлечь из них конкретные ценовые предложения.")
             else:
-                prices = [o['price'] for o in offers if 'price' in o and o['price'] is not None and o['price'] > 0]
+                prices = offer_prices(offers)
                 if prices:
                     st.metric(label="Средняя цена на рынке (по найденным предложениям)", value=f"~ {sum(prices) / len(prices):,.2f} ₽")
                 else:
                     st.info("Не удалось найти достаточно данных для расчета средней цены.")
                 with st.expander(f"Показать найденные предложения ({len(offers)} шт.)"):
-                    sorted_offers = sorted(offers, key=lambda x: x.get('price', float('inf')))
+                    sorted_offers = sorted(offers, key=lambda x: x.price if x.price is not None else float('inf'))
                     for offer in sorted_offers:
                         with st.container(border=True):
                             col1, col2 = st.columns([3, 1])
                             with col1:
-                                st.subheader(offer.get('supplier_name', 'Неизвестный поставщик'))
-                                st.markdown(f"*{offer.get('snippet', 'Нет описания...')}*")
-                                st.markdown(f"[Перейти на страницу]({offer.get('link')})", unsafe_allow_html=True)
+                                st.subheader(offer.supplier_name or 'Неизвестный поставщик')
+                                st.markdown(f"*{offer.snippet or 'Нет описания...'}*")
+                                st.markdown(f"[Перейти на страницу]({offer.link})", unsafe_allow_html=True)
                             with col2:
-                                price = offer.get('price')
-                                if price:
-                                    st.metric(label="Цена", value=f"{price:,.2f} ₽")
+                                if offer.price:
+                                    st.metric(label="Цена", value=f"{offer.price:,.2f} ₽")
                                 else:
                                     st.metric(label="Цена", value="Не найдена")
+        recorder.export()
+        show_debug_panel()
 
 # --- Плашка-дисклеймер в футере ---
 st.divider()
@@ -0,0 +1,525 @@
+# benchmark.py
+"""
+Офлайн-бенчмарк конвейера сравнения КП без обращения к Gemini и Google.
+
+Модель и поиск подменяются локальными заглушками с настраиваемой задержкой. Заглушки отдают записанные ответы
+(--replay файл.jsonl), а для незаписанных промптов синтезируют правдоподобный ответ. Реальные ответы можно
+записать один раз (--record файл.jsonl, нужны ключи API) и потом прогонять бенчмарк на них.
+
+Сценарии: demo_files/ и синтетические КП (PDF, DOCX, XLSX) на 10/100/500 файлов и от 10 до 5000 строк.
+Метрики: файлов в секунду, p50/p95 длительности этапов, пиковый RSS, входные и выходные токены промптов,
+время холодного старта приложения и повторного прогона скрипта Streamlit.
+
+Примеры:
+    python benchmark.py                                   # быстрый профиль
+    python benchmark.py --profile full --save-baseline    # полный профиль и сохранение эталона
+    python benchmark.py --compare benchmark_baseline.json # сравнение с эталоном (код выхода 1 при регрессии)
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import docx
+import fitz
+import numpy as np
+import pandas as pd
+
+import internet_search
+import llm_handler
+from instrumentation import recorder
+from llm_cache import llm_cache
+from offer_store import offer_store
+from pipeline import extract_items_from_files, extract_new_items, compare_items, search_market_prices
+from prompt_serializer import token_usage
+from rate_limit import RateLimiter
+
+DEMO_FILES_DIR = "demo_files"
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+# Профили: (имя сценария, число файлов, диапазон строк в файле)
+PROFILES = {
+    "quick": [("synthetic-10x10-500", 10, (10, 500))],
+    "full": [
+        ("synthetic-10x10-5000", 10, (10, 5000)),
+        ("synthetic-100x10-1000", 100, (10, 1000)),
+        ("synthetic-500x10-200", 500, (10, 200)),
+    ],
+}
+# Повторный анализ после добавления одного КП к тендеру: (число поставщиков до добавления, диапазон строк)
+LATE_SUPPLIER = (15, (10, 200))
+# Метрики, по которым сравниваем с эталоном, и допустимое ухудшение
+REGRESSION_TOLERANCE = 0.2
+HIGHER_IS_BETTER = {"files_per_sec"}
+LOWER_IS_BETTER = {"input_tokens", "output_tokens", "llm_calls", "cold_start_s", "rerun_s", "pipeline_import_s"}
+
+# Замер старта приложения в чистом процессе: первый прогон app.py (холодный старт, включая импорт Streamlit),
+# сколько еще ждать готовности конвейера после первой отрисовки и повторный прогон (как при каждом действии)
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=120)
+app.run()
+cold = time.perf_counter() - start
+start = time.perf_counter()
+import pipeline  # Ждем, пока конвейер догрузится после первой отрисовки
+pipeline_import = time.perf_counter() - start
+start = time.perf_counter()
+app.run()
+rerun = time.perf_counter() - start
+json.dump({"cold_start_s": cold, "rerun_s": rerun, "pipeline_import_s": pipeline_import,
+           "exception": bool(app.exception)}, sys.stdout)
+"""
+
+CATALOGUE = [
+    ("Подшипник шариковый", "6", "шт"), ("Болт DIN 933 М", "B", "шт"), ("Гайка DIN 934 М", "G", "шт"),
+    ("Кабель ВВГнг-LS 3х", "K", "м"), ("Труба стальная ВГП Ду", "T", "м"), ("Задвижка 30с41нж Ду", "Z", "шт"),
+    ("Электроды УОНИ-13/55 d", "E", "кг"), ("Автомат ВА47-29", "A", "шт"), ("Перчатки х/б ПВХ", "P", "пара"),
+    ("Краска ПФ-115", "F", "кг"),
+]
+TABLE_HEADER = ["№", "Наименование", "Артикул", "Кол-во", "Ед. изм.", "Цена за ед., руб.", "Сумма, руб."]
+PDF_ROWS_PER_PAGE = 40
+
+
+# --- ЗАГЛУШКИ МОДЕЛИ И ПОИСКА ---
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def load_recordings(path: str) -> dict:
+    """Записанные ответы: JSON lines вида {"key": sha256 промпта или запроса, "text"/"items": ответ}."""
+    recordings = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    recordings[record["key"]] = record
+    return recordings
+
+
+class FakeResponse:
+    """Ответ в формате google.generativeai: text, usage_metadata и итерация по фрагментам при stream=True."""
+
+    def __init__(self, text: str, prompt: str, latency: float, chunks: int = 1):
+        self.text = text
+        self.usage_metadata = types.SimpleNamespace(prompt_token_count=llm_handler.estimate_tokens(prompt),
+                                                    candidates_token_count=llm_handler.estimate_tokens(text))
+        self._latency = latency
+        self._chunks = max(1, chunks)
+
+    def __iter__(self):
+        size = len(self.text) // self._chunks + 1
+        for start in range(0, len(self.text), size):
+            time.sleep(self._latency / self._chunks)
+            yield types.SimpleNamespace(text=self.text[start:start + size])
+
+
+class FakeGenerativeModel:
+    """Заглушка genai.GenerativeModel: записанный ответ по хэшу промпта или синтезированный, с задержкой latency."""
+
+    def __init__(self, latency: float = 0.0, recordings: dict = None):
+        self.latency = latency
+        self.recordings = recordings or {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def count_tokens(self, prompt):
+        return types.SimpleNamespace(total_tokens=llm_handler.estimate_tokens(prompt))
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        with self._lock:
+            self.calls += 1
+        record = self.recordings.get(prompt_key(prompt))
+        text = record["text"] if record else synthesize_response(prompt)
+        if stream:
+            return FakeResponse(text, prompt, self.latency, chunks=8)
+        time.sleep(self.latency)
+        return FakeResponse(text, prompt, self.latency)
+
+
+class FakeSearchBackend:
+    """Заглушка поиска для internet_search.set_search_backend: записанная выдача или синтезированная, с задержкой."""
+
+    def __init__(self, latency: float = 0.0, recordings: dict = None):
+        self.latency = latency
+        self.recordings = recordings or {}
+
+    def __call__(self, query: str, num_results: int) -> list:
+        time.sleep(self.latency)
+        record = self.recordings.get(prompt_key(query))
+        return record["items"] if record else synthesize_search_results(query, num_results)
+
+
+class RecordingModel:
+    """Обертка над настоящей моделью, дописывающая ответы в файл записей для последующего воспроизведения."""
+
+    def __init__(self, llm, path: str):
+        self.llm = llm
+        self.path = path
+        self._lock = threading.Lock()
+
+    def count_tokens(self, prompt):
+        return self.llm.count_tokens(prompt)
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        response = self.llm.generate_content(prompt)  # Записываем целиком, поток воспроизводит заглушка
+        _append_record(self.path, self._lock, {"key": prompt_key(prompt), "text": response.text})
+        return FakeResponse(response.text, prompt, 0.0) if stream else response
+
+
+def _append_record(path: str, lock: threading.Lock, record: dict):
+    with lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _prompt_section(prompt: str, marker: str) -> str:
+    """Текст между маркером и следующей строкой "---" (так промпты оформляют входные данные)."""
+    tail = prompt.split(marker, 1)[1]
+    parts = re.split(r"^\s*---\s*$", tail, flags=re.MULTILINE)
+    return parts[1] if len(parts) > 2 else tail
+
+
+def _numbers(text: str) -> list:
+    return [float(n.replace(" ", "").replace(",", ".")) for n in re.findall(r"\d[\d ]*(?:[.,]\d+)?", text)]
+
+
+def synthesize_response(prompt: str) -> str:
+    """Правдоподобный ответ модели по типу промпта (анализ выдачи, извлечение, группировка, инсайт, запрос)."""
+    if "поисковую выдачу" in prompt:
+        offers = []
+        for line in prompt.splitlines()[1:]:
+            fields = line.strip().split("\t")
+            if len(fields) == 4 and fields[0].isdigit():
+                price = re.search(r"(\d+(?:\.\d+)?) руб", fields[3])
+                if price:
+                    offers.append({"supplier_name": fields[1], "price": float(price.group(1)),
+                                   "link": fields[2], "snippet": fields[3]})
+        return json.dumps(offers, ensure_ascii=False)
+    if "ТЕКСТ ДЛЯ АНАЛИЗА" in prompt:
+        items = []
+        for line in _prompt_section(prompt, "ТЕКСТ ДЛЯ АНАЛИЗА").splitlines():
+            line = line.strip(" -•\t")
+            if not re.search(r"руб|₽", line, re.IGNORECASE):
+                continue
+            name = re.split(r"[,.;]\s|\s\d", line, 1)[0].strip()
+            quantity = re.search(r"(\d+)\s*(шт|штук|м|кг|пар)", line)
+            numbers = _numbers(line)
+            if name and numbers:
+                items.append({"name": name, "quantity": float(quantity.group(1)) if quantity else 1,
+                              "unit": "шт.", "price_per_unit": numbers[-1]})
+        return json.dumps(items, ensure_ascii=False)
+    if "ВХОДНЫЕ ДАННЫЕ (TSV)" in prompt:
+        return "[]"  # Неоднозначные позиции оставляем раздельными
+    if "ТВОЙ АНАЛИТИЧЕСКИЙ ВЫВОД" in prompt:
+        return "Самая низкая общая сумма у первого поставщика; разделение закупки дает дополнительную экономию."
+    if "поисковый запрос" in prompt:
+        name = re.search(r'Название товара: "(.*)"', prompt)
+        return f"{name.group(1) if name else 'товар'} купить цена"
+    return ""
+
+
+def synthesize_search_results(query: str, num: int) -> list:
+    rng = random.Random(query)
+    return [{"title": f"Магазин {i + 1}", "link": f"https://shop{i + 1}.example/item",
+             "snippet": f"{query}: {rng.randint(100, 50000)}.00 руб. в наличии"} for i in range(num)]
+
+
+def install_fakes(llm_latency: float, search_latency: float, replay: str = None, record: str = None):
+    """Подменяет модель, клиент поиска и лимиты так, чтобы бенчмарк не зависел от сети и квот."""
+    recordings = load_recordings(replay)
+    if record:
+        # Запись настоящих ответов: модель оборачиваем, поиск сохраняем в тот же файл
+        fake_model, lock = RecordingModel(llm_handler.get_model(), record), threading.Lock()
+
+        def search_and_record(query: str, num_results: int) -> list:
+            items = internet_search.google_backend(query, num_results)
+            _append_record(record, lock, {"key": prompt_key(query), "items": items})
+            return items
+        internet_search.set_search_backend(search_and_record)
+    else:
+        fake_model = FakeGenerativeModel(llm_latency, recordings)
+        internet_search.set_search_backend(FakeSearchBackend(search_latency, recordings))
+    llm_handler.model = fake_model
+    llm_handler._insight_model = fake_model
+    llm_handler.rate_limiter = RateLimiter(0)
+    llm_cache.enabled = False  # Иначе повторные прогоны мерили бы кэш, а не конвейер
+    offer_store.enabled = False  # По той же причине не используем и историю предложений
+    return fake_model
+
+
+# --- СИНТЕТИЧЕСКИЕ КП ---
+
+def synthetic_rows(rows: int, supplier_index: int, rng: random.Random) -> list:
+    """Строки таблицы КП: общие для всех поставщиков позиции с немного разными ценами и написанием."""
+    result = []
+    for i in range(rows):
+        base, prefix, unit = CATALOGUE[i % len(CATALOGUE)]
+        sku = f"{prefix}{1000 + i:05d}"
+        name = f"{base} {10 + i % 90}" if supplier_index % 2 == 0 else f"{base} {10 + i % 90} (аналог)"
+        quantity = 1 + (i * 7) % 50
+        price = round(100 + (i * 37) % 5000 * (1 + 0.05 * rng.random()), 2)
+        result.append([str(i + 1), name, sku, str(quantity), unit, f"{price:.2f}", f"{price * quantity:.2f}"])
+    return result
+
+
+def make_xlsx(rows: list) -> bytes:
+    output = io.BytesIO()
+    pd.DataFrame(rows, columns=TABLE_HEADER).to_excel(output, index=False)
+    return output.getvalue()
+
+
+def make_docx(rows: list) -> bytes:
+    document = docx.Document()
+    document.add_paragraph("Коммерческое предложение")
+    table = document.add_table(rows=1, cols=len(TABLE_HEADER))
+    for cell, text in zip(table.rows[0].cells, TABLE_HEADER):
+        cell.text = text
+    for row in rows:
+        for cell, text in zip(table.add_row().cells, row):
+            cell.text = text
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def make_docx_text(rows: list) -> bytes:
+    """КП без таблицы (свободный текст) — такие документы уходят в модель."""
+    document = docx.Document()
+    document.add_paragraph("Коммерческое предложение. Готовы предложить следующие позиции:")
+    for _, name, sku, quantity, unit, price, _ in rows:
+        document.add_paragraph(f"- {name}, арт. {sku}. {quantity} {unit}. Цена: {price} руб.")
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def make_pdf(rows: list, repeat_header: bool = True) -> bytes:
+    """
+    PDF с разлинованной таблицей, чтобы работал find_tables. repeat_header=False — шапка таблицы только
+    на первой странице, дальше таблица продолжается без заголовка (так выглядит большинство реальных КП).
+    """
+    document = fitz.open()
+    font = fitz.Font("helv")  # Через TextWriter шрифт встраивается с кириллицей, и текст извлекается обратно
+    widths = [25, 190, 70, 45, 45, 70, 75]
+    row_height = 18
+    for start in range(0, max(len(rows), 1), PDF_ROWS_PER_PAGE):
+        page = document.new_page()
+        writer = fitz.TextWriter(page.rect)
+        y = 40
+        header = [TABLE_HEADER] if repeat_header or start == 0 else []
+        for row in header + rows[start:start + PDF_ROWS_PER_PAGE]:
+            x = 20
+            for width, text in zip(widths, row):
+                page.draw_rect(fitz.Rect(x, y, x + width, y + row_height), width=0.5)
+                writer.append((x + 2, y + 12), text[:40], font=font, fontsize=7)
+                x += width
+            y += row_height
+        writer.write_text(page)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def make_pdf_continued(rows: list) -> bytes:
+    return make_pdf(rows, repeat_header=False)
+
+
+FORMATS = [("pdf", make_pdf), ("xlsx", make_xlsx), ("docx", make_docx), ("docx", make_docx_text),
+           ("pdf", make_pdf_continued)]
+
+
+def synthetic_files(count: int, row_range: tuple, seed: int = 42) -> list:
+    """count файлов КП разных форматов; число строк распределено логарифмически в диапазоне row_range."""
+    rng = random.Random(seed)
+    low, high = row_range
+    files = []
+    for i in range(count):
+        rows = int(round(np.exp(rng.uniform(np.log(low), np.log(high)))))
+        extension, make = FORMATS[i % len(FORMATS)]
+        files.append({"name": f"Поставщик {i + 1:03d}.{extension}", "data": make(synthetic_rows(rows, i, rng))})
+    return files
+
+
+def demo_files() -> list:
+    if not os.path.isdir(DEMO_FILES_DIR):
+        return []
+    return [{"name": name, "data": open(os.path.join(DEMO_FILES_DIR, name), "rb").read()}
+            for name in sorted(os.listdir(DEMO_FILES_DIR))]
+
+
+# --- ПРОГОН И МЕТРИКИ ---
+
+def run_compare(files: list) -> dict:
+    """Полный сценарий вкладки сравнения: извлечение, группировка, таблица, инсайт."""
+    all_items = [item for items in extract_items_from_files(files) for item in items]
+    comparison = compare_items(all_items) if all_items else None
+    return {"items": len(all_items), "groups": len(comparison["df"]) if comparison else 0}
+
+
+def run_reanalysis(files: list, file_results: dict, previous_grouping: dict) -> dict:
+    """Повторное сравнение в той же сессии: извлекаются только новые файлы, группировка достраивается."""
+    all_items = [item for items in extract_new_items(files, file_results) for item in items]
+    comparison = compare_items(all_items, previous_grouping) if all_items else None
+    return {"items": len(all_items), "groups": len(comparison["df"]) if comparison else 0}
+
+
+def run_market_search(item_names: list) -> dict:
+    """Сценарий пакетного сравнения с рынком: медиана цены для каждого наименования."""
+    prices = search_market_prices(item_names)
+    return {"items": len(item_names), "priced": sum(price is not None for price in prices.values())}
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса (и завершенных дочерних процессов пула PDF), МБ."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1 if sys.platform == "darwin" else 1024  # На Linux ru_maxrss в КБ, на macOS в байтах
+    return round(max(own, children) * scale / 1024 / 1024, 1)
+
+
+def stage_latencies() -> dict:
+    """p50/p95 длительности каждого этапа текущего запуска, мс."""
+    durations = {}
+    for span in recorder.spans():
+        durations.setdefault(span.stage, []).append(span.duration * 1000)
+    return {stage: {"calls": len(values),
+                    "p50_ms": round(float(np.percentile(values, 50)), 2),
+                    "p95_ms": round(float(np.percentile(values, 95)), 2)}
+            for stage, values in sorted(durations.items())}
+
+
+def measure(name: str, run, files_count: int, fake_model) -> dict:
+    recorder.start_run()
+    token_usage.reset()
+    calls_before = getattr(fake_model, "calls", 0)
+    start = time.perf_counter()
+    details = run()
+    elapsed = time.perf_counter() - start
+    usage = token_usage.snapshot()
+    result = {
+        "scenario": name,
+        "files": files_count,
+        "seconds": round(elapsed, 3),
+        "files_per_sec": round(files_count / elapsed, 2) if files_count and elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "input_tokens": sum(stats["input_tokens"] for stats in usage.values()),
+        "output_tokens": sum(stats["output_tokens"] for stats in usage.values()),
+        "llm_calls": getattr(fake_model, "calls", 0) - calls_before,
+        "stages": stage_latencies(),
+        **details,
+    }
+    print(f"{name}: {result['seconds']} с, {result['files_per_sec']} файлов/с, RSS {result['peak_rss_mb']} МБ, "
+          f"токены {result['input_tokens']}/{result['output_tokens']}, вызовов LLM {result['llm_calls']}")
+    return result
+
+
+def measure_startup(runs: int) -> dict:
+    """Медианы времени старта приложения по нескольким запускам в отдельных процессах."""
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], capture_output=True, text=True,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    result = {"scenario": "app_startup", "runs": runs,
+              "exception": any(sample["exception"] for sample in samples)}
+    for metric in ("cold_start_s", "rerun_s", "pipeline_import_s"):
+        result[metric] = round(float(np.median([sample[metric] for sample in samples])), 3)
+    print(f"app_startup: холодный старт {result['cold_start_s']} с, повторный прогон {result['rerun_s']} с, "
+          f"импорт конвейера {result['pipeline_import_s']} с")
+    return result
+
+
+def compare_with_baseline(results: list, baseline: dict) -> list:
+    """Список регрессий относительно эталона (ухудшение больше REGRESSION_TOLERANCE)."""
+    baseline_by_name = {result["scenario"]: result for result in baseline.get("scenarios", [])}
+    regressions = []
+    for result in results:
+        base = baseline_by_name.get(result["scenario"])
+        if not base:
+            continue
+        for metric in HIGHER_IS_BETTER | LOWER_IS_BETTER:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (metric in HIGHER_IS_BETTER and change < -REGRESSION_TOLERANCE) or \
+               (metric in LOWER_IS_BETTER and change > REGRESSION_TOLERANCE):
+                regressions.append(f"{result['scenario']}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк конвейера Тендер-Эксперт")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Задержка ответа заглушки модели, с")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Задержка ответа заглушки поиска, с")
+    parser.add_argument("--search-items", type=int, default=5, help="Сколько наименований искать по рынку")
+    parser.add_argument("--startup-runs", type=int, default=3, help="Сколько раз замерять старт приложения (0 — не замерять)")
+    parser.add_argument("--replay", help="Файл записанных ответов (JSON lines)")
+    parser.add_argument("--record", help="Записать настоящие ответы API в файл (нужны ключи)")
+    parser.add_argument("--output", help="Куда сохранить результаты (JSON)")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE, help="Сохранить результаты как эталон")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="Сравнить с эталоном")
+    args = parser.parse_args(argv)
+
+    fake_model = install_fakes(args.llm_latency, args.search_latency, args.replay, args.record)
+    scenarios = [("demo_files", demo_files)]
+    scenarios += [(name, lambda count=count, row_range=row_range: synthetic_files(count, row_range))
+                  for name, count, row_range in PROFILES[args.profile]]
+
+    results = [measure_startup(args.startup_runs)] if args.startup_runs else []
+    for name, make_files in scenarios:
+        files = make_files()
+        if files:
+            results.append(measure(name, lambda: run_compare(files), len(files), fake_model))
+    # Последний поставщик присылает КП уже после первого сравнения: замеряем только повторный анализ
+    count, row_range = LATE_SUPPLIER
+    files, file_results = synthetic_files(count, row_range), {}
+    late_rows = synthetic_rows(row_range[1] // 2, count, random.Random(count))  # Позиции, которые уже есть у других
+    files.append({"name": "Поставщик поздний.xlsx", "data": make_xlsx(late_rows)})
+    first_items = [item for items in extract_new_items(files[:-1], file_results) for item in items]
+    grouping = compare_items(first_items)["grouping"]
+    results.append(measure("late_supplier", lambda: run_reanalysis(files, file_results, grouping), 1, fake_model))
+
+    item_names = [f"{base} {10 + i}" for i, (base, _, _) in enumerate(CATALOGUE[:args.search_items])]
+    results.append(measure("market_search", lambda: run_market_search(item_names), 0, fake_model))
+
+    report = {
+        "profile": args.profile,
+        "llm_latency": args.llm_latency,
+        "search_latency": args.search_latency,
+        "python": sys.version.split()[0],
+        "scenarios": results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare_with_baseline(results, json.load(f))
+        for regression in regressions:
+            print(f"РЕГРЕССИЯ: {regression}")
+        if regressions:
+            return 1
+        print("Регрессий относительно эталона нет.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,49 +1,330 @@
 # document_parser.py
 
 import fitz  # PyMuPDF
-import docx
 import pandas as pd
 import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from prompt_serializer import rows_to_tsv
+from instrumentation import span
+from ocr import needs_ocr, ocr_pdf_pages
 
-# НОВАЯ СИГНАТУРА ФУНКЦИИ!
-def get_text_from_file(file_stream: io.BytesIO, filename: str) -> str:
-    """Извлекает текст из потока байтов файла (PDF, DOCX, XLSX)."""
+# Ограничения, чтобы огромное вложение не "подвесило" обработчик Streamlit
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "300"))
+PDF_TIMEOUT_SECONDS = float(os.getenv("PDF_TIMEOUT_SECONDS", "60"))
+# С какого числа страниц имеет смысл распределять PDF по процессам
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "80"))
+PDF_MAX_PROCESSES = int(os.getenv("PDF_MAX_PROCESSES", str(os.cpu_count() or 1)))
+# Выделять таблицы PDF через PyMuPDF find_tables (медленнее, но промпт получается намного компактнее)
+PDF_TABLES = os.getenv("PDF_TABLES", "1") != "0"
+
+# find_tables в PyMuPDF хранит текстовый слой страницы в глобальной переменной модуля,
+# поэтому из нескольких потоков (параллельная обработка файлов) таблицы ищем по очереди
+_find_tables_lock = threading.Lock()
+
+# Служебные строки КП, которые не содержат товарных позиций: реквизиты и контакты (только со значением),
+# подписи, отметка "М.П." отдельной строкой, колонтитулы
+BOILERPLATE_LINE = re.compile(
+    r"\b(ИНН|КПП|ОГРНИП|ОГРН|БИК|ОКПО|ОКВЭД|р/с|к/с|р/сч|корр?\.?\s*сч[её]т|расч[её]тный\s+сч[её]т)[\s.:№]*\d"
+    r"|\b(тел\.?|телефон|факс)[\s.:/]*[+(]?\d"
+    r"|\b(e-?mail|www\.|https?://|с\s+уважением|генеральный\s+директор)(\W|$)"
+    r"|^\s*М\.\s?П\.?\s*$"
+    r"|^\s*(стр\.?|страница)\s*\d+(\s*(из|/)\s*\d+)?\s*$",
+    re.IGNORECASE,
+)
+# Цена или количество с единицей ("850 руб.", "120 м.п.", "2 шт"): такая строка — товарная, даже если
+# в ней встретилось слово из BOILERPLATE_LINE ("Телефон Panasonic KX-TS2350 2 шт 3500 руб.")
+ITEM_VALUE = re.compile(
+    r"\d\s*(шт|руб|р\.|₽|коп|компл|к-т|упак|уп\.|рул|пог|кг|тн?|м\.\s?п|м[²³23]?|л)(?![^\W\d_])",
+    re.IGNORECASE,
+)
+# Строка, повторяющаяся на такой доле страниц, считается колонтитулом
+REPEATED_LINE_SHARE = 0.6
+# Колонтитулы ищем только среди первых и последних строк страницы
+REPEATED_LINE_EDGE = 3
+# Короткие и числовые строки ("10", "шт", "25.00 руб.") повторяются в данных, колонтитулом их не считаем
+REPEATED_LINE_MIN_CHARS = 8
+NUMERIC_LINE = re.compile(r"[\d\s.,%/+\-]+(\s*[^\W\d]{1,4}\.?)?")
+
+
+@dataclass
+class DocumentTable:
+    """Таблица документа: откуда она (лист/страница) и строки как списки текстов ячеек."""
+    source: str
+    rows: list
+
+
+@dataclass
+class ParsedDocument:
+    """Результат разбора документа: таблицы отдельно, остальной (очищенный) текст отдельно."""
+    filename: str
+    tables: list = field(default_factory=list)
+    text: str = ""
+    dropped_lines: int = 0  # Сколько служебных строк отброшено
+    pages: int = 0
+
+    def to_prompt_text(self) -> str:
+        """Компактное текстовое представление для LLM: текст, затем таблицы в TSV."""
+        parts = [self.text.strip()] if self.text.strip() else []
+        for i, table in enumerate(self.tables, 1):
+            parts.append(f"--- Таблица {i} ({table.source}) ---\n{rows_to_tsv(table.rows)}")
+        return "\n".join(parts)
+
+
+def _cell_text(value) -> str:
+    """Текст ячейки одной строкой; 1500.0 -> "1500", пустые значения -> ""."""
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    # Переносы внутри ячейки: "6205-\n2RS" -> "6205-2RS", "Наименование\nпродукции" -> "Наименование продукции"
+    return re.sub(r"\s+", " ", str(value).replace("-\n", "-")).strip()
+
+
+def _edge_lines(lines: list) -> list:
+    """Строки у верхнего и нижнего края страницы, которые могут быть колонтитулом."""
+    edge = lines[:REPEATED_LINE_EDGE] + lines[-REPEATED_LINE_EDGE:]
+    return [line for line in edge if len(line) >= REPEATED_LINE_MIN_CHARS and not NUMERIC_LINE.fullmatch(line)]
+
+
+def _filter_boilerplate(pages: list):
+    """
+    Убирает из текста страниц реквизиты/подписи и колонтитулы (строки у края страницы, повторяющиеся
+    на большинстве страниц). pages — список (номер страницы, текст).
+    Возвращает (текст с маркерами страниц, число удаленных строк).
+    """
+    page_lines = [(page_num, [line.strip() for line in text.splitlines() if line.strip()]) for page_num, text in pages]
+    repeated = set()
+    if len(page_lines) >= 3:
+        counts = Counter(line for _, lines in page_lines for line in set(_edge_lines(lines)))
+        repeated = {line for line, count in counts.items() if count >= REPEATED_LINE_SHARE * len(page_lines)}
+
+    parts, dropped = [], 0
+    for page_num, lines in page_lines:
+        kept = [line for i, line in enumerate(lines)
+                if not (line in repeated and (i < REPEATED_LINE_EDGE or i >= len(lines) - REPEATED_LINE_EDGE))
+                and not (BOILERPLATE_LINE.search(line) and not ITEM_VALUE.search(line))]
+        dropped += len(lines) - len(kept)
+        if kept:
+            parts.append(f"--- Страница {page_num} ---\n" + "\n".join(kept))
+    return "\n".join(parts), dropped
+
+
+def _page_text(page) -> str:
+    """Обработчик страницы по умолчанию: весь текстовый слой."""
+    return page.get_text()
+
+
+def _page_structure(page) -> tuple:
+    """Обработчик страницы для табличного режима: (текст вне таблиц, список таблиц-строк)."""
+    with _find_tables_lock:
+        tables = page.find_tables().tables
+        table_rows = [[[_cell_text(cell) for cell in row] for row in table.extract()] for table in tables]
+    table_rects = [fitz.Rect(table.bbox) for table in tables]
+    residual = [
+        block[4] for block in page.get_text("blocks")
+        if not any(fitz.Rect(block[:4]).intersects(rect) for rect in table_rects)
+    ]
+    return "".join(residual), table_rows
+
+
+def iter_pdf_pages(file_stream: io.BytesIO, max_pages: int = PDF_MAX_PAGES, timeout: float = PDF_TIMEOUT_SECONDS,
+                   page_handler=_page_text):
+    """
+    Генератор страниц PDF: отдает пары (номер страницы с 1, результат page_handler) по одной,
+    не собирая весь документ. По умолчанию результат — текст страницы.
+    """
+    deadline = time.monotonic() + timeout
+    with fitz.open(stream=file_stream, filetype="pdf") as pdf_document:
+        page_count = len(pdf_document)
+        if page_count > max_pages:
+            print(f"PDF содержит {page_count} стр., обрабатываем только первые {max_pages}")
+        for page_num in range(min(page_count, max_pages)):
+            if time.monotonic() > deadline:
+                print(f"Превышено время обработки PDF ({timeout} с), остановились на странице {page_num}")
+                return
+            yield page_num + 1, page_handler(pdf_document.load_page(page_num))
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int, page_handler=_page_text) -> list:
+    """Работает в отдельном процессе: открывает свою копию документа и обрабатывает страницы [start, stop)."""
+    with fitz.open(pdf_path) as pdf_document:
+        return [(page_num + 1, page_handler(pdf_document.load_page(page_num))) for page_num in range(start, stop)]
+
+
+def iter_pdf_pages_parallel(file_stream: io.BytesIO, max_pages: int = PDF_MAX_PAGES,
+                            timeout: float = PDF_TIMEOUT_SECONDS, processes: int = PDF_MAX_PROCESSES,
+                            page_handler=_page_text):
+    """
+    То же, что iter_pdf_pages, но диапазоны страниц обрабатываются в пуле процессов.
+    Страницы отдаются строго по порядку, по мере готовности очередного диапазона.
+    """
+    deadline = time.monotonic() + timeout
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        # Воркерам передаем путь к файлу, а не байты, чтобы не копировать документ в каждый процесс
+        tmp.write(file_stream.getbuffer() if isinstance(file_stream, io.BytesIO) else file_stream.read())
+        tmp.flush()
+        with fitz.open(tmp.name) as pdf_document:
+            page_count = min(len(pdf_document), max_pages)
+        ranges_count = max(1, processes * 2)
+        step = max(1, -(-page_count // ranges_count))
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+        # spawn: документ может разбираться из рабочего потока, а fork из многопоточного процесса небезопасен.
+        # multiprocessing.Pool, а не ProcessPoolExecutor: по таймауту воркеры нужно остановить (terminate)
+        # до удаления временного файла, который они читают
+        pool = multiprocessing.get_context("spawn").Pool(min(processes, len(ranges)) or 1)
+        try:
+            async_results = [pool.apply_async(_extract_page_range, (tmp.name, start, stop, page_handler))
+                             for start, stop in ranges]
+            for async_result in async_results:
+                try:
+                    pages = async_result.get(timeout=max(0.0, deadline - time.monotonic()))
+                except multiprocessing.TimeoutError:
+                    print(f"Превышено время обработки PDF ({timeout} с), часть страниц пропущена")
+                    return
+                yield from pages
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+def _iter_pdf(file_stream, parallel: bool, max_pages: int, timeout: float, page_handler):
+    """Выбирает последовательный или параллельный обход страниц. parallel=None — по числу страниц."""
+    if not isinstance(file_stream, io.BytesIO):
+        file_stream = io.BytesIO(file_stream.read())
+    if parallel is None:
+        with fitz.open(stream=file_stream, filetype="pdf") as pdf_document:
+            parallel = len(pdf_document) >= PDF_PARALLEL_MIN_PAGES and PDF_MAX_PROCESSES > 1
+        file_stream.seek(0)
+    iterator = iter_pdf_pages_parallel if parallel else iter_pdf_pages
+    return iterator(file_stream, max_pages=max_pages, timeout=timeout, page_handler=page_handler)
+
+
+def _add_ocr_text(file_stream: io.BytesIO, pages: list, skip: set = frozenset()) -> list:
+    """
+    Подставляет распознанный текст вместо пустого текстового слоя (сканы).
+    pages — список (номер страницы, текст); skip — страницы, где уже найдены таблицы.
+    У документов с текстовым слоем проверка сводится к длине уже извлеченного текста.
+    """
+    scanned = [page_num for page_num, text in pages if page_num not in skip and needs_ocr(text)]
+    if not scanned:
+        return pages
+    recognized = ocr_pdf_pages(file_stream.getvalue(), scanned)
+    return [(page_num, recognized.get(page_num, text)) for page_num, text in pages]
+
+
+def get_pdf_text(file_stream: io.BytesIO, parallel: bool = None, max_pages: int = PDF_MAX_PAGES,
+                 timeout: float = PDF_TIMEOUT_SECONDS) -> str:
+    """
+    Собирает текст PDF из постраничного генератора с маркерами страниц.
+    parallel=None — пул процессов включается автоматически для документов от PDF_PARALLEL_MIN_PAGES страниц.
+    Страницы без текстового слоя распознаются через OCR (см. ocr.py).
+    """
+    if not isinstance(file_stream, io.BytesIO):
+        file_stream = io.BytesIO(file_stream.read())
+    pages = _add_ocr_text(file_stream, list(_iter_pdf(file_stream, parallel, max_pages, timeout, _page_text)))
+    # Маркер страницы нужен, чтобы большие документы можно было делить по границам страниц
+    return "".join(f"--- Страница {page_num} ---\n{page_text}" for page_num, page_text in pages)
+
+
+def parse_pdf(file_stream: io.BytesIO, filename: str, parallel: bool = None, max_pages: int = PDF_MAX_PAGES,
+              timeout: float = PDF_TIMEOUT_SECONDS) -> ParsedDocument:
+    """
+    Табличный разбор PDF: таблицы через find_tables, остальной текст — без реквизитов и колонтитулов.
+    Страницы без текстового слоя распознаются через OCR (см. ocr.py).
+    """
+    if not isinstance(file_stream, io.BytesIO):
+        file_stream = io.BytesIO(file_stream.read())
+    pages, tables, table_pages = [], [], set()
+    for page_num, (page_text, page_tables) in _iter_pdf(file_stream, parallel, max_pages, timeout, _page_structure):
+        pages.append((page_num, page_text))
+        page_tables = [rows for rows in page_tables if rows]
+        if page_tables:
+            table_pages.add(page_num)
+        tables.extend(DocumentTable(source=f"стр. {page_num}", rows=rows) for rows in page_tables)
+    pages = _add_ocr_text(file_stream, pages, table_pages)
+    text, dropped = _filter_boilerplate(pages)
+    return ParsedDocument(filename=filename, tables=tables, text=text, dropped_lines=dropped, pages=len(pages))
+
+
+def parse_document(file_stream: io.BytesIO, filename: str) -> ParsedDocument:
+    """Разбирает файл (PDF, DOCX, XLSX) в структуру: таблицы + остальной текст."""
+    with span("parse", file=filename) as parse_span:
+        if isinstance(file_stream, io.BytesIO):
+            parse_span.bytes_in = file_stream.getbuffer().nbytes
+        document = _parse_document(file_stream, filename)
+        parse_span.pages = document.pages
+        parse_span.attributes["tables"] = len(document.tables)
+        return document
+
+
+def _parse_document(file_stream: io.BytesIO, filename: str) -> ParsedDocument:
     file_extension = filename.split('.')[-1].lower()
     
     if file_extension == 'pdf':
         try:
-            # Открываем PDF из потока байтов
-            pdf_document = fitz.open(stream=file_stream.read(), filetype="pdf")
-            text = ""
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                text += page.get_text()
-            return text
+            if PDF_TABLES:
+                return parse_pdf(file_stream, filename)
+            return ParsedDocument(filename=filename, text=get_pdf_text(file_stream))
         except Exception as e:
             print(f"Ошибка чтения PDF: {e}")
-            return f"Ошибка при обработке PDF-файла: {filename}"
+            return ParsedDocument(filename=filename, text=f"Ошибка при обработке PDF-файла: {filename}")
 
     elif file_extension == 'docx':
         try:
+            import docx  # Нужен только для DOCX
+            from docx.table import Table
             # docx.Document может работать напрямую с потоком
             doc = docx.Document(file_stream)
-            return "\n".join([para.text for para in doc.paragraphs])
+            lines, tables = [], []
+            for block in doc.iter_inner_content():
+                if isinstance(block, Table):
+                    tables.append(DocumentTable(source=f"таблица {len(tables) + 1}", rows=_docx_table_rows(block)))
+                else:
+                    lines.append(block.text)
+            return ParsedDocument(filename=filename, tables=tables, text="\n".join(lines))
         except Exception as e:
             print(f"Ошибка чтения DOCX: {e}")
-            return f"Ошибка при обработке DOCX-файла: {filename}"
+            return ParsedDocument(filename=filename, text=f"Ошибка при обработке DOCX-файла: {filename}")
 
     elif file_extension in ['xlsx', 'xls']:
         try:
-            # pandas также может работать с потоком
-            df = pd.read_excel(file_stream, sheet_name=None)
-            full_text = ""
-            for sheet_name, sheet_df in df.items():
-                full_text += f"--- Лист: {sheet_name} ---\n"
-                full_text += sheet_df.to_string() + "\n\n"
-            return full_text
+            # pandas также может работать с потоком; header=None — заголовок таблицы ищем сами
+            sheets = pd.read_excel(file_stream, sheet_name=None, header=None)
+            tables = []
+            for sheet_name, sheet_df in sheets.items():
+                sheet_df = sheet_df.dropna(how="all").dropna(axis=1, how="all")
+                rows = [[_cell_text(value) for value in row] for row in sheet_df.itertuples(index=False)]
+                tables.append(DocumentTable(source=f"Лист: {sheet_name}", rows=rows))
+            return ParsedDocument(filename=filename, tables=tables, pages=len(tables))
         except Exception as e:
             print(f"Ошибка чтения XLSX: {e}")
-            return f"Ошибка при обработке Excel-файла: {filename}"
+            return ParsedDocument(filename=filename, text=f"Ошибка при обработке Excel-файла: {filename}")
 
     else:
-        return f"Формат файла .{file_extension} не поддерживается."
\ No newline at end of file
+        return ParsedDocument(filename=filename, text=f"Формат файла .{file_extension} не поддерживается.")
+
+
+def _docx_table_rows(table) -> list:
+    """Строки таблицы DOCX как списки текстов ячеек (объединенные ячейки не дублируются)."""
+    rows = []
+    for row in table.rows:
+        cells, previous = [], None
+        for cell in row.cells:
+            cells.append("" if cell._tc is previous else _cell_text(cell.text))
+            previous = cell._tc
+        rows.append(cells)
+    return rows
+
+
+# НОВАЯ СИГНАТУРА ФУНКЦИИ!
+def get_text_from_file(file_stream: io.BytesIO, filename: str) -> str:
+    """Извлекает текст из потока байтов файла (PDF, DOCX, XLSX)."""
+    return parse_document(file_stream, filename).to_prompt_text()
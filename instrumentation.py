@@ -0,0 +1,201 @@
+# instrumentation.py
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+
+# Куда выгружать метрики (JSON lines и файл для Prometheus); пусто — не выгружать
+INSTRUMENTATION_DIR = os.getenv("INSTRUMENTATION_DIR", "")
+
+# Сколько последних запусков (сессий, тендеров пакетного режима) хранить в памяти
+RECORDER_MAX_RUNS = int(os.getenv("RECORDER_MAX_RUNS", "64"))
+
+# Счетчики, которые суммируются по этапам
+COUNTERS = ("bytes_in", "pages", "input_tokens", "output_tokens", "retries", "cache_hits")
+
+
+@dataclass
+class Span:
+    """Замер одного этапа: время выполнения и счетчики (байты, страницы, токены, повторы, попадания в кэш)."""
+    stage: str
+    run_id: str
+    started_at: float
+    duration: float = 0.0
+    bytes_in: int = 0
+    pages: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    retries: int = 0
+    cache_hits: int = 0
+    error: str = None
+    attributes: dict = field(default_factory=dict)
+
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+# Запуск, к которому относятся замеры текущего контекста (своя сессия Streamlit, свой тендер пакетного режима)
+_current_run = contextvars.ContextVar("current_run", default=None)
+
+
+class Recorder:
+    """
+    Хранит замеры запусков (для панели диагностики) и накопительные итоги за время жизни процесса
+    (для Prometheus). Общий на процесс и потокобезопасный; замеры разных запусков хранятся раздельно,
+    а текущий запуск определяется контекстом (contextvars), поэтому сессии не затирают замеры друг друга.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._default_run = uuid.uuid4().hex[:12]  # Для замеров вне start_run (например, в бенчмарке до запуска)
+        self._runs = OrderedDict()  # run_id -> список замеров
+        self._totals = {}
+
+    @property
+    def run_id(self) -> str:
+        """Запуск текущего контекста."""
+        return _current_run.get() or self._default_run
+
+    def start_run(self) -> str:
+        """
+        Начинает новый запуск в текущем контексте: замеры предыдущего запуска этого контекста сбрасываются,
+        замеры других сессий и накопительные итоги — нет. Возвращает идентификатор запуска.
+        """
+        run_id = uuid.uuid4().hex[:12]
+        previous = _current_run.get()
+        _current_run.set(run_id)
+        with self._lock:
+            self._runs.pop(previous, None)
+            self._runs[run_id] = []
+            while len(self._runs) > RECORDER_MAX_RUNS:
+                self._runs.popitem(last=False)
+        return run_id
+
+    def use_run(self, run_id: str):
+        """Делает текущим уже начатый запуск (например, сохраненный в состоянии сессии Streamlit при rerun)."""
+        _current_run.set(run_id)
+
+    def add(self, span: Span):
+        with self._lock:
+            self._runs.setdefault(span.run_id, []).append(span)
+            totals = self._totals.setdefault(span.stage, {"calls": 0, "errors": 0, "duration": 0.0, **dict.fromkeys(COUNTERS, 0)})
+            totals["calls"] += 1
+            totals["errors"] += span.error is not None
+            totals["duration"] += span.duration
+            for name in COUNTERS:
+                totals[name] += getattr(span, name)
+
+    def spans(self, run_id: str = None) -> list:
+        """Замеры запуска run_id (по умолчанию — текущего)."""
+        with self._lock:
+            return list(self._runs.get(run_id or self.run_id, []))
+
+    def summary(self, run_id: str = None) -> list:
+        """Разбивка запуска по этапам: число вызовов, суммарное и максимальное время, счетчики."""
+        stages = {}
+        for span in self.spans(run_id):
+            row = stages.setdefault(span.stage, {"stage": span.stage, "calls": 0, "total_s": 0.0, "max_s": 0.0,
+                                                 **dict.fromkeys(COUNTERS, 0)})
+            row["calls"] += 1
+            row["total_s"] += span.duration
+            row["max_s"] = max(row["max_s"], span.duration)
+            for name in COUNTERS:
+                row[name] += getattr(span, name)
+        return sorted(stages.values(), key=lambda row: row["total_s"], reverse=True)
+
+    def export_jsonl(self, path: str):
+        """Дописывает замеры текущего запуска в файл JSON lines (одна строка — один этап)."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for span in self.spans():
+                f.write(json.dumps(asdict(span), ensure_ascii=False, default=str) + "\n")
+
+    def export_prometheus(self, path: str):
+        """Записывает накопительные итоги в текстовом формате Prometheus (для node_exporter textfile collector)."""
+        with self._lock:
+            totals = {stage: dict(values) for stage, values in self._totals.items()}
+        metrics = [("tender_stage_calls_total", "calls", "Число выполнений этапа"),
+                   ("tender_stage_errors_total", "errors", "Число выполнений этапа с ошибкой"),
+                   ("tender_stage_duration_seconds_total", "duration", "Суммарное время этапа, с")]
+        metrics += [(f"tender_stage_{name}_total", name, f"Сумма счетчика {name} по этапу") for name in COUNTERS]
+        lines = []
+        for metric, key, help_text in metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for stage in sorted(totals):
+                lines.append(f'{metric}{{stage="{stage}"}} {totals[stage][key]}')
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def export(self, directory: str = None):
+        """Выгружает метрики в INSTRUMENTATION_DIR (если задан)."""
+        directory = directory or INSTRUMENTATION_DIR
+        if not directory:
+            return
+        try:
+            self.export_jsonl(os.path.join(directory, "spans.jsonl"))
+            self.export_prometheus(os.path.join(directory, "tender_expert.prom"))
+        except OSError as e:
+            print(f"Не удалось выгрузить метрики: {e}")
+
+
+recorder = Recorder()
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor, задачи которого выполняются в контексте отправившего их потока: замеры из рабочих
+    потоков попадают в запуск той сессии, которая их запустила. Текущий этап не наследуется — как и раньше,
+    каждый этап в рабочем потоке замеряется отдельно.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        context.run(_current_span.set, None)
+        return super().submit(context.run, fn, *args, **kwargs)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Контекстный менеджер замера этапа. Внутри можно увеличивать счетчики: s.pages += 1 или add_to_current_span()."""
+    current = Span(stage=stage, run_id=recorder.run_id, started_at=time.time(), attributes=attributes)
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = repr(e)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _current_span.reset(token)
+        recorder.add(current)
+
+
+def traced(stage: str):
+    """Декоратор: замеряет каждый вызов функции как этап stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_to_current_span(**counters):
+    """Увеличивает счетчики текущего этапа (если замер идет в этом потоке)."""
+    current = _current_span.get()
+    if current is None:
+        return
+    for name, value in counters.items():
+        setattr(current, name, getattr(current, name) + value)
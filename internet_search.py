@@ -1,23 +1,186 @@
 # internet_search.py
 
 import os
-from googleapiclient.discovery import build
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from instrumentation import traced, add_to_current_span
+from rate_limit import RateLimiter
 
-def google_search(query: str, num_results=10) -> list:
-    """Выполняет поиск в Google и возвращает список результатов."""
-    try:
-        api_key = os.getenv("SEARCH_API_KEY")
-        search_engine_id = os.getenv("SEARCH_ENGINE_ID")
-        
-        service = build("customsearch", "v1", developerKey=api_key)
-        
+# Ключи и квоты читаются при импорте модуля, поэтому .env загружаем здесь, не полагаясь на порядок импортов
+load_dotenv()
+
+# Сколько секунд хранить результаты одного и того же запроса (цены на рынке меняются, поэтому кэш в памяти и недолгий)
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(6 * 3600)))
+# Квоты Custom Search считаются по ключу API: частота и суточный лимит на каждый ключ
+SEARCH_REQUESTS_PER_MINUTE = int(os.getenv("SEARCH_REQUESTS_PER_MINUTE", "60"))
+SEARCH_DAILY_QUOTA = int(os.getenv("SEARCH_DAILY_QUOTA", "100"))
+# Сколько клиентов Custom Search держать на ключ (столько запросов по ключу может выполняться одновременно)
+SEARCH_CLIENTS_PER_KEY = int(os.getenv("SEARCH_CLIENTS_PER_KEY", "4"))
+
+
+class ClientPool:
+    """
+    Клиенты Custom Search одного ключа, общие для всех потоков процесса. Клиент googleapiclient (httplib2)
+    не потокобезопасен, поэтому каждый клиент в один момент времени использует только один поток;
+    клиенты создаются по мере надобности (не больше size) и потом переиспользуются.
+    """
+
+    def __init__(self, api_key: str, size: int):
+        self.api_key = api_key
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    @contextmanager
+    def client(self):
+        """Выдает свободный клиент на время запроса."""
+        try:
+            service = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    service = _build_service(self.api_key)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                service = self._idle.get()  # Все клиенты заняты — ждем освободившийся
+        try:
+            yield service
+        finally:
+            self._idle.put(service)
+
+
+class KeyQuota:
+    """Лимиты одного ключа API: не чаще N запросов в минуту и не больше daily_quota запросов в сутки."""
+
+    def __init__(self, api_key: str, requests_per_minute: int, daily_quota: int):
+        self.api_key = api_key
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.clients = ClientPool(api_key, SEARCH_CLIENTS_PER_KEY)
+        self.daily_quota = daily_quota
+        self._lock = threading.Lock()
+        self._day = None
+        self._used = 0
+
+    def try_reserve(self) -> bool:
+        """Резервирует запрос из суточной квоты; False, если квота на сегодня исчерпана."""
+        with self._lock:
+            today = time.strftime("%Y-%m-%d")
+            if today != self._day:
+                self._day, self._used = today, 0
+            if self.daily_quota and self._used >= self.daily_quota:
+                return False
+            self._used += 1
+            return True
+
+
+class SearchCache:
+    """Кэш результатов поиска в памяти с ограниченным временем жизни записи."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() > expires_at:
+                del self._entries[key]
+                return None
+        add_to_current_span(cache_hits=1)
+        return value
+
+    def set(self, key, value):
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+search_cache = SearchCache(SEARCH_CACHE_TTL_SECONDS)
+# Несколько ключей можно перечислить через запятую — запросы распределяются по ключам с оставшейся квотой
+_key_quotas = [KeyQuota(key.strip(), SEARCH_REQUESTS_PER_MINUTE, SEARCH_DAILY_QUOTA)
+               for key in os.getenv("SEARCH_API_KEY", "").split(",") if key.strip()]
+_key_cursor = 0
+_key_lock = threading.Lock()
+
+
+def _next_key_quota():
+    """Следующий по кругу ключ, у которого осталась суточная квота, или None."""
+    global _key_cursor
+    with _key_lock:
+        start = _key_cursor
+        _key_cursor = (_key_cursor + 1) % max(len(_key_quotas), 1)
+    for i in range(len(_key_quotas)):
+        quota = _key_quotas[(start + i) % len(_key_quotas)]
+        if quota.try_reserve():
+            return quota
+    return None
+
+
+def _build_service(api_key: str):
+    """Клиент Custom Search; строится один раз на клиент пула, а не на каждый запрос."""
+    from googleapiclient.discovery import build  # Импортируется долго, а нужен только при первом поиске
+    return build("customsearch", "v1", developerKey=api_key, cache_discovery=False)
+
+
+def google_backend(query: str, num_results: int) -> list:
+    """Запрос к Google Custom Search с учетом квот ключей."""
+    quota = _next_key_quota()
+    if quota is None:
+        print("Квота поисковых запросов исчерпана (или не задан SEARCH_API_KEY)")
+        return []
+    quota.rate_limiter.acquire()
+    with quota.clients.client() as service:
         res = service.cse().list(
             q=query,
-            cx=search_engine_id,
+            cx=os.getenv("SEARCH_ENGINE_ID"),
             num=num_results
         ).execute()
-        
-        return res.get('items', [])
+    return res.get('items', [])
+
+
+# Источник результатов поиска: функция (query, num_results) -> список результатов в формате Custom Search.
+# Для тестов и бенчмарков заменяется локальной заглушкой через set_search_backend.
+search_backend = google_backend
+
+
+def set_search_backend(backend):
+    """Заменяет источник результатов поиска (None — вернуть Google) и сбрасывает кэш."""
+    global search_backend
+    search_backend = backend or google_backend
+    search_cache.clear()
+
+
+@traced("google_search")
+def google_search(query: str, num_results=10) -> list:
+    """Выполняет поиск в Google и возвращает список результатов."""
+    cache_key = (query, num_results)
+    cached_results = search_cache.get(cache_key)
+    if cached_results is not None:
+        return cached_results
+    try:
+        results = search_backend(query, num_results)
     except Exception as e:
         print(f"Ошибка при поиске в Google: {e}")
-        return []
\ No newline at end of file
+        return []
+    if results: search_cache.set(cache_key, results)
+    return results
@@ -0,0 +1,381 @@
+# item_matching.py
+
+import re
+from collections import Counter
+
+# Похожие по написанию буквы кириллицы и латиницы
+CYRILLIC_LOOKALIKES = "авекмнорстухАВЕКМНОРСТУХ"
+LATIN_LOOKALIKES = "abekmhopctyxABEKMHOPCTYX"
+CYR_TO_LAT = str.maketrans(CYRILLIC_LOOKALIKES, LATIN_LOOKALIKES)
+LAT_TO_CYR = str.maketrans(LATIN_LOOKALIKES, CYRILLIC_LOOKALIKES)
+
+# Единицы измерения приводим к одному написанию; единицы количества из названия убираем
+UNIT_ALIASES = {
+    "mm": "мм", "cm": "см", "m": "м", "km": "км", "kg": "кг", "g": "г", "l": "л", "ml": "мл",
+    "w": "вт", "kw": "квт", "v": "в", "a": "а",
+    "метр": "м", "метров": "м", "литр": "л", "литров": "л",
+}
+QUANTITY_UNITS = {"шт", "штук", "штука", "pcs", "pc", "упак", "уп", "компл", "комплект", "ед"}
+STOP_WORDS = {"арт", "артикул", "код", "art", "марка", "тип", "модель"}
+
+UNIT_WORDS = sorted(set(UNIT_ALIASES) | set(UNIT_ALIASES.values()) | QUANTITY_UNITS, key=len, reverse=True)
+
+TOKEN_PATTERN = re.compile(r"[0-9A-Za-zА-Яа-яЁё]+(?:[-/.,][0-9A-Za-zА-Яа-яЁё]+)*")
+NUMBER_WITH_UNIT = re.compile(r"^(\d+(?:[.,]\d+)?)(" + "|".join(UNIT_WORDS) + r")$")
+DIMENSION = re.compile(r"^\d+(?:[.,]\d+)?(?:[xх×*]\d+(?:[.,]\d+)?)+$")
+HAS_DIGIT = re.compile(r"\d")
+HAS_CYRILLIC = re.compile(r"[А-Яа-я]")
+NOT_SKU_CHAR = re.compile(r"[^0-9A-Z]")
+
+# Размер порции неоднозначных позиций для одного запроса к LLM
+GROUP_BATCH_SIZE = 40
+
+
+def _normalize_token(token: str) -> list:
+    """Нормализует один токен: регистр, похожие буквы, единицы измерения."""
+    token = token.lower().replace("ё", "е")
+    match = NUMBER_WITH_UNIT.match(token)
+    if match:
+        # "10мм" -> "10 мм"
+        return _normalize_token(match.group(1)) + _normalize_token(match.group(2))
+    if HAS_DIGIT.search(token):
+        # Артикулы и размеры пишем латиницей: "6205-2рс" и "6205-2RS" совпадут
+        return [token.translate(CYR_TO_LAT).replace(",", ".")]
+    if HAS_CYRILLIC.search(token):
+        # Русские слова с "вкраплениями" латиницы: "пoдшипник" (латинская o)
+        token = token.translate(LAT_TO_CYR)
+    token = UNIT_ALIASES.get(token, token)
+    if token in QUANTITY_UNITS or token in STOP_WORDS:
+        return []
+    return [token]
+
+
+def normalize_tokens(name: str) -> list:
+    """Разбивает наименование на нормализованные токены."""
+    tokens = []
+    for raw in TOKEN_PATTERN.findall(name or ""):
+        tokens.extend(_normalize_token(raw))
+    return tokens
+
+
+def normalize_name(name: str) -> str:
+    """Ключ точного совпадения наименований: порядок слов не важен."""
+    return " ".join(sorted(set(normalize_tokens(name))))
+
+
+def normalize_sku(sku: str) -> str:
+    """Артикул без разделителей, латиницей, в верхнем регистре."""
+    return NOT_SKU_CHAR.sub("", str(sku or "").upper().translate(CYR_TO_LAT))
+
+
+def sku_base(sku: str) -> str:
+    """Основа артикула — часть до первого разделителя: "6205-2RS" -> "6205". Используется только для блокировки."""
+    return normalize_sku(re.split(r"[-/.,\s]", str(sku or "").strip(), maxsplit=1)[0])
+
+
+def extract_skus(text: str) -> list:
+    """
+    Находит в строке токены, похожие на артикул ("6205-2RS", "6205"): есть цифра, не меньше 4 значащих символов,
+    и это не число с единицей измерения ("10мм") и не размер ("3x2.5").
+    """
+    skus = []
+    for raw in TOKEN_PATTERN.findall(text or ""):
+        lowered = raw.lower()
+        if not HAS_DIGIT.search(raw) or NUMBER_WITH_UNIT.match(lowered) or DIMENSION.match(lowered):
+            continue
+        if len(normalize_sku(raw)) >= 4:
+            skus.append(raw)
+    return skus
+
+
+def _head_word(tokens: list) -> str:
+    """Первое значимое слово без цифр — обычно это тип товара ("подшипник", "болт")."""
+    for token in tokens:
+        if len(token) >= 3 and not HAS_DIGIT.search(token):
+            return token
+    return ""
+
+
+def match_keys(item: dict) -> tuple:
+    """
+    Ключи позиции для сопоставления: (точные ключи, ключи блокировки).
+    Точные — одинаковое наименование или полный артикул; по ним позиции объединяются без LLM.
+    Ключи блокировки (тип товара, основа артикула) только отбирают кандидатов для модели.
+    """
+    tokens = normalize_tokens(item.name)
+    name_skus = extract_skus(item.name)
+    explicit_sku = normalize_sku(item.sku)
+
+    # Чисто цифровой артикул из названия — слишком слабый признак, он идет только в блокировку
+    exact_keys = {("sku", sku) for sku in map(normalize_sku, name_skus) if len(sku) >= 5 and not sku.isdigit()}
+    if tokens:
+        exact_keys.add(("name", " ".join(sorted(set(tokens)))))
+    if len(explicit_sku) >= 3:
+        exact_keys.add(("sku", explicit_sku))
+
+    block_keys = {("sku_base", sku_base(raw)) for raw in name_skus}
+    if explicit_sku:
+        block_keys.add(("sku_base", sku_base(item.sku)))
+    head = _head_word(tokens)
+    if head:
+        block_keys.add(("head", head))
+    return exact_keys, block_keys
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int) -> int:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        # Корнем делаем меньший индекс, чтобы порядок групп был детерминированным
+        if rb < ra:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        return ra
+
+
+def pre_group_items(items: list) -> list:
+    """
+    Локальная группировка без LLM по инвертированному индексу.
+    Позиции объединяются, если совпадает нормализованное наименование или полный артикул
+    и при этом в группе не оказывается двух разных позиций одного поставщика.
+    Возвращает список кластеров {"item_ids": [...], "suppliers": set, "keys": set} в порядке первого появления.
+    """
+    uf = _UnionFind(len(items))
+    suppliers = [{item.supplier} for item in items]
+    index = {}  # ключ -> индекс первой позиции с этим ключом
+
+    def try_union(a: int, b: int):
+        ra, rb = uf.find(a), uf.find(b)
+        if ra == rb or suppliers[ra] & suppliers[rb]:
+            return
+        root = uf.union(ra, rb)
+        suppliers[root] = suppliers[ra] | suppliers[rb]
+
+    item_keys = []
+    for i, item in enumerate(items):
+        exact_keys, block_keys = match_keys(item)
+        item_keys.append(block_keys | exact_keys)
+        for key in exact_keys:
+            if key[1] in index.get(key[0], {}):
+                try_union(index[key[0]][key[1]], i)
+            else:
+                index.setdefault(key[0], {})[key[1]] = i
+
+    clusters = {}
+    for i in range(len(items)):
+        root = uf.find(i)
+        cluster = clusters.setdefault(root, {"item_ids": [], "suppliers": set(), "keys": set()})
+        cluster["item_ids"].append(i)
+        cluster["suppliers"].add(items[i].supplier)
+        cluster["keys"] |= item_keys[i]
+    return [clusters[root] for root in sorted(clusters)]
+
+
+def find_ambiguous_batches(clusters: list, all_suppliers: set, batch_size: int = GROUP_BATCH_SIZE,
+                           changed: set = None) -> list:
+    """
+    Отбирает кластеры, которые еще могут объединиться друг с другом, и делит их на небольшие порции для LLM.
+    Кластер "открыт", если в нем есть не все поставщики. Открытые кластеры связываются в блоки
+    по общему типу товара или основе артикула; блок имеет смысл отправлять модели,
+    только если в нем встречаются разные поставщики.
+    changed — индексы новых кластеров при повторной группировке: модели отправляются только блоки с ними.
+    Возвращает список порций — списков индексов кластеров.
+    """
+    open_ids = [i for i, c in enumerate(clusters) if c["suppliers"] != all_suppliers]
+    uf = _UnionFind(len(clusters))
+    first_by_key = {}
+    # При повторной группировке блоки строятся вокруг новых кластеров: прежние кластеры присоединяются к новым
+    # по общему ключу, но между собой не связываются — эти пары модель уже сравнивала
+    linking_ids = open_ids if changed is None else [i for i in open_ids if i in changed]
+    for i in linking_ids:
+        for key in clusters[i]["keys"]:
+            if key[0] in ("head", "sku_base"):
+                if key in first_by_key:
+                    uf.union(first_by_key[key], i)
+                else:
+                    first_by_key[key] = i
+    if changed is not None:
+        for i in open_ids:
+            if i in changed:
+                continue
+            for key in clusters[i]["keys"]:
+                if key in first_by_key:
+                    uf.union(first_by_key[key], i)
+
+    blocks = {}
+    for i in open_ids:
+        blocks.setdefault(uf.find(i), []).append(i)
+
+    batches, current = [], []
+    for root in sorted(blocks):
+        block = blocks[root]
+        block_suppliers = set().union(*(clusters[i]["suppliers"] for i in block))
+        if len(block) < 2 or len(block_suppliers) < 2:
+            continue
+        if changed is not None and not changed.intersection(block):
+            continue
+        # Большой блок делим на похожие части; маленькие блоки и части упаковываем вместе, не разрезая
+        for part in _split_block(clusters, block, batch_size):
+            if len(current) + len(part) > batch_size:
+                batches.append(current)
+                current = []
+            current.extend(part)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _fine_keys(cluster: dict) -> set:
+    """Признаки для деления большого блока: основа артикула и слова наименования с цифрами (размеры, модели)."""
+    keys = {key for key in cluster["keys"] if key[0] == "sku_base"}
+    for kind, value in cluster["keys"]:
+        if kind == "name":
+            keys |= {("token", token) for token in value.split() if HAS_DIGIT.search(token)}
+    return keys
+
+
+def _split_block(clusters: list, block: list, batch_size: int) -> list:
+    """
+    Делит блок больше batch_size на части, в которых кандидаты похожи друг на друга: сначала кластеры
+    связываются по общей основе артикула или слову с цифрами (признаки, общие для слишком многих кластеров
+    блока, не различают товары и пропускаются), затем слишком большие части сортируются по этим признакам
+    и режутся по порядку, чтобы похожие кандидаты оказались в одной порции.
+    """
+    if len(block) <= batch_size:
+        return [block]
+    fine_keys = {i: _fine_keys(clusters[i]) for i in block}
+    counts = Counter(key for keys in fine_keys.values() for key in keys)
+    uf = _UnionFind(len(clusters))
+    first_by_key = {}
+    for i in block:
+        for key in fine_keys[i]:
+            if counts[key] > batch_size:
+                continue
+            if key in first_by_key:
+                uf.union(first_by_key[key], i)
+            else:
+                first_by_key[key] = i
+    sub_blocks = {}
+    for i in block:
+        sub_blocks.setdefault(uf.find(i), []).append(i)
+
+    parts = []
+    for root in sorted(sub_blocks):
+        sub_block = sorted(sub_blocks[root], key=lambda i: sorted(fine_keys[i]))
+        parts += [sub_block[start:start + batch_size] for start in range(0, len(sub_block), batch_size)]
+    return parts
+
+
+def merge_clusters(clusters: list, merged_groups: list) -> list:
+    """
+    Объединяет кластеры по ответу модели или истории предложений. merged_groups — список ItemGroup (llm_rows).
+    Как и в pre_group_items, кластеры с общим поставщиком не объединяются (иначе одно предложение поставщика
+    затерло бы другое в сравнительной таблице): такой кластер остается отдельным.
+    Возвращает новый список кластеров; у объединенных кластеров сохраняется canonical_name от модели.
+    """
+    uf = _UnionFind(len(clusters))
+    suppliers = [set(cluster["suppliers"]) for cluster in clusters]
+    names = {}
+    for group in merged_groups:
+        ids = [i for i in group.ids if 0 <= i < len(clusters)]
+        for i in ids[1:]:
+            ra, rb = uf.find(ids[0]), uf.find(i)
+            if ra == rb or suppliers[ra] & suppliers[rb]:
+                continue
+            root = uf.union(ra, rb)
+            suppliers[root] = suppliers[ra] | suppliers[rb]
+        if ids and group.canonical_name:
+            names.setdefault(uf.find(ids[0]), group.canonical_name)
+
+    merged = {}
+    for i, cluster in enumerate(clusters):
+        root = uf.find(i)
+        target = merged.setdefault(root, {"item_ids": [], "suppliers": set(), "keys": set()})
+        target["item_ids"].extend(cluster["item_ids"])
+        target["suppliers"] |= cluster["suppliers"]
+        target["keys"] |= cluster["keys"]
+        if cluster.get("canonical_name"):
+            target.setdefault("canonical_name", cluster["canonical_name"])
+    for root, name in names.items():
+        merged[uf.find(root)]["canonical_name"] = name
+    result = [merged[root] for root in sorted(merged)]
+    for cluster in result:
+        cluster["item_ids"].sort()
+    return result
+
+
+def update_clusters(items: list, previous_items: list, previous_clusters: list) -> tuple:
+    """
+    Переносит прошлую группировку на новый набор позиций без повторного обращения к LLM.
+    Позиции, которые были в прошлом наборе, остаются в своих кластерах (вместе с каноничным именем от модели),
+    позиции удаленных или измененных файлов из кластеров убираются. Новые позиции присоединяются к кластерам
+    по точным ключам (наименование, артикул), как в pre_group_items, а без совпадения образуют новые кластеры.
+    Возвращает (кластеры, индексы новых кластеров — только их еще нужно сопоставить с помощью LLM).
+    """
+    # Позиции сравниваются как значения: одинаковые строки из неизмененного файла при повторном анализе совпадут
+    previous_cluster_of = {}
+    for cluster_id, cluster in enumerate(previous_clusters):
+        for i in cluster["item_ids"]:
+            previous_cluster_of.setdefault(previous_items[i], []).append(cluster_id)
+
+    clusters, cluster_of, new_ids = [], {}, []
+    for i, item in enumerate(items):
+        candidates = previous_cluster_of.get(item)
+        if not candidates:
+            new_ids.append(i)
+            continue
+        previous_id = candidates.pop(0)
+        if previous_id not in cluster_of:
+            cluster_of[previous_id] = len(clusters)
+            clusters.append({"item_ids": [], "suppliers": set(), "keys": set()})
+            if previous_clusters[previous_id].get("canonical_name"):
+                clusters[-1]["canonical_name"] = previous_clusters[previous_id]["canonical_name"]
+        clusters[cluster_of[previous_id]]["item_ids"].append(i)
+
+    index = {}  # точный ключ -> индекс кластера
+    for cluster_id, cluster in enumerate(clusters):
+        for i in cluster["item_ids"]:
+            exact_keys, block_keys = match_keys(items[i])
+            cluster["suppliers"].add(items[i].supplier)
+            cluster["keys"] |= exact_keys | block_keys
+            for key in exact_keys:
+                index.setdefault(key, cluster_id)
+
+    new_clusters = set()
+    for i in new_ids:
+        item = items[i]
+        exact_keys, block_keys = match_keys(item)
+        target = next((index[key] for key in exact_keys
+                       if key in index and item.supplier not in clusters[index[key]]["suppliers"]), None)
+        if target is None:
+            target = len(clusters)
+            clusters.append({"item_ids": [], "suppliers": set(), "keys": set()})
+            new_clusters.add(target)
+        cluster = clusters[target]
+        cluster["item_ids"].append(i)
+        cluster["suppliers"].add(item.supplier)
+        cluster["keys"] |= exact_keys | block_keys
+        for key in exact_keys:
+            index.setdefault(key, target)
+    return clusters, new_clusters
+
+
+def clusters_to_groups(items: list, clusters: list) -> list:
+    """Приводит кластеры к формату normalize_and_group_items: canonical_name + offers."""
+    groups = []
+    for cluster in clusters:
+        cluster_items = [items[i] for i in cluster["item_ids"]]
+        canonical_name = cluster.get("canonical_name") or cluster_items[0].name
+        offers = [{"supplier": item.supplier, "price_per_unit": item.price_per_unit} for item in cluster_items]
+        groups.append({"canonical_name": canonical_name, "offers": offers})
+    return groups
@@ -0,0 +1,104 @@
+# json_stream.py
+
+import json
+
+
+class JsonArrayStreamParser:
+    """
+    Инкрементальный разбор JSON-массива объектов, который модель отдает частями.
+    feed(text) возвращает объекты верхнего уровня массива, которые завершились в этом фрагменте.
+    Все до первой "[" (```json, пояснения модели) и после закрывающей "]" игнорируется.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._array_started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = None
+
+    @property
+    def done(self) -> bool:
+        """Массив закрыт — дальнейший текст не нужен."""
+        return self._done
+
+    def feed(self, text: str) -> list:
+        if self._done or not text:
+            return []
+        self._buffer += text
+        objects = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            ch = buffer[self._pos]
+            if not self._array_started:
+                if ch == "[":
+                    self._array_started = True
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = buffer[self._object_start:self._pos + 1]
+                    self._object_start = None
+                    try:
+                        objects.append(json.loads(raw))
+                    except json.JSONDecodeError:
+                        print(f"Пропущен некорректный объект в ответе модели: {raw[:200]}")
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                self._pos += 1
+                break
+            self._pos += 1
+
+        # Держим в буфере только незавершенный объект, чтобы память не росла с длиной ответа
+        keep_from = self._object_start if self._object_start is not None else self._pos
+        self._buffer = buffer[keep_from:]
+        self._pos -= keep_from
+        if self._object_start is not None:
+            self._object_start = 0
+        return objects
+
+
+def iter_json_array(text_chunks):
+    """
+    Генератор: по мере поступления фрагментов текста отдает завершенные объекты JSON-массива.
+    Поток дочитывается до конца (хвост после "]" просто игнорируется), чтобы источник мог завершиться штатно.
+    """
+    parser = JsonArrayStreamParser()
+    for text in text_chunks:
+        yield from parser.feed(text)
+
+
+def parse_json_array(text: str):
+    """
+    Разбирает ответ модели с JSON-массивом объектов, даже если он оборван или частично испорчен.
+    Возвращает (объекты, complete): все завершенные объекты и признак того, что массив был закрыт.
+    """
+    cleaned = (text or "").strip().replace("```json", "").replace("```", "")
+    try:
+        data = json.loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+    else:
+        if isinstance(data, dict):
+            data = [data]
+        if isinstance(data, list):
+            return [obj for obj in data if isinstance(obj, dict)], True
+    # Обрыв или мусор: достаем каждый завершенный объект верхнего уровня
+    parser = JsonArrayStreamParser()
+    objects = parser.feed(cleaned)
+    return objects, parser.done
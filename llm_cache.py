@@ -0,0 +1,160 @@
+# llm_cache.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from instrumentation import add_to_current_span
+
+
+class LLMCache:
+    """
+    Постоянный кэш результатов LLM на диске.
+    Ключ — хэш входных данных, версии промпта, имени модели и настроек генерации,
+    поэтому повторный анализ того же документа не требует обращения к API.
+    При превышении размера или возраста записи удаляются, начиная с давно не использованных (LRU).
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_age_seconds: float, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bytes = None  # Считаем лениво при первом обращении
+
+    @staticmethod
+    def make_key(namespace: str, prompt_version: int, model_name: str, generation_config: dict, payload) -> str:
+        """Строит ключ кэша. payload может быть строкой или любой JSON-сериализуемой структурой."""
+        if not isinstance(payload, str):
+            payload = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        header = json.dumps([namespace, prompt_version, model_name, generation_config], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(f"{header}\n{payload}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _iter_entries(self):
+        """Возвращает список (путь, размер, время последнего использования) всех записей."""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _ensure_size(self):
+        if self._bytes is None:
+            self._bytes = sum(size for _, size, _ in self._iter_entries())
+
+    def get(self, key: str):
+        """Возвращает сохраненное значение или None, если записи нет или она устарела."""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age_seconds:
+                self._remove(path)
+                raise FileNotFoundError
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # Отмечаем использование для LRU
+        except (FileNotFoundError, json.JSONDecodeError, OSError):
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        add_to_current_span(cache_hits=1)
+        return value
+
+    def set(self, key: str, value):
+        """Сохраняет значение и при необходимости вытесняет старые записи."""
+        if not self.enabled:
+            return
+        path = self._path(key)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # Атомарная запись, безопасно для параллельных потоков
+        except OSError as e:
+            print(f"Не удалось записать кэш LLM: {e}")
+            return
+        with self._lock:
+            self._ensure_size()
+            self._bytes += len(data) - old_size
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes -= size
+
+    def _evict(self):
+        """Удаляет устаревшие записи, затем самые давно использованные, пока размер не станет меньше 90% лимита."""
+        now = time.time()
+        entries = sorted(self._iter_entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, mtime in entries:
+            if total <= target and now - mtime <= self.max_age_seconds:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._bytes = total
+
+    def stats(self) -> dict:
+        """Статистика кэша: попадания, промахи, объем на диске и число записей."""
+        with self._lock:
+            self._ensure_size()
+            hits, misses, size = self._hits, self._misses, self._bytes
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "bytes": size,
+            "entries": len(self._iter_entries()),
+        }
+
+    def clear(self):
+        """Полностью очищает кэш."""
+        with self._lock:
+            for path, _, _ in self._iter_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._bytes = 0
+            self._hits = self._misses = 0
+
+
+llm_cache = LLMCache(
+    cache_dir=os.getenv("LLM_CACHE_DIR", ".llm_cache"),
+    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "512")) * 1024 * 1024),
+    max_age_seconds=float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+    enabled=os.getenv("LLM_CACHE_ENABLED", "1") != "0",
+)
@@ -1,11 +1,25 @@
 # llm_handler.py
-import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import json
 import os
+import random
+import threading
+import time
+from dataclasses import replace
 from dotenv import load_dotenv
+from llm_cache import llm_cache
+from rate_limit import RateLimiter
+from offer_store import offer_store
+from text_chunker import estimate_tokens, split_text_into_chunks, merge_chunk_items
+from item_matching import pre_group_items, find_ambiguous_batches, merge_clusters, clusters_to_groups, update_clusters
+from json_stream import JsonArrayStreamParser, parse_json_array
+from llm_rows import ExtractedItem, ItemGroup, MarketOffer, to_dict, to_dicts, validate_rows
+from instrumentation import span, traced, ContextThreadPoolExecutor
+from prompt_serializer import (
+    enforce_budget, token_usage, records_to_tsv
+)
 
 load_dotenv()
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 # Настраиваем модель
 generation_config = {
@@ -15,13 +29,328 @@ generation_config = {
   "max_output_tokens": 8192,
 }
 
-model = genai.GenerativeModel(model_name="gemini-1.5-flash-latest",
-                              generation_config=generation_config)
+MODEL_NAME = "gemini-1.5-flash-latest"
 
-def extract_data_from_text(text: str, supplier_name: str) -> list:
-    """Извлекает табличные данные из текста с помощью LLM."""
-    
-    prompt = f"""
+# Для инсайта температуру можно чуть поднять — это генерация текста
+INSIGHT_GENERATION_CONFIG = {"temperature": 0.5}
+
+# Модели создаются при первом обращении (google.generativeai импортируется долго), один раз на процесс
+model = None
+_insight_model = None
+_model_lock = threading.Lock()
+
+# Версии промптов: увеличьте номер при изменении текста промпта, чтобы не использовать старый кэш
+PROMPT_VERSIONS = {
+    "extract": 1,
+    "normalize": 3,
+    "search_query": 1,
+    "search_analysis": 2,
+    "insight": 1,
+}
+
+# Параметры параллельной работы с API
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "4"))  # Сколько запросов одновременно "в полете"
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+
+# Большие документы делим на окна, чтобы ответ модели не обрезался по max_output_tokens
+EXTRACT_CHUNK_TOKENS = int(os.getenv("EXTRACT_CHUNK_TOKENS", "3000"))
+EXTRACT_CHUNK_OVERLAP_LINES = int(os.getenv("EXTRACT_CHUNK_OVERLAP_LINES", "2"))
+EXTRACT_MIN_CHUNK_TOKENS = 500  # Меньше этого окно при повторной попытке не дробим
+
+# Повторная группировка достраивает прошлую, пока новых позиций не больше этой доли; иначе группируем заново
+REGROUP_MAX_NEW_SHARE = float(os.getenv("REGROUP_MAX_NEW_SHARE", "0.5"))
+
+# Сколько раз дозапрашивать хвост JSON-массива, если ответ модели оборвался по max_output_tokens
+LLM_MAX_CONTINUATIONS = int(os.getenv("LLM_MAX_CONTINUATIONS", "3"))
+
+def _create_model(config: dict):
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    return genai.GenerativeModel(model_name=MODEL_NAME, generation_config=config)
+
+
+def get_model():
+    """Основная модель: создается при первом вызове и дальше переиспользуется всеми потоками и сессиями."""
+    global model
+    with _model_lock:
+        if model is None:
+            model = _create_model(generation_config)
+    return model
+
+
+# Ошибки, при которых запрос имеет смысл повторить (429 и временная недоступность)
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+)
+
+
+rate_limiter = RateLimiter(LLM_REQUESTS_PER_MINUTE)
+# Общий на процесс лимит одновременных запросов (в том числе из вложенных пулов потоков)
+_in_flight = threading.BoundedSemaphore(LLM_MAX_WORKERS)
+
+
+def generate_with_retry(prompt: str, llm=None, operation: str = "llm"):
+    """
+    Вызывает generate_content с учетом лимита частоты и экспоненциальной паузой при 429.
+    Перед вызовом проверяет бюджет входных токенов, после — записывает расход токенов по операции.
+    """
+    llm = llm or get_model()
+    input_tokens = enforce_budget(prompt, llm)
+    delay = 1.0
+    with span(f"llm.{operation}") as call_span:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            rate_limiter.acquire()
+            try:
+                with _in_flight:
+                    response = llm.generate_content(prompt)
+                call_span.input_tokens, call_span.output_tokens = token_usage.record_response(operation, response, input_tokens)
+                return response
+            except RETRYABLE_ERRORS as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                call_span.retries += 1
+                print(f"API перегружен ({e}), повтор через {delay:.1f} с...")
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, 30.0)
+
+
+def generate_stream_with_retry(prompt: str, llm=None, operation: str = "llm"):
+    """
+    Потоковый вариант generate_with_retry: генератор фрагментов текста ответа по мере их генерации.
+    Повтор при 429 возможен только до получения первого фрагмента.
+    """
+    llm = llm or get_model()
+    input_tokens = enforce_budget(prompt, llm)
+    delay = 1.0
+    with span(f"llm.{operation}", stream=True) as call_span:
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            rate_limiter.acquire()
+            received = False
+            try:
+                with _in_flight:
+                    response = llm.generate_content(prompt, stream=True)
+                    for chunk in response:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            continue  # Фрагмент без текста (например, только служебные данные)
+                        if not received:
+                            call_span.attributes["first_chunk_s"] = round(time.time() - call_span.started_at, 3)
+                        received = True
+                        yield text
+                call_span.input_tokens, call_span.output_tokens = token_usage.record_response(operation, response, input_tokens)
+                return
+            except RETRYABLE_ERRORS as e:
+                if received or attempt == LLM_MAX_RETRIES:
+                    raise
+                call_span.retries += 1
+                print(f"API перегружен ({e}), повтор через {delay:.1f} с...")
+                time.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, 30.0)
+
+
+def _response_text(response) -> str:
+    try:
+        return response.text
+    except (AttributeError, ValueError):
+        return ""  # Ответ без текста (например, заблокирован фильтрами безопасности)
+
+
+def _is_truncated(response) -> bool:
+    """Ответ оборван по лимиту max_output_tokens (finish_reason MAX_TOKENS)."""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return False
+    return getattr(reason, "name", reason) in ("MAX_TOKENS", 2)
+
+
+def _continuation_prompt(prompt: str, received: list) -> str:
+    """Исходная задача плюс просьба вернуть только элементы после последнего полученного."""
+    return f"""{prompt}
+    ПРОДОЛЖЕНИЕ: предыдущий ответ оборвался. Ты уже вернул {len(received)} элемент(ов) массива, последний из них:
+    {json.dumps(to_dict(received[-1]), ensure_ascii=False)}
+    Верни ТОЛЬКО оставшиеся элементы, идущие ПОСЛЕ него, в виде JSON-массива. Уже возвращенные не повторяй.
+    Если оставшихся элементов нет, верни [].
+    """
+
+
+def _drop_repeated(rows: list, received: list, window: int = 3) -> list:
+    """Модель часто начинает продолжение с повтора последних элементов — отбрасываем их."""
+    tail = received[-window:]
+    start = 0
+    while start < len(rows) and rows[start] in tail:
+        start += 1
+    return rows[start:]
+
+
+def continue_json_array(prompt: str, received: list, operation: str, row_type, llm=None):
+    """
+    Дозапрашивает хвост оборванного JSON-массива: received — уже полученные строки row_type.
+    Возвращает (новые строки, complete); complete=False, если массив так и не удалось дочитать.
+    """
+    added = []
+    with span("continuation", operation=operation) as continuation_span:
+        for attempt in range(1, LLM_MAX_CONTINUATIONS + 1):
+            try:
+                response = generate_with_retry(_continuation_prompt(prompt, received + added), llm, operation=operation)
+            except (AttributeError, ValueError, google_exceptions.GoogleAPIError) as e:
+                print(f"Ошибка запроса продолжения ответа: {e}")
+                return added, False
+            continuation_span.attributes["requests"] = attempt
+            objects, complete = parse_json_array(_response_text(response))
+            rows = _drop_repeated(validate_rows(objects, row_type), received + added)
+            added += rows
+            if complete and not _is_truncated(response):
+                return added, True
+            if not rows:
+                break  # Продолжение ничего не добавило — дальше спрашивать бессмысленно
+    print(f"Ответ модели ({operation}) оборван, получено {len(received) + len(added)} элемент(ов)")
+    return added, False
+
+
+def generate_json_array(prompt: str, operation: str, row_type, llm=None):
+    """
+    Запрос к модели, которая отвечает JSON-массивом строк; каждая строка проверяется как row_type (см. llm_rows).
+    Оборванный или частично испорченный ответ не выбрасывается: берутся все завершенные объекты,
+    а хвост обрезанного ответа дозапрашивается отдельно (continue_json_array).
+    Возвращает (строки row_type, complete); строки None — в ответе не нашлось ни одного объекта.
+    """
+    response = generate_with_retry(prompt, llm, operation=operation)
+    text = _response_text(response)
+    objects, complete = parse_json_array(text)
+    if not objects and not complete:
+        print(f"Ответ модели, который не удалось распарсить: {text[:1000]}")
+        return None, False
+    rows = validate_rows(objects, row_type)
+    if rows and (not complete or _is_truncated(response)):
+        added, complete = continue_json_array(prompt, rows, operation, row_type, llm)
+        rows += added
+    return rows, complete
+
+
+def extract_data_from_text(text: str, supplier_name: str, chunked: bool = None) -> list:
+    """
+    Извлекает табличные данные из текста с помощью LLM.
+    Если документ больше EXTRACT_CHUNK_TOKENS (или chunked=True), он делится на окна по границам
+    страниц/листов/строк, окна обрабатываются параллельно, а дубли на перекрытиях удаляются.
+    Возвращает (позиции, complete); complete=False, если ответ модели хотя бы по одному окну
+    не удалось разобрать или дочитать — позиции тогда неполные.
+    """
+    if chunked is None:
+        chunked = estimate_tokens(text) > EXTRACT_CHUNK_TOKENS
+    chunks = split_text_into_chunks(text, EXTRACT_CHUNK_TOKENS, EXTRACT_CHUNK_OVERLAP_LINES) if chunked else []
+
+    if len(chunks) > 1:
+        with ContextThreadPoolExecutor(max_workers=LLM_MAX_WORKERS) as executor:
+            results = list(executor.map(
+                lambda chunk: _extract_chunk_with_fallback(chunk["text"], EXTRACT_CHUNK_TOKENS), chunks
+            ))
+        extracted_data = merge_chunk_items(chunks, [items for items, _ in results])
+        complete = all(chunk_complete for _, chunk_complete in results)
+    else:
+        extracted_data, complete = _extract_items(text)
+        extracted_data = extracted_data or []
+
+    # Добавляем имя поставщика к каждой позиции
+    return [replace(item, supplier=supplier_name) for item in extracted_data], complete
+
+
+def _extract_chunk_with_fallback(text: str, max_tokens: int) -> tuple:
+    """
+    Извлекает позиции из окна; если ответ не удалось разобрать, дробит окно пополам и пробует еще раз.
+    Возвращает (позиции, complete).
+    """
+    items, complete = _extract_items(text)
+    if items is not None:
+        return items, complete
+    if max_tokens // 2 < EXTRACT_MIN_CHUNK_TOKENS:
+        return [], False
+    sub_chunks = split_text_into_chunks(text, max_tokens // 2, EXTRACT_CHUNK_OVERLAP_LINES)
+    if len(sub_chunks) < 2:
+        return [], False
+    print(f"Повторное извлечение окна частями: {len(sub_chunks)} шт.")
+    results = [_extract_chunk_with_fallback(chunk["text"], max_tokens // 2) for chunk in sub_chunks]
+    return (merge_chunk_items(sub_chunks, [items for items, _ in results]),
+            all(sub_complete for _, sub_complete in results))
+
+
+def stream_extract_data_from_text(text: str, supplier_name: str):
+    """
+    Потоковый вариант extract_data_from_text: генератор, отдающий позиции по одной, как только модель
+    закончила очередной объект JSON-массива. Большие документы обрабатываются окнами без потоковой выдачи —
+    там параллельная обработка окон дает больший выигрыш.
+    Результат генератора (значение StopIteration, см. pipeline.process_file) — complete, как у extract_data_from_text.
+    """
+    if estimate_tokens(text) > EXTRACT_CHUNK_TOKENS:
+        items, complete = extract_data_from_text(text, supplier_name)
+        yield from items
+        return complete
+
+    cache_key = _extract_cache_key(text)
+    cached_data = _cached_rows(cache_key, ExtractedItem)
+    if cached_data is not None:
+        for item in cached_data:
+            yield replace(item, supplier=supplier_name)
+        return True
+
+    extracted_data = []
+    prompt = _build_extract_prompt(text)
+    parser = JsonArrayStreamParser()
+    try:
+        for chunk in generate_stream_with_retry(prompt, operation="extract"):
+            for item in validate_rows(parser.feed(chunk), ExtractedItem):
+                extracted_data.append(item)
+                yield replace(item, supplier=supplier_name)
+    except (AttributeError, ValueError) as e:
+        print(f"Ошибка потокового ответа от API: {e}")
+        return False
+    complete = parser.done
+    if extracted_data and not complete:
+        # Массив не закрыт — ответ оборвался; дозапрашиваем только оставшиеся позиции
+        added, complete = continue_json_array(prompt, extracted_data, "extract", ExtractedItem)
+        for item in added:
+            extracted_data.append(item)
+            yield replace(item, supplier=supplier_name)
+    if extracted_data and complete: llm_cache.set(cache_key, to_dicts(extracted_data))
+    return complete
+
+
+def _extract_cache_key(text: str) -> str:
+    return llm_cache.make_key("extract", PROMPT_VERSIONS["extract"], MODEL_NAME, generation_config, text)
+
+
+def _cached_rows(cache_key: str, row_type):
+    """Строки row_type из кэша LLM (там они хранятся словарями) или None, если записи нет."""
+    cached = llm_cache.get(cache_key)
+    return validate_rows(cached, row_type) if isinstance(cached, list) else None
+
+
+def _extract_items(text: str):
+    """
+    Один запрос к LLM на извлечение позиций. Возвращает (позиции, complete); позиции None — ответ
+    не удалось разобрать, complete=False — ответ оборван и дочитать его не удалось.
+    """
+    cache_key = _extract_cache_key(text)
+    cached_data = _cached_rows(cache_key, ExtractedItem)
+    if cached_data is not None:
+        return cached_data, True
+
+    try:
+        extracted_data, complete = generate_json_array(_build_extract_prompt(text), "extract", ExtractedItem)
+    except (AttributeError, ValueError, google_exceptions.GoogleAPIError) as e:
+        # В том числе 429 после всех повторов: в режиме окон теряется только это окно, а не весь документ
+        print(f"Ошибка ответа от API: {e}")
+        return None, False
+    if extracted_data and complete: llm_cache.set(cache_key, to_dicts(extracted_data))
+    return extracted_data, complete
+
+
+def _build_extract_prompt(text: str) -> str:
+    return f"""
     ТЫ — AI-аналитик отдела закупок. Твоя задача — извлечь из текста коммерческого предложения все товарные позиции.
     
     ИНСТРУКЦИИ:
@@ -46,106 +375,181 @@ def extract_data_from_text(text: str, supplier_name: str) -> list:
     {text}
     ---
     """
-    
-    try:
-        response = model.generate_content(prompt)
-        # Попытка исправить "грязный" JSON от модели
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        extracted_data = json.loads(cleaned_response)
-        # Добавляем имя поставщика к каждой позиции
-        for item in extracted_data:
-            item['supplier'] = supplier_name
-        return extracted_data
-    except (json.JSONDecodeError, AttributeError, ValueError) as e:
-        print(f"Ошибка декодирования JSON или ответа от API: {e}")
-        print(f"Ответ модели, который не удалось распарсить: {response.text}")
-        return []
 
 
 def normalize_and_group_items(items: list) -> list:
-    """Группирует одинаковые товары от разных поставщиков с помощью LLM."""
-    
+    """
+    Группирует одинаковые товары от разных поставщиков.
+    Очевидные совпадения (одинаковое наименование после нормализации или артикул) группируются локально,
+    а в LLM небольшими параллельными порциями уходят только неоднозначные позиции.
+    """
+    return clusters_to_groups(items, group_items(items))
+
+
+def group_items(items: list, previous: dict = None) -> list:
+    """
+    Группирует позиции и возвращает кластеры (см. item_matching); clusters_to_groups приводит их к таблице.
+    previous — прошлая группировка {"items": [...], "clusters": [...]} того же тендера: если набор файлов
+    изменился немного, позиции неизмененных файлов остаются в своих группах, а с моделью сопоставляются
+    только новые. Если новых позиций больше доли REGROUP_MAX_NEW_SHARE, все группируется заново.
+    Если включена история предложений (offer_store), известные по прошлым тендерам товары сопоставляются по ней.
+    """
+    if not items:
+        return []
+    with span("normalize", items=len(items)) as normalize_span:
+        all_suppliers = {item.supplier for item in items}
+        changed = None
+        if previous and previous.get("clusters"):
+            clusters, changed = update_clusters(items, previous["items"], previous["clusters"])
+            new_items = sum(len(clusters[i]["item_ids"]) for i in changed)
+            if new_items > REGROUP_MAX_NEW_SHARE * len(items):
+                changed = None
+            else:
+                normalize_span.attributes.update(incremental=True, new_items=new_items)
+        if changed is None:
+            clusters = pre_group_items(items)
+        if offer_store.enabled:
+            # Товары, уже встречавшиеся в прошлых тендерах, узнаем по словарю синонимов. Модели такие кластеры
+            # отправляются только как кандидаты для неизвестных: между собой они уже сопоставлены
+            unknown_ids = set(range(len(clusters))) if changed is None else changed
+            known_groups = offer_store.resolve(clusters)
+            unknown_ids -= {c for group in known_groups for c in group.ids}
+            unknown_items = {i for c in unknown_ids for i in clusters[c]["item_ids"]}
+            clusters = merge_clusters(clusters, known_groups)
+            changed = {c for c, cluster in enumerate(clusters) if unknown_items.issuperset(cluster["item_ids"])}
+            normalize_span.attributes["store_matches"] = sum(len(group.ids) for group in known_groups)
+        batches = find_ambiguous_batches(clusters, all_suppliers, changed=changed)
+        normalize_span.attributes.update(local_clusters=len(clusters), llm_batches=len(batches))
+
+        if batches:
+            with ContextThreadPoolExecutor(max_workers=LLM_MAX_WORKERS) as executor:
+                batch_results = list(executor.map(lambda batch: _group_batch(items, clusters, batch), batches))
+            merged_groups = [group for result in batch_results for group in result]
+            clusters = merge_clusters(clusters, merged_groups)
+        return clusters
+
+
+def _group_batch(items: list, clusters: list, batch: list) -> list:
+    """
+    Отправляет модели порцию кластеров и возвращает их объединения (ItemGroup с номерами кластеров).
+    """
+    candidates = []
+    for cluster_id in batch:
+        cluster = clusters[cluster_id]
+        names = list(dict.fromkeys(items[i].name for i in cluster['item_ids']))
+        candidates.append({"id": cluster_id, "names": names, "suppliers": sorted(map(str, cluster['suppliers']))})
+    candidates_text = records_to_tsv(candidates, ["id", "names", "suppliers"])
+
+    cache_key = llm_cache.make_key("normalize", PROMPT_VERSIONS["normalize"], MODEL_NAME, generation_config, candidates)
+    cached_data = _cached_rows(cache_key, ItemGroup)
+    if cached_data is not None:
+        return _groups_within_batch(cached_data, batch)
+
     prompt = f"""
-    ТЫ — AI-эксперт по нормализации данных. Тебе предоставлен JSON-массив с товарами от РАЗНЫХ поставщиков.
+    ТЫ — AI-эксперт по нормализации данных. Тебе предоставлена таблица (TSV) товаров от РАЗНЫХ поставщиков, по одному на строку.
+    Колонки: номер товара "id", варианты названия "names" (через " / ") и поставщики "suppliers" (через " / ").
     
     ЗАДАЧА:
     1. Сгруппируй семантически одинаковые товары. "Подшипник 6205-2RS" и "Подшипник шариковый арт. 6205" - это ОДИН и тот же товар.
-    2. Для каждой группы товаров создай единое "каноничное" наименование.
-    3. Верни результат ТОЛЬКО в виде JSON-массива, где каждый элемент — это уникальный товар, содержащий список предложений от поставщиков.
+    2. Товары одного и того же поставщика в одну группу НЕ объединяй.
+    3. Для каждой группы товаров создай единое "каноничное" наименование.
+    4. Верни результат ТОЛЬКО в виде JSON-массива. Товары, для которых нет пары, в ответ не включай.
     
     СТРУКТУРА ВЫХОДНОГО JSON:
     [
-      {{
-        "canonical_name": "Единое название товара 1",
-        "offers": [
-          {{ "supplier": "Поставщик А", "price_per_unit": 100.00 }},
-          {{ "supplier": "Поставщик Б", "price_per_unit": 105.50 }}
-        ]
-      }},
-      {{
-        "canonical_name": "Единое название товара 2",
-        "offers": [
-          {{ "supplier": "Поставщик А", "price_per_unit": 220.00 }}
-        ]
-      }}
+      {{ "canonical_name": "Единое название товара 1", "ids": [0, 3] }},
+      {{ "canonical_name": "Единое название товара 2", "ids": [5, 7, 8] }}
     ]
 
-    ВХОДНЫЕ ДАННЫЕ (JSON):
+    ВХОДНЫЕ ДАННЫЕ (TSV):
     ---
-    {json.dumps(items, ensure_ascii=False, indent=2)}
+    {candidates_text}
     ---
     """
     try:
-        response = model.generate_content(prompt)
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        grouped_data = json.loads(cleaned_response)
-        return grouped_data
-    except (json.JSONDecodeError, AttributeError, ValueError) as e:
-        print(f"Ошибка декодирования JSON на этапе нормализации: {e}")
-        print(f"Ответ модели, который не удалось распарсить: {response.text}")
+        grouped_data, complete = generate_json_array(prompt, "normalize", ItemGroup)
+    except (AttributeError, ValueError, google_exceptions.GoogleAPIError) as e:
+        # Порция без ответа остается несгруппированной, остальные порции не теряются
+        print(f"Ошибка ответа от API на этапе нормализации: {e}")
         return []
-    
-def generate_tender_insight(df_as_json: str, totals: dict) -> str:
-    """Генерирует аналитическую сводку и рекомендации по закупке."""
-    
+    if grouped_data is None:
+        return []
+    if complete: llm_cache.set(cache_key, to_dicts(grouped_data))
+    return _groups_within_batch(grouped_data, batch)
+
+
+def _groups_within_batch(groups: list, batch: list) -> list:
+    """
+    Оставляет в группах только номера кластеров этой порции: номер из другой порции или выдуманный моделью
+    объединил бы посторонние позиции. Группы, в которых осталось меньше двух номеров, отбрасываются.
+    """
+    allowed = set(batch)
+    result = []
+    for group in groups:
+        ids = tuple(dict.fromkeys(i for i in group.ids if i in allowed))
+        if len(ids) >= 2:
+            result.append(ItemGroup(canonical_name=group.canonical_name, ids=ids))
+    return result
+
+@traced("insight")
+def generate_tender_insight(optimization) -> str:
+    """
+    Формулирует аналитическую сводку для менеджера по закупкам.
+    Все расчеты (лучший поставщик, разделение закупки, экономия) уже сделаны в tender_optimizer —
+    модель получает только компактную сводку с готовыми числами и отвечает за формулировку.
+    """
+    summary_text = optimization.to_prompt_text()
+    cache_key = llm_cache.make_key("insight", PROMPT_VERSIONS["insight"], MODEL_NAME, INSIGHT_GENERATION_CONFIG, summary_text)
+    cached_insight = llm_cache.get(cache_key)
+    if cached_insight is not None:
+        return cached_insight
+
     prompt = f"""
-    ТЫ — AI-эксперт по закупкам. Тебе предоставлены результаты сравнения коммерческих предложений в формате JSON.
+    ТЫ — AI-эксперт по закупкам. Тебе предоставлены уже посчитанные итоги сравнения коммерческих предложений.
     
     ТВОЯ ЗАДАЧА:
     Написать короткую (2-3 предложения), но емкую аналитическую сводку для менеджера по закупкам.
+    Используй ТОЛЬКО числа из сводки, ничего не пересчитывай.
     
     ОБЯЗАТЕЛЬНО УКАЖИ:
-    1. У какого поставщика самая низкая ОБЩАЯ сумма по всем позициям. Назови поставщика и сумму.
-    2. Проанализируй данные по строкам. Есть ли возможность получить ДОПОЛНИТЕЛЬНУЮ экономию, если разделить закупку между несколькими поставщиками?
-    3. Если да, то приведи пример: "Например, закупив [Название товара 1] у [Поставщик А], а [Название товара 2] у [Поставщик Б], можно оптимизировать расходы."
+    1. У какого поставщика самая низкая ОБЩАЯ сумма. Назови поставщика и сумму.
+    2. Есть ли ДОПОЛНИТЕЛЬНАЯ экономия при разделении закупки между поставщиками и какая.
+    3. Если да, приведи пример из списка позиций с наибольшей выгодой: "Например, закупив [Товар 1] у [Поставщик А], а остальное у [Поставщик Б], можно оптимизировать расходы."
     4. Сделай вывод в деловом, но понятном стиле. Обращайся к пользователю уважительно.
 
-    ВХОДНЫЕ ДАННЫЕ:
-    
-    1. Итоговая сравнительная таблица (в формате JSON):
-    {df_as_json}
-
-    2. Общие суммы по каждому поставщику:
-    {json.dumps(totals, ensure_ascii=False, indent=2)}
+    СВОДКА:
+    {summary_text}
 
     ТВОЙ АНАЛИТИЧЕСКИЙ ВЫВОД:
     """
     
     try:
-        # Используем ту же модель, но с большей "креативностью"
-        insight_model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash-latest",
-            generation_config={"temperature": 0.5} # Температуру можно чуть поднять для генерации текста
-        )
-        response = insight_model.generate_content(prompt)
-        return response.text
+        response = generate_with_retry(prompt, _get_insight_model(), operation="insight")
+        insight_text = response.text
+        if insight_text: llm_cache.set(cache_key, insight_text)
+        return insight_text
     except Exception as e:
         print(f"Ошибка при генерации инсайта: {e}")
-        return "Не удалось сгенерировать аналитический вывод."
-    
+        return optimization.to_text()  # Числа посчитаны без модели, поэтому вывод все равно можно показать
+
+
+def _get_insight_model():
+    """Модель для инсайтов создается один раз: та же модель, но с большей "креативностью"."""
+    global _insight_model
+    with _model_lock:
+        if _insight_model is None:
+            _insight_model = _create_model(INSIGHT_GENERATION_CONFIG)
+    return _insight_model
+
+@traced("query_generation")
 def generate_search_query(item_name: str) -> str:
     """Преобразует название товара в эффективный поисковый запрос."""
     
+    cache_key = llm_cache.make_key("search_query", PROMPT_VERSIONS["search_query"], MODEL_NAME, generation_config, item_name)
+    cached_query = llm_cache.get(cache_key)
+    if cached_query is not None:
+        return cached_query
+
     prompt = f"""
     ТЫ — AI-ассистент в отделе закупок.
     Твоя задача — создать идеальный поисковый запрос для Google, чтобы найти лучшую цену на товар.
@@ -156,29 +560,81 @@ def generate_search_query(item_name: str) -> str:
     Сгенерируй только строку запроса. Без лишних слов.
     """
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip().replace('"', '')
+        response = generate_with_retry(prompt, operation="search_query")
+        search_query = response.text.strip().replace('"', '')
+        if search_query: llm_cache.set(cache_key, search_query)
+        return search_query
     except Exception as e:
         print(f"Ошибка при генерации поискового запроса: {e}")
         return item_name # В случае ошибки ищем как есть
 
+@traced("result_analysis")
 def analyze_search_results(search_results: list, item_name: str) -> list:
     """Анализирует результаты поиска Google и извлекает предложения."""
     
+    cache_key = _search_analysis_cache_key(search_results, item_name)
+    cached_offers = _cached_rows(cache_key, MarketOffer)
+    if cached_offers is not None:
+        return cached_offers
+
+    try:
+        offers, complete = generate_json_array(_build_search_analysis_prompt(search_results, item_name), "search_analysis", MarketOffer)
+    except Exception as e:
+        print(f"Ошибка при анализе результатов поиска: {e}")
+        return []
+    if offers and complete: llm_cache.set(cache_key, to_dicts(offers))
+    return offers or []
+
+
+def stream_analyze_search_results(search_results: list, item_name: str):
+    """Потоковый вариант analyze_search_results: генератор, отдающий предложения по мере генерации ответа."""
+    cache_key = _search_analysis_cache_key(search_results, item_name)
+    cached_offers = _cached_rows(cache_key, MarketOffer)
+    if cached_offers is not None:
+        yield from cached_offers
+        return
+
+    offers = []
+    prompt = _build_search_analysis_prompt(search_results, item_name)
+    parser = JsonArrayStreamParser()
+    with span("result_analysis", stream=True):
+        try:
+            for chunk in generate_stream_with_retry(prompt, operation="search_analysis"):
+                for offer in validate_rows(parser.feed(chunk), MarketOffer):
+                    offers.append(offer)
+                    yield offer
+            complete = parser.done
+            if offers and not complete:
+                added, complete = continue_json_array(prompt, offers, "search_analysis", MarketOffer)
+                offers += added
+                yield from added
+        except Exception as e:
+            print(f"Ошибка при анализе результатов поиска: {e}")
+            return
+    if offers and complete: llm_cache.set(cache_key, to_dicts(offers))
+
+
+def _search_analysis_cache_key(search_results: list, item_name: str) -> str:
+    return llm_cache.make_key(
+        "search_analysis", PROMPT_VERSIONS["search_analysis"], MODEL_NAME, generation_config,
+        {"item_name": item_name, "search_results": search_results}
+    )
+
+
+def _build_search_analysis_prompt(search_results: list, item_name: str) -> str:
     # Формируем контекст для модели из результатов поиска
-    context = ""
-    for i, result in enumerate(search_results):
-        context += f"--- Результат поиска №{i+1} ---\n"
-        context += f"Заголовок: {result.get('title', '')}\n"
-        context += f"Ссылка: {result.get('link', '')}\n"
-        context += f"Фрагмент текста: {result.get('snippet', '')}\n\n"
+    context = records_to_tsv(
+        [{"n": i + 1, "title": r.get('title', ''), "link": r.get('link', ''), "snippet": r.get('snippet', '')}
+         for i, r in enumerate(search_results)],
+        ["n", "title", "link", "snippet"],
+    )
 
-    prompt = f"""
+    return f"""
     ТЫ — AI-аналитик, изучающий поисковую выдачу.
     Твоя задача — найти коммерческие предложения на товар "{item_name}" в предоставленных фрагментах текста из поиска Google.
 
     ИНСТРУКЦИИ:
-    1. Проанализируй каждый "Результат поиска".
+    1. Проанализируй каждую строку (один результат поиска).
     2. Если во фрагменте текста есть упоминание цены и название компании/магазина, извлеки эти данные.
     3. Цена должна быть числом.
     4. Если цена не найдена, пропусти этот результат.
@@ -194,17 +650,8 @@ def analyze_search_results(search_results: list, item_name: str) -> list:
       }}
     ]
 
-    ТЕКСТ ДЛЯ АНАЛИЗА (РЕЗУЛЬТАТЫ ПОИСКА):
+    ТЕКСТ ДЛЯ АНАЛИЗА (РЕЗУЛЬТАТЫ ПОИСКА, TSV: номер, заголовок, ссылка, фрагмент текста):
     ---
     {context}
     ---
     """
-    
-    try:
-        response = model.generate_content(prompt)
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(cleaned_response)
-    except Exception as e:
-        print(f"Ошибка при анализе результатов поиска: {e}")
-        print(f"Ответ модели: {response.text}")
-        return []
\ No newline at end of file
@@ -0,0 +1,109 @@
+# llm_rows.py
+
+import re
+from dataclasses import dataclass, asdict
+
+# Строки ответов модели проверяются и приводятся к типам здесь (числа — float, тексты — непустые строки).
+# Дальше по конвейеру (сопоставление, сравнительная таблица, история предложений) идут типизированные строки;
+# в словари они превращаются только там, где пишутся в JSON (кэш LLM, чекпойнты) — см. to_dicts и validate_rows
+
+NUMBER_JUNK = re.compile(r"[^\d,.\-]")
+
+
+def parse_number(value):
+    """Число из ответа модели: 1500.5, "1 500,50 руб.", "1,500.50" -> float; все остальное -> None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value == value else None
+    if not isinstance(value, str):
+        return None
+    text = NUMBER_JUNK.sub("", value).rstrip(".")  # Точка от сокращений: "руб.", "шт."
+    # "1,500.50": запятая — разделитель тысяч; "1500,50": запятая — десятичный разделитель
+    text = text.replace(",", "") if "." in text else text.replace(",", ".")
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _text(value):
+    """Непустая строка без лишних пробелов или None."""
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    text = str(value).strip()
+    return text or None
+
+
+@dataclass(slots=True, frozen=True)
+class ExtractedItem:
+    """Товарная позиция из КП: из ответа модели или из таблицы (table_extractor); supplier — имя поставщика."""
+    name: str
+    sku: str = None
+    quantity: float = None
+    unit: str = None
+    price_per_unit: float = None
+    total_price: float = None
+    supplier: str = None
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Позиция из объекта JSON или None, если это не позиция (нет наименования)."""
+        if not isinstance(raw, dict) or not _text(raw.get("name")):
+            return None
+        return cls(name=_text(raw["name"]), sku=_text(raw.get("sku")), quantity=parse_number(raw.get("quantity")),
+                   unit=_text(raw.get("unit")), price_per_unit=parse_number(raw.get("price_per_unit")),
+                   total_price=parse_number(raw.get("total_price")), supplier=_text(raw.get("supplier")))
+
+
+@dataclass(slots=True, frozen=True)
+class ItemGroup:
+    """Объединение кластеров (от модели или из истории предложений): каноничное наименование и номера кластеров."""
+    canonical_name: str
+    ids: tuple
+
+    @classmethod
+    def from_raw(cls, raw):
+        if not isinstance(raw, dict):
+            return None
+        ids = [int(i) for i in raw.get("ids") or [] if isinstance(i, (int, float, str)) and str(i).strip().isdigit()]
+        if len(ids) < 2:
+            return None  # Группа из одного товара ничего не объединяет
+        return cls(canonical_name=_text(raw.get("canonical_name")), ids=tuple(ids))
+
+
+@dataclass(slots=True, frozen=True)
+class MarketOffer:
+    """Предложение из поисковой выдачи."""
+    supplier_name: str = None
+    price: float = None
+    link: str = None
+    snippet: str = None
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Предложение из объекта JSON или None, если в нем нет ни поставщика, ни ссылки."""
+        if not isinstance(raw, dict):
+            return None
+        offer = cls(supplier_name=_text(raw.get("supplier_name")), price=parse_number(raw.get("price")),
+                    link=_text(raw.get("link")), snippet=_text(raw.get("snippet")))
+        return offer if offer.supplier_name or offer.link else None
+
+
+def to_dict(row) -> dict:
+    """Строка -> словарь без пустых полей (как если бы модель пропустила поле)."""
+    return {key: value for key, value in asdict(row).items() if value is not None}
+
+
+def to_dicts(rows: list) -> list:
+    """Строки -> словари для записи в JSON (кэш LLM, чекпойнты)."""
+    return [to_dict(row) for row in rows]
+
+
+def validate_rows(objects: list, row_type) -> list:
+    """
+    Проверяет объекты JSON (ответ модели, кэш, чекпойнт) как строки row_type (ExtractedItem, ItemGroup,
+    MarketOffer); некорректные отбрасываются.
+    """
+    rows = [row_type.from_raw(obj) for obj in objects]
+    return [row for row in rows if row is not None]
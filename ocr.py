@@ -0,0 +1,163 @@
+# ocr.py
+
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+import fitz  # PyMuPDF
+from llm_cache import LLMCache
+from instrumentation import span
+
+# Распознавание сканов (страниц PDF без текстового слоя) через Tesseract
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") != "0"
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "rus+eng")
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+# Сколько секунд можно потратить на распознавание одного документа; нераспознанные страницы пропускаются
+OCR_TIME_BUDGET_SECONDS = float(os.getenv("OCR_TIME_BUDGET_SECONDS", "120"))
+OCR_MAX_PROCESSES = int(os.getenv("OCR_MAX_PROCESSES", str(os.cpu_count() or 1)))
+# Страница, на которой в текстовом слое меньше символов, считается сканом
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "20"))
+# Увеличьте при изменении предобработки изображения, чтобы не использовать старый кэш
+OCR_VERSION = 1
+
+# Результаты распознавания по хэшу изображений страницы: повторно загруженный скан не распознается заново
+ocr_cache = LLMCache(
+    cache_dir=os.getenv("OCR_CACHE_DIR", ".ocr_cache"),
+    max_bytes=int(float(os.getenv("OCR_CACHE_MAX_MB", "128")) * 1024 * 1024),
+    max_age_seconds=float(os.getenv("OCR_CACHE_MAX_AGE_DAYS", "90")) * 24 * 3600,
+    enabled=os.getenv("OCR_CACHE_ENABLED", "1") != "0",
+)
+
+_available = None
+
+
+def ocr_available() -> bool:
+    """Установлены ли pytesseract и сам Tesseract (проверяется один раз на процесс)."""
+    global _available
+    if _available is None:
+        try:
+            import pytesseract  # Необязательная зависимость: без нее сканы просто остаются без текста
+            pytesseract.get_tesseract_version()
+            _available = True
+        except Exception as e:
+            print(f"OCR недоступен (нужны pytesseract и tesseract): {e}")
+            _available = False
+    return _available
+
+
+def needs_ocr(text: str) -> bool:
+    """Быстрая проверка текстового слоя страницы: почти пустой — кандидат на распознавание."""
+    return len(text.strip()) < OCR_MIN_TEXT_CHARS
+
+
+def recognize_image(image_png: bytes, languages: str = OCR_LANGUAGES, timeout: float = 0) -> str:
+    """Распознает текст на изображении PNG. Работает и в процессе-воркере."""
+    import pytesseract
+    from PIL import Image
+    with Image.open(io.BytesIO(image_png)) as image:
+        return pytesseract.image_to_string(image, lang=languages, timeout=timeout)
+
+
+def _recognize_until(image_png: bytes, languages: str, deadline: float) -> str:
+    """
+    Работает в процессе-воркере: распознает страницу в пределах оставшегося времени.
+    deadline — по time.time(), а не time.monotonic(), чтобы одинаково понимался во всех процессах.
+    """
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise TimeoutError("время на распознавание истекло до начала страницы")
+    return recognize_image(image_png, languages, remaining)
+
+
+def _page_image_key(pdf_document, page, dpi: int, languages: str):
+    """Ключ кэша страницы по ее встроенным изображениям (без растеризации); None — изображений на странице нет."""
+    xrefs = [image[0] for image in page.get_images(full=True)]
+    if not xrefs:
+        return None
+    digest = hashlib.sha256(f"{page.rect}|{page.rotation}".encode("utf-8"))
+    for xref in xrefs:
+        digest.update(pdf_document.xref_stream_raw(xref) or b"")
+    return ocr_cache.make_key("ocr", OCR_VERSION, "tesseract", {"dpi": dpi, "languages": languages}, digest.hexdigest())
+
+
+def ocr_pdf_pages(pdf_bytes: bytes, page_numbers: list, dpi: int = None, languages: str = None,
+                  time_budget: float = None, processes: int = None) -> dict:
+    """
+    Распознает страницы PDF (номера с 1) и возвращает {номер страницы: текст}.
+    Страницы без изображений пропускаются, уже распознанные берутся из кэша; остальные растеризуются
+    через PyMuPDF и распознаются в пуле процессов. В time_budget секунд входят и растеризация,
+    и распознавание: каждая страница получает только оставшееся время, а по истечении бюджета пул
+    останавливается вместе с незавершенными страницами, которые в результат не попадают.
+    Параметры по умолчанию — из переменных OCR_* (читаются при вызове, чтобы их можно было менять в воркерах).
+    """
+    if not page_numbers or not OCR_ENABLED or not ocr_available():
+        return {}
+    dpi, languages = dpi or OCR_DPI, languages or OCR_LANGUAGES
+    time_budget, processes = time_budget or OCR_TIME_BUDGET_SECONDS, processes or OCR_MAX_PROCESSES
+    deadline = time.monotonic() + time_budget
+    wall_deadline = time.time() + time_budget
+    results, pending = {}, {}  # pending: номер страницы -> ключ кэша
+    timed_out = False
+    with span("ocr", dpi=dpi) as ocr_span, fitz.open(stream=pdf_bytes, filetype="pdf") as pdf_document:
+        for page_num in page_numbers:
+            key = _page_image_key(pdf_document, pdf_document.load_page(page_num - 1), dpi, languages)
+            if key is None:
+                continue
+            cached = ocr_cache.get(key)
+            if cached is not None:
+                results[page_num] = cached
+            else:
+                pending[page_num] = key
+        cached_pages = len(results)
+
+        def rasterize(page_num: int):
+            """PNG страницы или None, если бюджет времени уже исчерпан."""
+            if time.monotonic() >= deadline:
+                return None
+            page = pdf_document.load_page(page_num - 1)
+            return page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY).tobytes("png")  # Оттенки серого: меньше данных, тот же результат
+
+        def store(page_num: int, text: str):
+            ocr_cache.set(pending[page_num], text)
+            results[page_num] = text
+            ocr_span.pages += 1
+
+        if len(pending) > 1 and processes > 1:
+            # spawn: документ может разбираться из рабочего потока, а fork из многопоточного процесса небезопасен.
+            # multiprocessing.Pool, а не ProcessPoolExecutor: по истечении бюджета воркеры нужно остановить (terminate)
+            pool = multiprocessing.get_context("spawn").Pool(min(processes, len(pending)))
+            try:
+                # Страницы отправляются в пул по мере растеризации: воркеры начинают, пока готовятся следующие
+                async_results = {}
+                for page_num in pending:
+                    image = rasterize(page_num)
+                    if image is None:
+                        timed_out = True
+                        break
+                    async_results[page_num] = pool.apply_async(_recognize_until, (image, languages, wall_deadline))
+                for page_num, async_result in async_results.items():
+                    try:
+                        store(page_num, async_result.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except multiprocessing.TimeoutError:
+                        timed_out = True
+                        break
+                    except Exception as e:
+                        print(f"Ошибка распознавания страницы {page_num}: {e}")
+            finally:
+                pool.terminate()  # Останавливает и страницы, которые еще распознаются
+        else:
+            for page_num in pending:
+                image = rasterize(page_num)
+                remaining = deadline - time.monotonic()
+                if image is None or remaining <= 0:
+                    timed_out = True
+                    break
+                try:
+                    store(page_num, recognize_image(image, languages, remaining))
+                except Exception as e:
+                    print(f"Ошибка распознавания страницы {page_num}: {e}")
+        if timed_out:
+            print(f"Превышено время распознавания ({time_budget} с), часть страниц пропущена")
+        ocr_span.attributes.update(requested=len(page_numbers), cached=cached_pages)
+    return results
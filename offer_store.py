@@ -0,0 +1,220 @@
+# offer_store.py
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from item_matching import clusters_to_groups
+from llm_rows import ItemGroup, to_dicts
+
+# Сколько параметров подставлять в один запрос "... IN (?, ?, ...)"
+SQL_IN_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenders (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    name TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS canonical_items (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    key TEXT PRIMARY KEY,
+    canonical_id INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS offers (
+    id INTEGER PRIMARY KEY,
+    tender_id INTEGER NOT NULL,
+    canonical_id INTEGER NOT NULL,
+    supplier TEXT,
+    name TEXT,
+    sku TEXT,
+    quantity REAL,
+    unit TEXT,
+    price_per_unit REAL
+);
+CREATE INDEX IF NOT EXISTS offers_canonical ON offers (canonical_id, tender_id);
+CREATE INDEX IF NOT EXISTS offers_tender ON offers (tender_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS offers_fts USING fts5(name, sku, tokenize="unicode61 remove_diacritics 0");
+"""
+
+FTS_TOKEN = re.compile(r"\w+")
+# Точные ключи сопоставления (см. item_matching.match_keys); ключи блокировки в словарь синонимов не попадают
+EXACT_KEY_KINDS = ("name", "sku")
+
+
+def _alias_keys(cluster: dict) -> list:
+    """Точные ключи кластера в виде строк: "name:болт м10", "sku:6205RS"."""
+    return sorted(f"{kind}:{value}" for kind, value in cluster["keys"] if kind in EXACT_KEY_KINDS)
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class OfferStore:
+    """
+    Локальная история тендеров в SQLite: извлеченные позиции, каноничные наименования и цены поставщиков.
+    Из точных ключей позиций (наименование, артикул) накапливается словарь синонимов -> каноничное
+    наименование, по которому группировка узнает уже встречавшиеся товары без обращения к модели.
+    Включается переменной OFFER_STORE_PATH; без нее все методы ничего не делают.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.enabled = bool(path)
+        self._local = threading.local()  # Соединение SQLite нельзя делить между потоками
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")     # Чтение не блокируется записью
+            conn.execute("PRAGMA synchronous=NORMAL")   # В режиме WAL этого достаточно и намного быстрее
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def _select_in(self, conn, query: str, values: list) -> list:
+        """Выполняет query с "IN ({})" порциями, чтобы не упереться в лимит числа параметров SQLite."""
+        rows = []
+        for start in range(0, len(values), SQL_IN_CHUNK):
+            chunk = values[start:start + SQL_IN_CHUNK]
+            rows += conn.execute(query.format(",".join("?" * len(chunk))), chunk).fetchall()
+        return rows
+
+    def resolve(self, clusters: list) -> list:
+        """
+        Находит в словаре синонимов каноничные наименования кластеров (по точным ключам, уже посчитанным
+        при группировке).
+        Возвращает объединения в формате merge_clusters (ItemGroup);
+        кластеры одного каноничного товара объединяются, если в них нет общих поставщиков.
+        """
+        if not self.enabled or not clusters:
+            return []
+        cluster_keys = [_alias_keys(cluster) for cluster in clusters]
+        all_keys = list({key for keys in cluster_keys for key in keys})
+        try:
+            known = {key: (canonical_id, name) for key, canonical_id, name in self._select_in(
+                self._connection(),
+                "SELECT a.key, c.id, c.name FROM aliases a JOIN canonical_items c ON c.id = a.canonical_id "
+                "WHERE a.key IN ({})", all_keys)}
+        except sqlite3.Error as e:
+            print(f"Ошибка чтения истории предложений: {e}")
+            return []
+
+        groups = {}  # canonical_id -> список объединений [{"ids", "suppliers", "canonical_name"}]
+        for cluster_id, keys in enumerate(cluster_keys):
+            match = next((known[key] for key in keys if key in known), None)
+            if match is None:
+                continue
+            suppliers = clusters[cluster_id]["suppliers"]
+            candidates = groups.setdefault(match[0], [])
+            target = next((group for group in candidates if not group["suppliers"] & suppliers), None)
+            if target is None:
+                target = {"ids": [], "suppliers": set(), "canonical_name": match[1]}
+                candidates.append(target)
+            target["ids"].append(cluster_id)
+            target["suppliers"] |= suppliers
+        return [ItemGroup(canonical_name=group["canonical_name"], ids=tuple(group["ids"]))
+                for candidates in groups.values() for group in candidates]
+
+    def save_tender(self, items: list, clusters: list, name: str = None):
+        """
+        Сохраняет результат группировки тендера: позиции с ценами, каноничные наименования и синонимы.
+        Повторное сохранение того же набора позиций заменяет прежнюю запись, а не дублирует ее.
+        """
+        if not self.enabled or not items:
+            return
+        groups = clusters_to_groups(items, clusters)
+        key = hashlib.sha256(json.dumps(to_dicts(items), ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+        name = name or ", ".join(sorted({str(item.supplier) for item in items}))
+        try:
+            conn = self._connection()
+            with conn:  # Одна транзакция на весь тендер
+                row = conn.execute("SELECT id FROM tenders WHERE key = ?", (key,)).fetchone()
+                if row:
+                    tender_id = row[0]
+                    conn.execute("DELETE FROM offers_fts WHERE rowid IN (SELECT id FROM offers WHERE tender_id = ?)", (tender_id,))
+                    conn.execute("DELETE FROM offers WHERE tender_id = ?", (tender_id,))
+                    conn.execute("UPDATE tenders SET name = ?, created_at = ? WHERE id = ?", (name, time.time(), tender_id))
+                else:
+                    tender_id = conn.execute("INSERT INTO tenders (key, name, created_at) VALUES (?, ?, ?)",
+                                             (key, name, time.time())).lastrowid
+
+                canonical_names = list({group["canonical_name"] for group in groups})
+                conn.executemany("INSERT OR IGNORE INTO canonical_items (name) VALUES (?)", [(n,) for n in canonical_names])
+                canonical_ids = dict(self._select_in(conn, "SELECT name, id FROM canonical_items WHERE name IN ({})",
+                                                     canonical_names))
+
+                aliases, offers = {}, []
+                for cluster, group in zip(clusters, groups):
+                    canonical_id = canonical_ids[group["canonical_name"]]
+                    for alias in _alias_keys(cluster):
+                        aliases[alias] = canonical_id
+                    for i in cluster["item_ids"]:
+                        item = items[i]
+                        offers.append((tender_id, canonical_id, item.supplier, item.name, item.sku,
+                                       _number(item.quantity), item.unit, _number(item.price_per_unit)))
+                conn.executemany("INSERT OR REPLACE INTO aliases (key, canonical_id) VALUES (?, ?)", aliases.items())
+
+                # Номера строк назначаем сами, чтобы заполнить полнотекстовый индекс тем же executemany
+                first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM offers").fetchone()[0]
+                conn.executemany("INSERT INTO offers (id, tender_id, canonical_id, supplier, name, sku, quantity, unit, "
+                                 "price_per_unit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(first_id + n, *offer) for n, offer in enumerate(offers)])
+                conn.executemany("INSERT INTO offers_fts (rowid, name, sku) VALUES (?, ?, ?)",
+                                 [(first_id + n, offer[3], offer[4]) for n, offer in enumerate(offers)])
+        except sqlite3.Error as e:
+            print(f"Не удалось сохранить тендер в историю предложений: {e}")
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Каноничные наименования, у которых есть позиции с такими словами в названии или артикуле."""
+        if not self.enabled:
+            return []
+        tokens = FTS_TOKEN.findall(query or "")
+        if not tokens:
+            return []
+        match = " AND ".join(f'"{token}"*' for token in tokens)  # Каждое слово — как префикс
+        try:
+            rows = self._connection().execute(
+                "SELECT c.name FROM offers_fts f JOIN offers o ON o.id = f.rowid "
+                "JOIN canonical_items c ON c.id = o.canonical_id WHERE offers_fts MATCH ? "
+                "GROUP BY c.id ORDER BY COUNT(*) DESC LIMIT ?", (match, limit)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Ошибка поиска по истории предложений: {e}")
+            return []
+        return [row[0] for row in rows]
+
+    def price_history(self, canonical_name: str) -> list:
+        """Все сохраненные предложения по каноничному товару, от старых к новым."""
+        if not self.enabled:
+            return []
+        try:
+            rows = self._connection().execute(
+                "SELECT t.created_at, t.name, o.supplier, o.name, o.price_per_unit FROM canonical_items c "
+                "JOIN offers o ON o.canonical_id = c.id JOIN tenders t ON t.id = o.tender_id "
+                "WHERE c.name = ? ORDER BY t.created_at, o.supplier", (canonical_name,)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Ошибка чтения истории цен: {e}")
+            return []
+        return [{"created_at": created_at, "tender": tender, "supplier": supplier, "name": name, "price_per_unit": price}
+                for created_at, tender, supplier, name, price in rows]
+
+
+offer_store = OfferStore(os.getenv("OFFER_STORE_PATH", ""))
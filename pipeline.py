@@ -0,0 +1,398 @@
+# pipeline.py
+
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import sys
+from dataclasses import replace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import document_parser
+import llm_handler
+import ocr
+from document_parser import parse_document
+from llm_rows import ExtractedItem, to_dicts, validate_rows
+from llm_handler import (
+    extract_data_from_text, stream_extract_data_from_text, group_items, generate_tender_insight,
+    generate_search_query, analyze_search_results, LLM_MAX_WORKERS, LLM_REQUESTS_PER_MINUTE
+)
+from rate_limit import RateLimiter
+from internet_search import google_search
+from item_matching import clusters_to_groups
+from offer_store import offer_store
+from tender_optimizer import optimize_comparison
+from table_extractor import extract_items_from_tables, STRUCTURED_MIN_CONFIDENCE
+from instrumentation import span, recorder, ContextThreadPoolExecutor
+
+SUPPORTED_EXTENSIONS = (".pdf", ".xlsx", ".docx")
+CHECKPOINT_DIR = ".checkpoints"
+REPORT_FILENAME = "tender_expert_report.xlsx"
+INSIGHT_FILENAME = "insight.txt"
+MARKET_MEDIAN_COLUMN = "Медиана рынка"
+# Сколько наименований одновременно проверяем по рынку (запрос, поиск и анализ выдачи для каждого)
+SEARCH_MAX_WORKERS = int(os.getenv("SEARCH_MAX_WORKERS", "4"))
+
+
+def get_supplier_name(filename: str) -> str:
+    """Имя поставщика берем из имени файла (без расширения)."""
+    return filename.split('.')[0]
+
+
+def file_digest(filename: str, file_data: bytes) -> str:
+    """Хэш имени и содержимого файла: по имени определяется поставщик, по содержимому — его позиции."""
+    return hashlib.sha256(os.path.basename(filename).encode("utf-8") + b"\0" + file_data).hexdigest()
+
+
+def process_file(file_info: dict, on_item=None) -> tuple:
+    """
+    Извлекает товарные позиции из одного файла.
+    Таблицы (XLSX, DOCX, PDF) с распознанными колонками разбираются без LLM; модель вызывается,
+    только если структуру таблиц определить не удалось, и получает компактный текст без служебных строк.
+    Если передан on_item(item), позиции отдаются в него по мере извлечения (ответ модели читается потоково).
+    Возвращает (позиции, complete); complete=False — ответ модели оборван или испорчен и позиции неполные,
+    такой результат не стоит сохранять как окончательный.
+    """
+    filename, file_data = file_info["name"], file_info["data"]
+    supplier_name = get_supplier_name(filename)
+    document = parse_document(io.BytesIO(file_data), filename)
+    with span("extract", file=filename) as extract_span:
+        items, confidence = extract_items_from_tables(document.tables)
+        structured = bool(items) and confidence >= STRUCTURED_MIN_CONFIDENCE
+        extract_span.attributes.update(structured=structured, confidence=round(confidence, 3))
+        complete = True
+        if structured:
+            items = [replace(item, supplier=supplier_name) for item in items]
+            if on_item:
+                for item in items: on_item(item)
+        elif on_item is None:
+            items, complete = extract_data_from_text(document.to_prompt_text(), supplier_name)
+        else:
+            items = []
+            stream = stream_extract_data_from_text(document.to_prompt_text(), supplier_name)
+            while True:
+                try:
+                    item = next(stream)
+                except StopIteration as stop:
+                    complete = stop.value  # Генератор возвращает признак полноты ответа
+                    break
+                items.append(item)
+                on_item(item)
+        extract_span.attributes.update(items=len(items), complete=complete)
+        return items, complete
+
+
+def extract_items_from_files(files_to_process: list, max_workers: int = None, on_progress=None, on_item=None) -> list:
+    """
+    Параллельно обрабатывает файлы (не более max_workers одновременно).
+    Возвращает список результатов в том же порядке, что и входные файлы.
+    on_progress(filename, items, complete) — файл обработан; complete=False, если ответ модели оборван и дочитать
+    его не удалось или извлечение прервалось ошибкой (тогда items — только позиции, успевшие прийти потоково). on_item(filename, item) — извлечена очередная позиция.
+    Оба обратных вызова выполняются в вызывающем потоке (события передаются через очередь),
+    поэтому из них можно безопасно писать в интерфейс Streamlit.
+    """
+    results = [[] for _ in files_to_process]
+    if not files_to_process:
+        return results
+    events = queue.Queue()
+
+    def run(i: int):
+        streamed = []
+
+        def emit(item):
+            streamed.append(item)
+            events.put(("item", i, item))
+
+        try:
+            items, complete = process_file(files_to_process[i], emit if on_item else None)
+        except Exception as e:
+            print(f"Ошибка при обработке файла {files_to_process[i]['name']}: {e}")
+            # Позиции, которые уже показаны пользователю, не выбрасываем: файл просто помечается неполным
+            items, complete = streamed, False
+        events.put(("done", i, (items, complete)))
+
+    with ContextThreadPoolExecutor(max_workers=max_workers or LLM_MAX_WORKERS) as executor:
+        for i in range(len(files_to_process)):
+            executor.submit(run, i)
+        remaining = len(files_to_process)
+        while remaining:
+            kind, i, payload = events.get()
+            filename = files_to_process[i]["name"]
+            if kind == "item":
+                on_item(filename, payload)
+                continue
+            results[i], complete = payload
+            remaining -= 1
+            if on_progress:
+                on_progress(filename, results[i], complete)
+    return results
+
+
+def extract_new_items(files_to_process: list, file_results: dict, max_workers: int = None, on_progress=None,
+                      on_item=None) -> list:
+    """
+    extract_items_from_files с учетом уже обработанных файлов.
+    file_results — {file_digest: позиции} из прошлых запусков (например, из состояния сессии); обрабатываются
+    только новые и измененные файлы, для остальных позиции берутся из file_results (on_progress вызывается сразу).
+    file_results обновляется на месте: записи файлов, которых больше нет в наборе, удаляются.
+    """
+    digests = [file_digest(f["name"], f["data"]) for f in files_to_process]
+    for digest in set(file_results) - set(digests):
+        del file_results[digest]
+    pending = [i for i, digest in enumerate(digests) if digest not in file_results]
+    results = [file_results.get(digest, []) for digest in digests]
+    for i, digest in enumerate(digests):
+        if digest in file_results and on_progress:
+            on_progress(files_to_process[i]["name"], results[i], True)
+
+    incomplete = set()
+
+    def progress(filename, items, complete):
+        if not complete:
+            incomplete.add(filename)
+        if on_progress:
+            on_progress(filename, items, complete)
+
+    extracted = extract_items_from_files([files_to_process[i] for i in pending], max_workers, progress, on_item)
+    for i, items in zip(pending, extracted):
+        results[i] = items
+        # Файл, из которого ничего не извлеклось или извлеклось не все, попробуем еще раз при следующем запуске
+        if items and files_to_process[i]["name"] not in incomplete:
+            file_results[digests[i]] = items
+    return results
+
+
+def build_comparison_table(groups: list, suppliers: list) -> pd.DataFrame:
+    """Сравнительная таблица: строка на товар, колонка с ценой за единицу на каждого поставщика."""
+    table_data = []
+    for group in groups:
+        row = {"Номенклатура": group['canonical_name']}
+        offers_by_supplier = {offer['supplier']: offer.get('price_per_unit') for offer in group['offers']}
+        for supplier in suppliers:
+            price = offers_by_supplier.get(supplier)
+            row[supplier] = float(price) if price is not None else np.nan
+        table_data.append(row)
+    return pd.DataFrame(table_data)
+
+
+def compare_items(all_items: list, previous_grouping: dict = None, tender_name: str = None, **constraints):
+    """
+    Группирует извлеченные позиции, строит сравнительную таблицу, считает оптимальную закупку и инсайт.
+    previous_grouping — "grouping" из прошлого результата по этому же тендеру: группировка тогда достраивается
+    только для новых позиций (см. group_items).
+    tender_name — под каким именем сохранить тендер в историю предложений (если она включена).
+    constraints — ограничения оптимизации (max_suppliers, min_order, full_coverage_only), см. tender_optimizer.
+    Возвращает {"df", "insight_text", "suppliers", "optimization", "grouping"} или None,
+    если позиции сгруппировать не удалось.
+    """
+    clusters = group_items(all_items, previous_grouping)
+    normalized_data = clusters_to_groups(all_items, clusters)
+    if not normalized_data:
+        return None
+    if offer_store.enabled:
+        with span("store", items=len(all_items)):
+            offer_store.save_tender(all_items, clusters, tender_name)
+    suppliers = sorted(set(item.supplier for item in all_items))
+    df = build_comparison_table(normalized_data, suppliers)
+    with span("optimize", rows=len(df), suppliers=len(suppliers)):
+        optimization = optimize_comparison(df, suppliers, **constraints)
+    insight_text = generate_tender_insight(optimization)
+    return {"df": df, "insight_text": insight_text, "suppliers": suppliers, "optimization": optimization,
+            "grouping": {"items": all_items, "clusters": clusters}}
+
+
+def offer_prices(offers: list) -> list:
+    """Положительные цены из найденных предложений (MarketOffer)."""
+    return [offer.price for offer in offers if offer.price is not None and offer.price > 0]
+
+
+def search_market_price(item_name: str):
+    """Запрос, поиск и анализ выдачи для одного наименования. Возвращает медиану найденных цен или None."""
+    search_results = google_search(generate_search_query(item_name))
+    prices = offer_prices(analyze_search_results(search_results, item_name)) if search_results else []
+    return float(np.median(prices)) if prices else None
+
+
+def search_market_prices(item_names: list, max_workers: int = None, on_progress=None) -> dict:
+    """
+    Медианы рыночных цен для списка наименований; наименования обрабатываются параллельно.
+    on_progress(item_name, price) вызывается в вызывающем потоке по мере готовности.
+    """
+    unique_names = list(dict.fromkeys(item_names))
+    prices = {}
+    with ContextThreadPoolExecutor(max_workers=max_workers or SEARCH_MAX_WORKERS) as executor:
+        futures = {executor.submit(search_market_price, name): name for name in unique_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                prices[name] = future.result()
+            except Exception as e:
+                print(f"Ошибка при поиске цены на рынке для {name}: {e}")
+                prices[name] = None
+            if on_progress:
+                on_progress(name, prices[name])
+    return prices
+
+
+def add_market_median(df: pd.DataFrame, max_workers: int = None, on_progress=None) -> pd.DataFrame:
+    """Добавляет в сравнительную таблицу колонку с медианой рыночной цены по каждой позиции."""
+    prices = search_market_prices(df["Номенклатура"].tolist(), max_workers, on_progress)
+    df = df.copy()
+    df[MARKET_MEDIAN_COLUMN] = df["Номенклатура"].map(prices).astype(float)
+    return df
+
+
+def to_excel(df: pd.DataFrame):
+    output = io.BytesIO()
+    df_for_excel = df.fillna('')
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        df_for_excel.to_excel(writer, index=False, sheet_name='Сравнение')
+    return output.getvalue()
+
+
+# --- ПАКЕТНАЯ ОБРАБОТКА БЕЗ ИНТЕРФЕЙСА ---
+
+def find_tenders(source: str) -> dict:
+    """
+    Тендеры для пакетной обработки: {имя тендера: [пути к файлам КП]}.
+    source — каталог (каждый подкаталог — тендер; файлы в корне каталога — отдельный тендер с его именем)
+    или манифест JSON вида {"тендер": ["путь", ...]} (относительные пути — от каталога манифеста).
+    """
+    if os.path.isfile(source):
+        with open(source, encoding="utf-8") as f:
+            manifest = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(source))
+        return {tender: [os.path.join(base_dir, path) for path in paths] for tender, paths in manifest.items()}
+
+    def offer_files(directory):
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.lower().endswith(SUPPORTED_EXTENSIONS) and os.path.isfile(os.path.join(directory, name)))
+
+    tenders = {}
+    root_files = offer_files(source)
+    if root_files:
+        tenders[os.path.basename(os.path.abspath(source))] = root_files
+    for name in sorted(os.listdir(source)):
+        path = os.path.join(source, name)
+        if os.path.isdir(path) and not name.startswith("."):
+            files = offer_files(path)
+            if files:
+                tenders[name] = files
+    return tenders
+
+
+def _checkpoint_path(tender_dir: str, file_path: str, file_data: bytes) -> str:
+    """Чекпойнт файла привязан к его имени и содержимому: измененный файл будет обработан заново."""
+    return os.path.join(tender_dir, CHECKPOINT_DIR, f"{file_digest(file_path, file_data)}.json")
+
+
+def _init_worker(requests_per_minute: float):
+    """Инициализация процесса-воркера: общий лимит частоты делится между процессами, PDF и OCR — без вложенного пула."""
+    llm_handler.rate_limiter = RateLimiter(requests_per_minute)
+    document_parser.PDF_MAX_PROCESSES = 1
+    ocr.OCR_MAX_PROCESSES = 1
+
+
+def _process_path(file_path: str, checkpoint_path: str) -> list:
+    """
+    Работает в процессе-воркере: извлекает позиции файла и сохраняет чекпойнт.
+    Если позиций нет (ошибка API, пустой ответ модели) или они неполные (ответ оборван), чекпойнт не пишется —
+    файл обработается при следующем запуске.
+    """
+    with open(file_path, "rb") as f:
+        items, complete = process_file({"name": os.path.basename(file_path), "data": f.read()})
+    if not complete:
+        print(f"Файл {file_path} обработан не полностью, чекпойнт не сохранен")
+    if not items or not complete:
+        return items
+    os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+    tmp_path = f"{checkpoint_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(to_dicts(items), f, ensure_ascii=False)
+    os.replace(tmp_path, checkpoint_path)  # Атомарно: прерванная запись не оставит битый чекпойнт
+    return items
+
+
+def run_batch(tenders: dict, output_dir: str, workers: int = None, resume: bool = True) -> dict:
+    """
+    Обрабатывает тендеры пулом процессов: файлы всех тендеров извлекаются параллельно, результат каждого файла
+    сохраняется в чекпойнт (при resume=True уже обработанные файлы пропускаются), затем для каждого тендера
+    строятся сравнительная таблица, отчет Excel и инсайт в output_dir/<тендер>/.
+    Возвращает {тендер: путь к отчету или None, если сравнить не удалось}.
+    """
+    workers = workers or os.cpu_count() or 1
+    file_items, jobs = {}, []
+    for tender, paths in tenders.items():
+        tender_dir = os.path.join(output_dir, tender)
+        for path in paths:
+            with open(path, "rb") as f:
+                checkpoint = _checkpoint_path(tender_dir, path, f.read())
+            if resume and os.path.exists(checkpoint):
+                with open(checkpoint, encoding="utf-8") as f:
+                    file_items[path] = validate_rows(json.load(f), ExtractedItem)
+            else:
+                jobs.append((path, checkpoint))
+    print(f"Тендеров: {len(tenders)}, файлов к обработке: {len(jobs)}, из чекпойнтов: {len(file_items)}")
+
+    if jobs:
+        # spawn: как и для PDF, не форкаем процесс с запущенными потоками
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(LLM_REQUESTS_PER_MINUTE / workers,)) as executor:
+            futures = {executor.submit(_process_path, path, checkpoint): path for path, checkpoint in jobs}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    file_items[path] = future.result()
+                    print(f"[{done}/{len(jobs)}] {path}: позиций — {len(file_items[path])}")
+                except Exception as e:
+                    print(f"[{done}/{len(jobs)}] Ошибка при обработке файла {path}: {e}")
+
+    reports = {}
+    for tender, paths in tenders.items():
+        recorder.start_run()
+        all_items = [item for path in paths for item in file_items.get(path, [])]
+        try:
+            result = compare_items(all_items, tender_name=tender) if all_items else None
+        except Exception as e:
+            # Ошибка одного тендера не должна останавливать отчеты по остальным
+            print(f"Тендер {tender}: ошибка при сравнении позиций: {e}")
+            result = None
+        if result is None:
+            print(f"Тендер {tender}: не удалось извлечь или сгруппировать позиции")
+            reports[tender] = None
+            continue
+        tender_dir = os.path.join(output_dir, tender)
+        os.makedirs(tender_dir, exist_ok=True)
+        report_path = os.path.join(tender_dir, REPORT_FILENAME)
+        with open(report_path, "wb") as f:
+            f.write(to_excel(result["df"]))
+        with open(os.path.join(tender_dir, INSIGHT_FILENAME), "w", encoding="utf-8") as f:
+            f.write(result["insight_text"])
+        recorder.export()
+        reports[tender] = report_path
+        print(f"Тендер {tender}: позиций — {len(result['df'])}, отчет — {report_path}")
+    return reports
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Пакетное сравнение коммерческих предложений без интерфейса")
+    parser.add_argument("source", help="Каталог с тендерами (подкаталог — тендер) или манифест JSON")
+    parser.add_argument("-o", "--output", default="reports", help="Каталог для отчетов и чекпойнтов")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Число процессов (по умолчанию — число ядер)")
+    parser.add_argument("--no-resume", action="store_true", help="Игнорировать чекпойнты и обработать все файлы заново")
+    args = parser.parse_args(argv)
+
+    tenders = find_tenders(args.source)
+    if not tenders:
+        print(f"В {args.source} не найдено файлов КП ({', '.join(SUPPORTED_EXTENSIONS)})")
+        return 1
+    reports = run_batch(tenders, args.output, args.workers, resume=not args.no_resume)
+    return 0 if all(reports.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# prompt_serializer.py
+
+import math
+import os
+import threading
+from text_chunker import estimate_tokens
+
+# Бюджет входных токенов на один запрос к модели
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "30000"))
+# Считать токены через API (model.count_tokens) вместо локальной оценки — точнее, но это лишний запрос
+LLM_COUNT_TOKENS_REMOTE = os.getenv("LLM_COUNT_TOKENS_REMOTE", "0") == "1"
+
+
+class PromptTooLargeError(ValueError):
+    """Промпт не помещается в бюджет токенов."""
+
+
+def format_number(value) -> str:
+    """Число без лишних нулей и пробелов: 1500.0 -> "1500", 1500.505 -> "1500.51"; NaN/None -> ""."""
+    if value is None or isinstance(value, bool):
+        return "" if value is None else str(value)
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+            return ""
+        rounded = round(float(value), 2)
+        return str(int(rounded)) if rounded.is_integer() else f"{rounded:.2f}".rstrip("0")
+    return str(value)
+
+
+def _cell(value) -> str:
+    """Значение ячейки TSV: числа нормализуются, табуляции и переводы строк заменяются пробелами."""
+    if isinstance(value, (list, tuple)):
+        return " / ".join(_cell(v) for v in value)
+    text = format_number(value)
+    return " ".join(text.split()) if ("\t" in text or "\n" in text) else text.strip()
+
+
+def rows_to_tsv(rows: list) -> str:
+    """Строки (списки значений) в TSV."""
+    return "\n".join("\t".join(_cell(value) for value in row) for row in rows)
+
+
+def records_to_tsv(records: list, columns: list = None) -> str:
+    """
+    Список словарей в TSV с одной строкой заголовка вместо повторения ключей в каждой записи.
+    Колонки, пустые во всех записях, опускаются.
+    """
+    if columns is None:
+        columns = list(dict.fromkeys(key for record in records for key in record))
+    columns = [c for c in columns if any(_cell(record.get(c)) for record in records)]
+    return rows_to_tsv([columns] + [[record.get(c) for c in columns] for record in records])
+
+
+def frame_to_tsv(df) -> str:
+    """DataFrame в TSV без индекса и без выравнивающих пробелов (в отличие от to_string)."""
+    return rows_to_tsv([list(df.columns)] + [list(row) for row in df.itertuples(index=False, name=None)])
+
+
+def fit_tsv_to_budget(tsv: str, budget_tokens: int) -> str:
+    """Обрезает TSV по строкам (заголовок сохраняется), чтобы он поместился в бюджет, и отмечает число опущенных строк."""
+    lines = tsv.split("\n")
+    kept, used = [], 0
+    for i, line in enumerate(lines):
+        line_tokens = estimate_tokens(line)
+        if i > 0 and used + line_tokens > budget_tokens:
+            kept.append(f"... еще строк: {len(lines) - i}")
+            break
+        kept.append(line)
+        used += line_tokens
+    return "\n".join(kept)
+
+
+def count_prompt_tokens(prompt: str, llm=None) -> int:
+    """Число входных токенов: через model.count_tokens (если включено) или локальной оценкой."""
+    if LLM_COUNT_TOKENS_REMOTE and llm is not None:
+        try:
+            return llm.count_tokens(prompt).total_tokens
+        except Exception as e:
+            print(f"Не удалось посчитать токены через API, используем оценку: {e}")
+    return estimate_tokens(prompt)
+
+
+def enforce_budget(prompt: str, llm=None, budget: int = None) -> int:
+    """Проверяет, что промпт помещается в бюджет; возвращает число токенов или бросает PromptTooLargeError."""
+    budget = budget or LLM_PROMPT_TOKEN_BUDGET
+    tokens = count_prompt_tokens(prompt, llm)
+    if tokens > budget:
+        raise PromptTooLargeError(f"Промпт занимает ~{tokens} токенов при бюджете {budget}")
+    return tokens
+
+
+class TokenUsage:
+    """Учет токенов по операциям (extract, normalize, ...): число вызовов, входные и выходные токены."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = {}
+
+    def record(self, operation: str, input_tokens: int, output_tokens: int):
+        with self._lock:
+            stats = self._usage.setdefault(operation, {"calls": 0, "input_tokens": 0, "output_tokens": 0})
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+
+    def record_response(self, operation: str, response, estimated_input_tokens: int) -> tuple:
+        """Берет фактические токены из response.usage_metadata; если их нет — локальную оценку."""
+        usage = getattr(response, "usage_metadata", None)
+        input_tokens = getattr(usage, "prompt_token_count", None) or estimated_input_tokens
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        if output_tokens is None:
+            try:
+                output_tokens = estimate_tokens(response.text)
+            except (AttributeError, ValueError):
+                output_tokens = 0
+        self.record(operation, input_tokens, output_tokens)
+        return input_tokens, output_tokens
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {operation: dict(stats) for operation, stats in self._usage.items()}
+
+    def reset(self):
+        with self._lock:
+            self._usage.clear()
+
+
+token_usage = TokenUsage()
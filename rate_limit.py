@@ -0,0 +1,24 @@
+# rate_limit.py
+
+import threading
+import time
+
+
+class RateLimiter:
+    """Ограничивает частоту запросов к API: не чаще N запросов в минуту на весь процесс."""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        """Блокирует поток до момента, когда можно отправить следующий запрос."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
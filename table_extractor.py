@@ -0,0 +1,179 @@
+# table_extractor.py
+
+import os
+import re
+import pandas as pd
+from llm_rows import ExtractedItem
+
+# Словари заголовков колонок (русские и английские). Порядок важен: более конкретные поля проверяются раньше,
+# а колонка достается первому подошедшему полю ("Стоимость за ед." — это цена, а не сумма).
+HEADER_PATTERNS = {
+    "sku": r"артикул|\bарт\b|\bкод\b|каталожн|\bsku\b|article|part\s*(?:no|number)|\bp/n\b|\bcode\b",
+    "price_per_unit": r"цена|(?:стоимость|сумма).*(?:ед|шт)|за\s*ед|price|\brate\b",
+    "total_price": r"сумма|итог|всего|стоимость|total|amount",
+    "quantity": r"кол-?во|количеств|\bкол\b|\bqty\b|quantity",
+    "unit": r"ед\.?\s*изм|единиц|^ед\.?$|\bunit\b|\buom\b",
+    "name": r"наименование|название|товар|продукц|номенклатур|описание|\bname\b|description|\bitem\b|product",
+}
+FIELDS = ["name", "sku", "quantity", "unit", "price_per_unit", "total_price"]
+NUMERIC_FIELDS = ["quantity", "price_per_unit", "total_price"]
+
+# Строки итогов и налогов, которые не являются товарными позициями
+SUMMARY_ROW = re.compile(r"^\s*(итог\w*|всего|в\s*т\.?\s*ч|ндс|сумма|total|subtotal|vat)\b", re.IGNORECASE)
+
+HEADER_SCAN_ROWS = 20  # Сколько первых строк таблицы просматриваем в поисках заголовка
+STRUCTURED_MIN_CONFIDENCE = float(os.getenv("STRUCTURED_MIN_CONFIDENCE", "0.7"))
+
+
+def _header_matches(head: pd.DataFrame) -> dict:
+    """Для каждого поля — булева таблица: какие ячейки первых строк похожи на его заголовок."""
+    cells = head.apply(lambda col: col.astype(str).str.strip().str.lower())
+    return {field: cells.apply(lambda col: col.str.contains(pattern, regex=True, na=False))
+            for field, pattern in HEADER_PATTERNS.items()}
+
+
+def detect_header_row(frame: pd.DataFrame):
+    """
+    Ищет строку заголовка среди первых HEADER_SCAN_ROWS строк.
+    Возвращает (номер строки, {поле: номер колонки}) или (None, {}), если заголовок не найден.
+    """
+    head = frame.head(HEADER_SCAN_ROWS).fillna("")
+    if head.empty:
+        return None, {}
+    matches = _header_matches(head)
+    # Сколько разных полей узнается в каждой строке (векторно по всем строкам сразу)
+    scores = sum(match.any(axis=1).astype(int) for match in matches.values())
+    best_row = int(scores.idxmax())
+    if scores[best_row] < 2:
+        return None, {}
+
+    position = head.index.get_loc(best_row)
+    mapping, used_columns = {}, set()
+    for field in HEADER_PATTERNS:
+        row_hits = matches[field].iloc[position]
+        for col_pos, hit in enumerate(row_hits.tolist()):
+            if hit and col_pos not in used_columns:
+                mapping[field] = col_pos
+                used_columns.add(col_pos)
+                break
+    if "name" not in mapping or not ({"price_per_unit", "total_price"} & mapping.keys()):
+        return None, {}
+    return position, mapping
+
+
+def _to_number(series: pd.Series) -> pd.Series:
+    """Векторно превращает строки вида "1 500,50 руб." в числа; нечисловые значения -> NaN."""
+    text = series.astype(str).str.replace(r"[^\d,.\-]", "", regex=True)
+    # "1,500.50": запятая — разделитель тысяч; "1500,50": запятая — десятичный разделитель
+    text = text.where(~text.str.contains(r"\.", regex=True), text.str.replace(",", "", regex=False))
+    text = text.str.replace(",", ".", regex=False)
+    return pd.to_numeric(text, errors="coerce")
+
+
+def _prepare_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """Без пустых строк и колонок, колонки пронумерованы подряд."""
+    frame = frame.dropna(how="all").dropna(axis=1, how="all").reset_index(drop=True)
+    frame.columns = range(frame.shape[1])
+    return frame
+
+
+def extract_items_from_frame(frame: pd.DataFrame):
+    """
+    Извлекает позиции из таблицы без заголовка колонок (header=None).
+    Возвращает (список позиций ExtractedItem, как у extract_data_from_text, уверенность от 0 до 1).
+    """
+    frame = _prepare_frame(frame)
+    header_position, mapping = detect_header_row(frame)
+    if header_position is None:
+        return [], 0.0
+    return _items_from_body(frame.iloc[header_position + 1:], mapping)
+
+
+def _items_from_body(body: pd.DataFrame, mapping: dict):
+    """Позиции из строк таблицы под заголовком; mapping — {поле: номер колонки}. Возвращает (позиции, уверенность)."""
+    columns = {field: body.iloc[:, col_pos] for field, col_pos in mapping.items()}
+    names = columns["name"].fillna("").astype(str).str.strip()
+    numbers = {field: _to_number(columns[field]) for field in NUMERIC_FIELDS if field in columns}
+
+    price = numbers.get("price_per_unit")
+    total = numbers.get("total_price")
+    quantity = numbers.get("quantity")
+    if price is None:
+        price = total / quantity if quantity is not None else total
+    elif total is not None and quantity is not None:
+        price = price.fillna(total / quantity)
+    if quantity is not None:
+        numbers["total_price"] = total.fillna(price * quantity) if total is not None else price * quantity
+
+    non_empty = body.notna().any(axis=1) & (names != "")
+    is_item = non_empty & ~names.str.match(SUMMARY_ROW) & price.notna()
+    candidate_rows = int((non_empty & ~names.str.match(SUMMARY_ROW)).sum())
+    if not is_item.any():
+        return [], 0.0
+
+    items = []
+    for idx in body.index[is_item]:
+        values = {"name": names[idx]}
+        for field in FIELDS[1:]:
+            if field in NUMERIC_FIELDS:
+                value = price[idx] if field == "price_per_unit" else (numbers[field][idx] if field in numbers else None)
+                values[field] = None if value is None or pd.isna(value) else float(value)
+            else:
+                value = columns[field][idx] if field in columns else None
+                values[field] = None if value is None or pd.isna(value) or str(value).strip() == "" else str(value).strip()
+        items.append(ExtractedItem(**values))
+
+    # Уверенность: доля непустых строк, ставших позициями; без колонки цены за единицу — ниже
+    confidence = len(items) / candidate_rows if candidate_rows else 0.0
+    if "price_per_unit" not in mapping:
+        confidence *= 0.8
+    return items, confidence
+
+
+def _candidate_rows(frame: pd.DataFrame) -> int:
+    """Сколько строк таблицы могли бы быть позициями (непустые и не итоги)."""
+    first_cells = frame.iloc[:, 0].fillna("").astype(str) if frame.shape[1] else pd.Series(dtype=str)
+    return int((frame.notna().any(axis=1) & ~first_cells.str.match(SUMMARY_ROW)).sum())
+
+
+def _combine(results: list, unmapped_rows: int = 0):
+    """
+    Объединяет результаты нескольких таблиц: уверенность — взвешенная по числу позиций.
+    unmapped_rows — строки таблиц, которые не удалось сопоставить с колонками (снижают уверенность).
+    """
+    results = [(items, confidence) for items, confidence in results if items]
+    if not results:
+        return [], 0.0
+    all_items = [item for items, _ in results for item in items]
+    confidence = sum(len(items) * confidence for items, confidence in results) / (len(all_items) + unmapped_rows)
+    return all_items, confidence
+
+
+def extract_items_from_tables(tables: list):
+    """
+    Извлекает позиции из таблиц документа (DocumentTable из document_parser) без обращения к LLM.
+    Таблица без своего заголовка с тем же числом колонок, что и предыдущая таблица с заголовком, считается
+    ее продолжением (таблица КП, перенесенная на следующую страницу PDF без повтора шапки).
+    Возвращает (позиции, уверенность); если ни в одной таблице нет распознанного заголовка — ([], 0.0).
+    """
+    results, unmapped_rows = [], 0
+    header = None  # (mapping, число колонок) последней таблицы с заголовком
+    for table in tables:
+        frame = _prepare_frame(pd.DataFrame(table.rows).replace("", None))
+        if frame.empty:
+            continue
+        header_position, mapping = detect_header_row(frame)
+        if header_position is not None:
+            header = (mapping, frame.shape[1])
+            results.append(_items_from_body(frame.iloc[header_position + 1:], mapping))
+        elif header and header[1] == frame.shape[1]:
+            items, confidence = _items_from_body(frame, header[0])
+            if items:
+                results.append((items, confidence))
+            else:
+                unmapped_rows += _candidate_rows(frame)
+        elif header:
+            # Таблица после таблицы позиций, которую не удалось сопоставить с колонками: возможно, это
+            # продолжение с другой разметкой — такие строки снижают уверенность, чтобы сработал запасной путь LLM
+            unmapped_rows += _candidate_rows(frame)
+    return _combine(results, unmapped_rows)
@@ -0,0 +1,203 @@
+# tender_optimizer.py
+
+import itertools
+from dataclasses import dataclass, field
+import numpy as np
+from prompt_serializer import format_number
+
+# Полный перебор наборов поставщиков при ограничении max_suppliers, пока матрица перебора не больше этого числа
+# элементов (строки × наборы × размер набора); иначе — жадный выбор с улучшением заменами
+EXACT_SEARCH_MAX_CELLS = 5_000_000
+TOP_SAVINGS_ROWS = 5
+
+
+@dataclass
+class OptimizationResult:
+    """Итоги оптимизации закупки по матрице цен (строки — товары, колонки — поставщики)."""
+    suppliers: list
+    totals: dict                   # Сумма по каждому поставщику (только по позициям, которые он предложил)
+    coverage: dict                 # Сколько позиций предложил каждый поставщик
+    rows: int                      # Позиций с хотя бы одним предложением
+    best_supplier: str = None      # Лучший поставщик при закупке целиком у одного
+    best_supplier_total: float = 0.0
+    split_total: float = 0.0       # Сумма при оптимальном разделении закупки
+    split_covered: int = 0         # Сколько позиций покрыто при разделении
+    split_savings: float = 0.0     # Экономия разделения относительно лучшего поставщика (по его позициям)
+    split_allocation: dict = field(default_factory=dict)  # Поставщик -> {"rows": ..., "total": ...}
+    top_savings: list = field(default_factory=list)       # Позиции с наибольшей выгодой от разделения
+    constraints: dict = field(default_factory=dict)
+    assignment: np.ndarray = None  # Номер выбранного поставщика по каждой строке (-1 — не покрыта)
+
+    def to_prompt_text(self) -> str:
+        """Компактная сводка для модели: только посчитанные числа, без всей таблицы."""
+        lines = ["Поставщик\tПозиций\tСумма"]
+        lines += [f"{s}\t{self.coverage[s]} из {self.rows}\t{format_number(self.totals[s])}" for s in self.suppliers]
+        lines.append("")
+        if self.best_supplier is not None:
+            lines.append(f"Лучший поставщик целиком: {self.best_supplier}, сумма {format_number(self.best_supplier_total)}, "
+                         f"позиций {self.coverage[self.best_supplier]} из {self.rows}")
+        lines.append(f"Оптимальное разделение: сумма {format_number(self.split_total)}, позиций {self.split_covered} "
+                     f"из {self.rows}, экономия относительно лучшего поставщика {format_number(self.split_savings)}")
+        for supplier, allocation in self.split_allocation.items():
+            lines.append(f"- у {supplier}: позиций {allocation['rows']}, сумма {format_number(allocation['total'])}")
+        if self.top_savings:
+            lines.append("Позиции с наибольшей выгодой (товар, у кого брать, цена, цена лучшего поставщика):")
+            lines += [f"- {row['name']}\t{row['supplier']}\t{format_number(row['price'])}\t{format_number(row['best_supplier_price'])}"
+                      for row in self.top_savings]
+        if self.constraints:
+            lines.append("Ограничения: " + ", ".join(f"{k}={v}" for k, v in self.constraints.items()))
+        return "\n".join(lines)
+
+    def to_text(self) -> str:
+        """Вывод без модели (если она недоступна)."""
+        if self.best_supplier is None:
+            return "Нет данных для сравнения поставщиков."
+        text = (f"Самая низкая общая сумма у поставщика {self.best_supplier}: {self.best_supplier_total:,.2f} ₽. ")
+        if self.split_savings > 0:
+            parts = ", ".join(f"{s} ({a['rows']} поз.)" for s, a in self.split_allocation.items())
+            text += (f"Разделив закупку ({parts}), можно сэкономить еще {self.split_savings:,.2f} ₽ "
+                     f"(итого {self.split_total:,.2f} ₽).")
+        else:
+            text += "Разделение закупки между поставщиками дополнительной экономии не дает."
+        return text
+
+
+def _cheapest(prices: np.ndarray, columns) -> tuple:
+    """Для каждой строки — минимальная цена среди колонок columns и номер колонки (-1, если предложений нет)."""
+    sub = prices[:, columns]
+    has_offer = ~np.isnan(sub)
+    best = np.argmin(np.where(has_offer, sub, np.inf), axis=1)
+    covered = has_offer.any(axis=1)
+    chosen = np.where(covered, np.asarray(columns)[best], -1)
+    return np.where(covered, sub[np.arange(len(sub)), best], 0.0), chosen
+
+
+def _best_subset(prices: np.ndarray, candidates: list, size: int) -> list:
+    """
+    Набор не более size поставщиков с максимальным покрытием, а при равном покрытии — с минимальной суммой.
+    Небольшие задачи решаются полным перебором (векторно), большие — жадно с улучшением заменами.
+    """
+    size = min(size, len(candidates))
+    filled = np.where(np.isnan(prices), np.inf, prices)
+
+    def score(columns) -> tuple:
+        row_min = filled[:, list(columns)].min(axis=1)
+        covered = np.isfinite(row_min)
+        return -int(covered.sum()), float(row_min[covered].sum())
+
+    combos_count = 1
+    for i in range(size):
+        combos_count = combos_count * (len(candidates) - i) // (i + 1)
+    if combos_count * len(prices) * size <= EXACT_SEARCH_MAX_CELLS:
+        combos = np.array(list(itertools.combinations(candidates, size)))
+        row_mins = filled[:, combos].min(axis=2)            # строки × наборы
+        covered = np.isfinite(row_mins)
+        sums = np.where(covered, row_mins, 0.0).sum(axis=0)
+        order = np.lexsort((sums, -covered.sum(axis=0)))     # сначала покрытие, затем сумма
+        return list(combos[order[0]])
+
+    chosen = []
+    while len(chosen) < size:
+        remaining = [c for c in candidates if c not in chosen]
+        chosen.append(min(remaining, key=lambda c: score(chosen + [c])))
+    improved = True
+    while improved:
+        improved = False
+        for i, current in enumerate(list(chosen)):
+            for candidate in candidates:
+                if candidate in chosen:
+                    continue
+                trial = chosen[:i] + [candidate] + chosen[i + 1:]
+                if score(trial) < score(chosen):
+                    chosen, improved = trial, True
+    return chosen
+
+
+def optimize_purchase(prices, suppliers: list, names: list = None, quantities=None, max_suppliers: int = None,
+                      min_order: float = 0.0, full_coverage_only: bool = False) -> OptimizationResult:
+    """
+    Считает по матрице цен за единицу (NaN — нет предложения): минимум по строкам, лучшего поставщика целиком,
+    оптимальное разделение закупки и экономию от него.
+    quantities — количество по строкам (по умолчанию 1, как в итогах сравнительной таблицы).
+    Ограничения: max_suppliers — не больше стольких поставщиков в разделении; min_order — минимальная сумма
+    заказа у поставщика (поставщики с меньшей долей исключаются, их позиции переходят к следующим по цене);
+    full_coverage_only — лучшим поставщиком целиком считается только тот, кто предложил все позиции.
+    """
+    prices = np.asarray(prices, dtype=float)
+    if prices.ndim != 2 or prices.shape[1] != len(suppliers):
+        raise ValueError("Матрица цен должна иметь по колонке на каждого поставщика")
+    names = list(names) if names is not None else [str(i + 1) for i in range(len(prices))]
+    if quantities is not None:
+        quantities = np.nan_to_num(np.asarray(quantities, dtype=float), nan=1.0)
+        prices = prices * quantities[:, None]
+
+    # Строки без единого предложения в расчете не участвуют
+    quoted = ~np.isnan(prices)
+    keep = quoted.any(axis=1)
+    prices, quoted = prices[keep], quoted[keep]
+    names = [name for name, k in zip(names, keep) if k]
+    rows = len(prices)
+
+    totals_arr = np.nansum(prices, axis=0)
+    coverage_arr = quoted.sum(axis=0)
+    constraints = {k: v for k, v in {"max_suppliers": max_suppliers, "min_order": min_order,
+                                     "full_coverage_only": full_coverage_only}.items() if v}
+    result = OptimizationResult(
+        suppliers=list(suppliers),
+        totals={s: float(t) for s, t in zip(suppliers, totals_arr)},
+        coverage={s: int(c) for s, c in zip(suppliers, coverage_arr)},
+        rows=rows,
+        constraints=constraints,
+    )
+    if rows == 0:
+        return result
+
+    # Лучший поставщик целиком: больше позиций, затем меньше сумма; при full_coverage_only — только полное покрытие
+    eligible = np.flatnonzero(coverage_arr == rows) if full_coverage_only else np.flatnonzero(coverage_arr > 0)
+    if len(eligible):
+        best = eligible[np.lexsort((totals_arr[eligible], -coverage_arr[eligible]))[0]]
+        result.best_supplier = suppliers[best]
+        result.best_supplier_total = float(totals_arr[best])
+
+    # Оптимальное разделение
+    candidates = list(range(len(suppliers)))
+    if max_suppliers and max_suppliers < len(candidates):
+        candidates = _best_subset(prices, candidates, max_suppliers)
+    row_price, assignment = _cheapest(prices, candidates)
+    if min_order:
+        while True:
+            allocated = np.bincount(assignment[assignment >= 0], weights=row_price[assignment >= 0],
+                                    minlength=len(suppliers))
+            small = [c for c in candidates if 0 < allocated[c] < min_order]
+            if not small or len(candidates) == 1:
+                break
+            # Убираем поставщика с самой маленькой долей и перераспределяем его позиции
+            candidates.remove(min(small, key=lambda c: allocated[c]))
+            row_price, assignment = _cheapest(prices, candidates)
+
+    covered = assignment >= 0
+    result.assignment = assignment
+    result.split_total = float(row_price[covered].sum())
+    result.split_covered = int(covered.sum())
+    result.split_allocation = {
+        suppliers[c]: {"rows": int((assignment == c).sum()), "total": float(row_price[assignment == c].sum())}
+        for c in np.unique(assignment[covered])
+    }
+
+    if result.best_supplier is not None:
+        # Экономию сравниваем на позициях, которые есть у лучшего поставщика
+        best_prices = prices[:, best]
+        comparable = covered & ~np.isnan(best_prices)
+        savings = np.where(comparable, np.nan_to_num(best_prices) - row_price, 0.0)
+        result.split_savings = float(savings.sum())
+        for i in np.argsort(-savings)[:TOP_SAVINGS_ROWS]:
+            if savings[i] <= 0:
+                break
+            result.top_savings.append({"name": names[i], "supplier": suppliers[assignment[i]],
+                                       "price": float(row_price[i]), "best_supplier_price": float(best_prices[i])})
+    return result
+
+
+def optimize_comparison(df, suppliers: list, **constraints) -> OptimizationResult:
+    """optimize_purchase для сравнительной таблицы (колонка "Номенклатура" и колонки поставщиков)."""
+    return optimize_purchase(df[suppliers].to_numpy(dtype=float), suppliers, df["Номенклатура"].tolist(), **constraints)
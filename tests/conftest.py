@@ -0,0 +1,100 @@
+# tests/conftest.py
+
+import io
+import re
+import threading
+import time
+import types
+import pytest
+from docx import Document
+import llm_handler
+from llm_cache import llm_cache
+from offer_store import offer_store
+from rate_limit import RateLimiter
+
+ANALYSIS_TEXT = re.compile(r"ТЕКСТ ДЛЯ АНАЛИЗА:\s*---\s*(.*?)\s*---", re.DOTALL)
+
+
+class StubResponse:
+    """Ответ generate_content: текст, причина остановки (MAX_TOKENS — ответ оборван) и без usage_metadata."""
+
+    def __init__(self, text: str, finish_reason: str = "STOP"):
+        self.text = text
+        self.candidates = [types.SimpleNamespace(finish_reason=types.SimpleNamespace(name=finish_reason))]
+        self.usage_metadata = None
+
+
+class StubStream(list):
+    """Потоковый ответ: список фрагментов текста; исключение среди фрагментов обрывает поток этой ошибкой."""
+    usage_metadata = None
+
+    def __iter__(self):
+        for chunk in super().__iter__():
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield types.SimpleNamespace(text=chunk)
+
+
+class StubModel:
+    """
+    Заглушка model.generate_content с искусственной задержкой latency.
+    reply(prompt) возвращает текст ответа, StubResponse, StubStream или исключение (оно пробрасывается как ошибка API).
+    Считает вызовы и наибольшее число одновременных запросов.
+    """
+
+    def __init__(self, reply, latency: float = 0.0):
+        self.reply = reply
+        self.latency = latency
+        self.prompts = []
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        with self._lock:
+            self.prompts.append(prompt)
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            time.sleep(self.latency)
+            response = self.reply(prompt)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        if isinstance(response, Exception):
+            raise response
+        if isinstance(response, str):
+            response = StubResponse(response)
+        if stream and not isinstance(response, StubStream):
+            return StubStream(response.text[i:i + 16] for i in range(0, len(response.text), 16))
+        return response
+
+
+def analysis_text(prompt: str) -> str:
+    """Текст документа из промпта извлечения."""
+    match = ANALYSIS_TEXT.search(prompt)
+    return match.group(1) if match else ""
+
+
+def make_docx(paragraphs: list) -> bytes:
+    """DOCX без таблиц: позиции из него извлекаются только моделью."""
+    document = Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """Подменяет модель заглушкой без сети, лимита частоты, кэша LLM и истории предложений."""
+    monkeypatch.setattr(llm_handler, "rate_limiter", RateLimiter(0))
+    monkeypatch.setattr(llm_cache, "enabled", False)
+    monkeypatch.setattr(offer_store, "enabled", False)
+
+    def install(reply, latency: float = 0.0) -> StubModel:
+        model = StubModel(reply, latency)
+        monkeypatch.setattr(llm_handler, "model", model)
+        return model
+    return install
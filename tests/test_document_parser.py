@@ -0,0 +1,88 @@
+# tests/test_document_parser.py
+
+import io
+import multiprocessing
+import time
+import fitz
+from document_parser import _filter_boilerplate, _page_text, iter_pdf_pages_parallel
+
+
+def page(number: int, body: list) -> tuple:
+    """Страница КП с одинаковыми колонтитулами сверху и снизу."""
+    lines = ["ООО «Альфа Снаб» — коммерческое предложение"] + body + [f"Стр. {number} из 3", "Поставка по всей России"]
+    return number, "\n".join(lines)
+
+
+def test_repeated_edge_lines_are_dropped():
+    pages = [page(n, [f"Подшипник 62{n}5 — 10 шт — 150 руб."]) for n in (1, 2, 3)]
+    text, dropped = _filter_boilerplate(pages)
+
+    assert "Альфа Снаб" not in text
+    assert "Поставка по всей России" not in text
+    assert "Стр. 1 из 3" not in text
+    assert dropped == 9
+    assert text == "\n".join(f"--- Страница {n} ---\nПодшипник 62{n}5 — 10 шт — 150 руб." for n in (1, 2, 3))
+
+
+def test_repeated_lines_in_the_middle_of_page_are_kept():
+    # Одинаковая позиция на каждой странице посреди таблицы — это данные, а не колонтитул
+    body = ["Позиция 1", "Позиция 2", "Позиция 3", "Болт М10 оцинкованный", "Позиция 4", "Позиция 5", "Позиция 6"]
+    pages = [page(n, body) for n in (1, 2, 3)]
+    text, _ = _filter_boilerplate(pages)
+
+    assert text.count("Болт М10 оцинкованный") == 3
+
+
+def test_short_and_numeric_edge_lines_are_kept():
+    pages = [(n, "\n".join(["шт", "1 500,00 руб.", f"Позиция {n}", "10%", "Итого"])) for n in (1, 2, 3)]
+    text, dropped = _filter_boilerplate(pages)
+
+    assert dropped == 0
+    assert text.count("1 500,00 руб.") == 3
+    assert text.count("шт") == 3 and text.count("10%") == 3 and text.count("Итого") == 3
+
+
+def test_repetition_needs_at_least_three_pages():
+    pages = [page(n, ["Болт М10"]) for n in (1, 2)]
+    text, dropped = _filter_boilerplate(pages)
+
+    assert text.count("Альфа Снаб") == 2
+    assert dropped == 2  # Только номера страниц — они убираются по шаблону на любой странице
+
+
+def test_requisites_are_dropped_on_any_page():
+    text, dropped = _filter_boilerplate([(1, "ИНН 7700000000 КПП 770001001\nБолт М10 — 150 руб.\nС уважением, Иванов")])
+
+    assert text == "--- Страница 1 ---\nБолт М10 — 150 руб."
+    assert dropped == 2
+
+
+def test_item_lines_with_requisite_words_are_kept():
+    lines = ["Труба стальная 57х3,5 120 м.п. 850 руб.", "Телефон Panasonic KX-TS2350 2 шт 3500 руб.",
+             "Факс Panasonic KX-FT982", "Тел.: +7 (495) 123-45-67, факс 8 (495) 123-45-68",
+             "р/с 40702810900000000001 в ПАО Сбербанк", "М.П."]
+    text, dropped = _filter_boilerplate([(1, "\n".join(lines))])
+
+    assert text == "--- Страница 1 ---\n" + "\n".join(lines[:3])
+    assert dropped == 3
+
+
+def slow_page_text(page) -> str:
+    """Обработчик страницы для воркеров пула: первая страница "зависает"."""
+    if page.number == 0:
+        time.sleep(30)
+    return _page_text(page)
+
+
+def test_parallel_pdf_timeout_stops_workers():
+    with fitz.open() as document:
+        for number in range(4):
+            document.new_page().insert_text((72, 72), f"Страница {number + 1}")
+        data = io.BytesIO(document.tobytes())
+
+    started = time.monotonic()
+    pages = list(iter_pdf_pages_parallel(data, timeout=3, processes=2, page_handler=slow_page_text))
+
+    assert pages == []  # Первый диапазон не успел: остальные страницы по порядку не отдаются
+    assert time.monotonic() - started < 15
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,78 @@
+# tests/test_item_matching.py
+
+from item_matching import merge_clusters, pre_group_items, update_clusters
+from llm_rows import ExtractedItem, ItemGroup
+
+
+def offer(supplier: str, name: str, sku: str = None, price: float = 100.0) -> ExtractedItem:
+    return ExtractedItem(name=name, sku=sku, price_per_unit=price, supplier=supplier)
+
+
+ITEMS = [
+    offer("Альфа", "Подшипник 6205-2RS", "6205-2RS", 300.0),
+    offer("Бета", "Подшипник шариковый 6205 2RS", "6205-2RS", 310.0),
+    offer("Альфа", "Болт М10х40 оцинкованный", None, 12.0),
+    offer("Бета", "Болт оцинкованный М10х40", None, 11.5),
+]
+
+
+def previous_grouping() -> list:
+    clusters = pre_group_items(ITEMS)
+    clusters[0]["canonical_name"] = "Подшипник 6205-2RS"
+    return clusters
+
+
+def test_pre_group_items_joins_by_sku_and_name():
+    clusters = pre_group_items(ITEMS)
+
+    assert [cluster["item_ids"] for cluster in clusters] == [[0, 1], [2, 3]]
+    assert clusters[0]["suppliers"] == {"Альфа", "Бета"}
+
+
+def test_unchanged_items_keep_clusters_and_canonical_name():
+    clusters, new_ids = update_clusters(list(reversed(ITEMS)), ITEMS, previous_grouping())
+
+    assert new_ids == set()
+    assert [cluster["item_ids"] for cluster in clusters] == [[0, 1], [2, 3]]
+    assert clusters[1]["canonical_name"] == "Подшипник 6205-2RS"
+    assert "canonical_name" not in clusters[0]
+
+
+def test_new_supplier_joins_existing_cluster_by_exact_key():
+    items = ITEMS + [offer("Гамма", "Подшипник 6205-2RS", "6205-2RS", 295.0),
+                              offer("Гамма", "Гайка М10 DIN 934", None, 3.0)]
+    clusters, new_ids = update_clusters(items, ITEMS, previous_grouping())
+
+    assert clusters[0]["item_ids"] == [0, 1, 4]
+    assert clusters[0]["suppliers"] == {"Альфа", "Бета", "Гамма"}
+    assert clusters[0]["canonical_name"] == "Подшипник 6205-2RS"
+    assert new_ids == {2}  # Только новая гайка требует сопоставления моделью
+    assert clusters[2]["item_ids"] == [5]
+
+
+def test_changed_file_items_leave_their_clusters():
+    # Бета прислала новую версию КП: старые позиции ушли, подшипник подорожал
+    items = ITEMS[:1] + ITEMS[2:3] + [offer("Бета", "Подшипник шариковый 6205 2RS", "6205-2RS", 330.0)]
+    clusters, new_ids = update_clusters(items, ITEMS, previous_grouping())
+
+    assert [cluster["item_ids"] for cluster in clusters] == [[0, 2], [1]]
+    assert new_ids == set()
+
+
+def test_same_supplier_item_is_not_added_to_cluster_with_that_supplier():
+    items = ITEMS + [offer("Альфа", "Подшипник 6205-2RS", "6205-2RS", 280.0)]
+    clusters, new_ids = update_clusters(items, ITEMS, previous_grouping())
+
+    assert clusters[0]["item_ids"] == [0, 1]
+    assert new_ids == {2}
+    assert clusters[2]["item_ids"] == [4]
+
+
+def test_merge_clusters_rejects_groups_with_common_supplier():
+    clusters = pre_group_items([offer("Альфа", "Кабель ВВГнг 3х2.5"), offer("Бета", "Кабель ВВГ-нг 3*2,5"),
+                                offer("Альфа", "Кабель ВВГнг-LS 3х2.5")])
+    merged = merge_clusters(clusters, [ItemGroup(canonical_name="Кабель ВВГнг 3х2,5", ids=(0, 1, 2))])
+
+    assert [cluster["item_ids"] for cluster in merged] == [[0, 1], [2]]
+    assert merged[0]["canonical_name"] == "Кабель ВВГнг 3х2,5"
+    assert "canonical_name" not in merged[1]
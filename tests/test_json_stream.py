@@ -0,0 +1,44 @@
+# tests/test_json_stream.py
+
+import pytest
+from json_stream import JsonArrayStreamParser, iter_json_array, parse_json_array
+
+RESPONSE = '```json\n[{"name": "Болт {М10}", "sku": "B\\"10"}, {"name": "Гайка", "dims": {"d": 10}}]\n```'
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 16])
+def test_objects_are_returned_as_soon_as_they_close(size):
+    parser = JsonArrayStreamParser()
+    batches = [parser.feed(RESPONSE[i:i + size]) for i in range(0, len(RESPONSE), size)]
+
+    assert [obj for batch in batches for obj in batch] == [{"name": "Болт {М10}", "sku": 'B"10'},
+                                                           {"name": "Гайка", "dims": {"d": 10}}]
+    assert parser.done
+    # Первый объект отдается во фрагменте с его закрывающей скобкой, не дожидаясь конца ответа
+    first_close = RESPONSE.index('"}, {') + 1
+    assert batches[first_close // size] == [{"name": "Болт {М10}", "sku": 'B"10'}]
+
+
+def test_parser_is_not_done_on_truncated_array():
+    parser = JsonArrayStreamParser()
+
+    assert parser.feed('[{"name": "Болт"}, {"name": "Гай') == [{"name": "Болт"}]
+    assert not parser.done
+    assert parser.feed('ка"}]') == [{"name": "Гайка"}]
+    assert parser.done
+    assert parser.feed(', {"name": "лишнее"}]') == []
+
+
+def test_broken_object_is_skipped():
+    assert list(iter_json_array(['[{"name": "A"}, {"name": "B",}, ', '{"name": "C"}]'])) == [{"name": "A"}, {"name": "C"}]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('[{"name": "A"}, {"name": "B"}]', ([{"name": "A"}, {"name": "B"}], True)),
+    ('{"name": "A"}', ([{"name": "A"}], True)),
+    ('Вот результат: [{"name": "A"}, {"name": "B"', ([{"name": "A"}], False)),
+    ("не JSON", ([], False)),
+    ("", ([], False)),
+])
+def test_parse_json_array(text, expected):
+    assert parse_json_array(text) == expected
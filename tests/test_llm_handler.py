@@ -0,0 +1,134 @@
+# tests/test_llm_handler.py
+
+import json
+import re
+from google.api_core import exceptions as google_exceptions
+import llm_handler
+from conftest import StubResponse
+from llm_handler import continue_json_array, extract_data_from_text, generate_json_array, stream_extract_data_from_text
+from item_matching import pre_group_items
+from llm_rows import ExtractedItem, ItemGroup
+
+PROMPT = "ТЕКСТ ДЛЯ АНАЛИЗА:\n---\nБолт, гайка, шайба\n---"
+
+
+def replies(*responses):
+    """reply для заглушки модели: ответы по очереди."""
+    queue = list(responses)
+    return lambda prompt: queue.pop(0)
+
+
+def test_truncated_answer_is_continued(stub_llm):
+    model = stub_llm(replies(
+        StubResponse('```json\n[{"name": "Болт М10", "quantity": "10", "price_per_unit": "1 500,50 руб."}, {"name": "Гай',
+                     "MAX_TOKENS"),
+        # Продолжение начинается с повтора последнего полученного элемента — он отбрасывается
+        StubResponse('[{"name": "Болт М10", "quantity": 10, "price_per_unit": 1500.5}, {"name": "Гайка"}, '
+                     '{"name": "Шайба", "sku": "W1"}]')))
+    rows, complete = generate_json_array(PROMPT, "extract", ExtractedItem)
+
+    assert complete
+    assert rows == [ExtractedItem(name="Болт М10", quantity=10.0, price_per_unit=1500.5),
+                    ExtractedItem(name="Гайка"), ExtractedItem(name="Шайба", sku="W1")]
+    assert len(model.prompts) == 2
+    assert "ПРОДОЛЖЕНИЕ" in model.prompts[1] and '"Болт М10"' in model.prompts[1]
+
+
+def test_closed_array_cut_by_token_limit_is_continued(stub_llm):
+    model = stub_llm(replies(StubResponse('[{"name": "Болт"}]', "MAX_TOKENS"), StubResponse('[{"name": "Гайка"}]')))
+    rows, complete = generate_json_array(PROMPT, "extract", ExtractedItem)
+
+    assert complete and [row.name for row in rows] == ["Болт", "Гайка"]
+    assert len(model.prompts) == 2
+
+
+def test_continuation_stops_when_nothing_new_arrives(stub_llm):
+    # Модель повторяет уже полученный элемент и снова обрывается — новых запросов не делаем
+    model = stub_llm(replies(StubResponse('[{"name": "Гайка"}, {"na', "MAX_TOKENS"),
+                             StubResponse('[{"name": "Шайба"}]')))
+    added, complete = continue_json_array(PROMPT, [ExtractedItem(name="Болт"), ExtractedItem(name="Гайка")], "extract", ExtractedItem)
+
+    assert added == []
+    assert not complete
+    assert len(model.prompts) == 1
+
+
+def test_continuation_is_limited(stub_llm, monkeypatch):
+    monkeypatch.setattr(llm_handler, "LLM_MAX_CONTINUATIONS", 2)
+    count = iter(range(100))
+    model = stub_llm(lambda prompt: StubResponse(f'[{{"name": "Позиция {next(count)}"}}', "MAX_TOKENS"))
+    added, complete = continue_json_array(PROMPT, [ExtractedItem(name="Болт")], "extract", ExtractedItem)
+
+    assert [row.name for row in added] == ["Позиция 0", "Позиция 1"]
+    assert not complete
+    assert len(model.prompts) == 2
+
+
+def test_continuation_error_keeps_received_rows(stub_llm):
+    stub_llm(replies(StubResponse('[{"name": "Болт"}, {"name": "Гай', "MAX_TOKENS"),
+                     google_exceptions.InvalidArgument("bad request")))
+    rows, complete = generate_json_array(PROMPT, "extract", ExtractedItem)
+
+    assert rows == [ExtractedItem(name="Болт")]
+    assert not complete
+
+
+def test_unparsable_answer_returns_none(stub_llm):
+    stub_llm(replies("Извините, не могу помочь"))
+
+    assert generate_json_array(PROMPT, "extract", ExtractedItem) == (None, False)
+
+
+def test_stream_extraction_continues_truncated_stream(stub_llm):
+    model = stub_llm(replies('[{"name": "Болт", "price_per_unit": 10}, {"name": "Гай',
+                             '[{"name": "Гайка", "price_per_unit": "2,5"}]'))
+    items = list(stream_extract_data_from_text("Болт 10 руб., гайка 2,5 руб.", "Альфа"))
+
+    assert items == [ExtractedItem(name="Болт", price_per_unit=10.0, supplier="Альфа"),
+                     ExtractedItem(name="Гайка", price_per_unit=2.5, supplier="Альфа")]
+    assert len(model.prompts) == 2
+
+
+def test_failed_window_keeps_rows_of_other_windows(stub_llm, monkeypatch):
+    monkeypatch.setattr(llm_handler, "EXTRACT_CHUNK_TOKENS", 60)
+    monkeypatch.setattr(llm_handler, "LLM_MAX_RETRIES", 0)
+    pages = [f"--- Страница {n} ---\n" + "\n".join(f"Позиция {n}-{i} — 10 шт — 150 руб." for i in range(4))
+             for n in (1, 2, 3)]
+
+    def reply(prompt):
+        if "Позиция 2-" in prompt:
+            return google_exceptions.ResourceExhausted("quota exceeded")
+        names = sorted(set(re.findall(r"Позиция \d-\d", prompt)))
+        return json.dumps([{"name": name, "price_per_unit": 150} for name in names], ensure_ascii=False)
+
+    stub_llm(reply)
+    items, complete = extract_data_from_text("\n".join(pages), "Альфа")
+
+    assert not complete
+    names = [item.name for item in items]
+    assert "Позиция 1-0" in names and "Позиция 3-3" in names
+    assert not any(name.startswith("Позиция 2-") for name in names)
+
+
+def test_grouping_survives_exhausted_quota(stub_llm, monkeypatch):
+    monkeypatch.setattr(llm_handler, "LLM_MAX_RETRIES", 0)
+    model = stub_llm(lambda prompt: google_exceptions.ResourceExhausted("quota exceeded"))
+    items = [ExtractedItem(name="Подшипник 6205-2RS", price_per_unit=300, supplier="Альфа"),
+             ExtractedItem(name="Подшипник шариковый 6205", price_per_unit=310, supplier="Бета")]
+
+    groups = llm_handler.normalize_and_group_items(items)
+
+    assert len(model.prompts) == 1
+    assert sorted(len(group["offers"]) for group in groups) == [1, 1]  # Без ответа модели позиции не объединены
+
+
+def test_groups_keep_only_ids_of_their_batch(stub_llm):
+    stub_llm(lambda prompt: json.dumps([{"canonical_name": "Кабель ВВГнг 3х2,5", "ids": [0, 1, 2, 7]},
+                                        {"canonical_name": "Гайка", "ids": [1, 9]}], ensure_ascii=False))
+    items = [ExtractedItem(name="Кабель ВВГнг 3х2.5", supplier="Альфа"),
+             ExtractedItem(name="Кабель ВВГ-нг 3*2,5", supplier="Бета"),
+             ExtractedItem(name="Гайка М10", supplier="Гамма")]
+
+    # Номер 2 относится к другой порции, 7 и 9 модель выдумала
+    assert llm_handler._group_batch(items, pre_group_items(items), [0, 1]) == [
+        ItemGroup(canonical_name="Кабель ВВГнг 3х2,5", ids=(0, 1))]
@@ -0,0 +1,35 @@
+# tests/test_llm_rows.py
+
+import pytest
+from llm_rows import ExtractedItem, ItemGroup, MarketOffer, parse_number, to_dicts, validate_rows
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1500.5, 1500.5), ("1 500,50 руб.", 1500.5), ("1,500.50", 1500.5), ("10 шт.", 10.0),
+    (True, None), ("нет", None), (None, None), (float("nan"), None),
+])
+def test_parse_number(value, expected):
+    assert parse_number(value) == expected
+
+
+def test_rows_are_typed_and_slotted():
+    rows = validate_rows([{"name": " Болт М10 ", "quantity": "10", "price_per_unit": "1 500,50 руб.", "extra": 1},
+                          {"name": ""}, "не объект", {"sku": "B10"}], ExtractedItem)
+
+    assert rows == [ExtractedItem(name="Болт М10", quantity=10.0, price_per_unit=1500.5)]
+    assert not hasattr(rows[0], "__dict__")
+
+
+def test_rows_survive_json_boundary():
+    rows = [ExtractedItem(name="Болт", sku="B10", price_per_unit=12.5, supplier="Альфа"), ExtractedItem(name="Гайка")]
+
+    assert to_dicts(rows) == [{"name": "Болт", "sku": "B10", "price_per_unit": 12.5, "supplier": "Альфа"},
+                              {"name": "Гайка"}]
+    assert validate_rows(to_dicts(rows), ExtractedItem) == rows
+
+
+def test_group_and_offer_validation():
+    assert validate_rows([{"canonical_name": "Болт", "ids": [0, "3", "x"]}, {"ids": [1]}], ItemGroup) == [
+        ItemGroup(canonical_name="Болт", ids=(0, 3))]
+    assert validate_rows([{"supplier_name": "Альфа", "price": "99,90"}, {"snippet": "без ссылки"}], MarketOffer) == [
+        MarketOffer(supplier_name="Альфа", price=99.9)]
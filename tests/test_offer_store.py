@@ -0,0 +1,76 @@
+# tests/test_offer_store.py
+
+import pytest
+from item_matching import pre_group_items
+from llm_rows import ExtractedItem, ItemGroup
+from offer_store import OfferStore
+
+
+def offer(supplier: str, name: str, sku: str = None, price: float = 100.0) -> ExtractedItem:
+    return ExtractedItem(name=name, sku=sku, quantity=2.0, unit="шт", price_per_unit=price, supplier=supplier)
+
+
+FIRST_TENDER = [
+    offer("Альфа", "Подшипник 6205-2RS", "6205-2RS", 300.0),
+    offer("Бета", "Подшипник 6205-2RS", None, 310.0),
+    offer("Альфа", "Кабель ВВГнг 3х2.5", None, 95.0),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = OfferStore(str(tmp_path / "history" / "offers.sqlite"))
+    clusters = pre_group_items(FIRST_TENDER)
+    clusters[0]["canonical_name"] = "Подшипник 6205 2RS"
+    store.save_tender(FIRST_TENDER, clusters, "Тендер 1")
+    return store
+
+
+def test_known_keys_resolve_to_canonical_name(store):
+    # Следующий тендер: тот же артикул у нового поставщика и тот же кабель у двух поставщиков
+    items = [offer("Гамма", "Подшипник шариковый", "6205-2RS"), offer("Гамма", "Кабель ВВГнг 3х2.5"),
+             offer("Дельта", "Кабель ВВГнг 3х2.5"), offer("Дельта", "Гайка М10")]
+    clusters = [dict(pre_group_items([item])[0], item_ids=[i]) for i, item in enumerate(items)]
+
+    assert store.resolve(clusters) == [ItemGroup(canonical_name="Подшипник 6205 2RS", ids=(0,)),
+                                       ItemGroup(canonical_name="Кабель ВВГнг 3х2.5", ids=(1, 2))]
+
+
+def test_clusters_of_one_supplier_are_not_joined(store):
+    items = [offer("Гамма", "Кабель ВВГнг 3х2.5"), offer("Гамма", "кабель  ввгнг 3х2.5")]
+    clusters = [dict(pre_group_items([item])[0], item_ids=[i]) for i, item in enumerate(items)]
+
+    assert store.resolve(clusters) == [ItemGroup(canonical_name="Кабель ВВГнг 3х2.5", ids=(0,)),
+                                       ItemGroup(canonical_name="Кабель ВВГнг 3х2.5", ids=(1,))]
+
+
+def test_search_by_name_prefix_and_sku(store):
+    assert store.search("подшип") == ["Подшипник 6205 2RS"]
+    assert store.search("6205") == ["Подшипник 6205 2RS"]
+    assert store.search("ВВГнг 3") == ["Кабель ВВГнг 3х2.5"]
+    assert store.search("гайка") == []
+    assert store.search("   ") == []
+
+
+def test_price_history_and_resave_without_duplicates(store):
+    clusters = pre_group_items(FIRST_TENDER)
+    clusters[0]["canonical_name"] = "Подшипник 6205 2RS"
+    store.save_tender(FIRST_TENDER, clusters, "Тендер 1 (повторно)")
+    second = [offer("Гамма", "Подшипник 6205-2RS", "6205-2RS", 290.0)]
+    store.save_tender(second, pre_group_items(second), "Тендер 2")
+
+    history = store.price_history("Подшипник 6205 2RS")
+    assert [(row["tender"], row["supplier"], row["price_per_unit"]) for row in history] == [
+        ("Тендер 1 (повторно)", "Альфа", 300.0), ("Тендер 1 (повторно)", "Бета", 310.0)]
+    # Кластер второго тендера без имени от модели сохранен под своим наименованием, синоним переназначен на него
+    assert [row["price_per_unit"] for row in store.price_history("Подшипник 6205-2RS")] == [290.0]
+    assert store.search("6205") == ["Подшипник 6205 2RS", "Подшипник 6205-2RS"]
+
+
+def test_disabled_store_does_nothing(tmp_path):
+    store = OfferStore("")
+    store.save_tender(FIRST_TENDER, pre_group_items(FIRST_TENDER))
+
+    assert store.resolve(pre_group_items(FIRST_TENDER)) == []
+    assert store.search("подшипник") == []
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,156 @@
+# tests/test_pipeline.py
+
+import json
+import os
+import time
+import pandas as pd
+import pipeline
+from google.api_core import exceptions as google_exceptions
+from conftest import StubResponse, StubStream, analysis_text, make_docx
+from llm_rows import ExtractedItem, to_dicts
+from pipeline import _checkpoint_path, _process_path, extract_items_from_files, extract_new_items, run_batch
+
+LATENCY = 0.3
+
+
+def offer_file(supplier: str, rows: int = 3) -> dict:
+    """КП без таблиц: строки "наименование | количество | цена" разбирает только модель."""
+    lines = [f"Товар {supplier}-{i} | {i + 1} | {100 * (i + 1)}" for i in range(rows)]
+    return {"name": f"{supplier}.docx", "data": make_docx(lines)}
+
+
+def reply_with_items(prompt: str) -> str:
+    """Ответ модели: позиции из строк текста документа в порядке их следования."""
+    items = []
+    for line in analysis_text(prompt).splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3:
+            items.append({"name": parts[0], "quantity": parts[1], "price_per_unit": parts[2]})
+    return json.dumps(items, ensure_ascii=False)
+
+
+def test_files_are_extracted_concurrently_in_input_order(stub_llm):
+    files = [offer_file(supplier) for supplier in ("Альфа", "Бета", "Гамма", "Дельта")]
+
+    def slow_first(prompt):
+        # Первый файл отвечает дольше остальных: порядок результатов не должен зависеть от порядка завершения
+        if "Альфа" in prompt:
+            time.sleep(LATENCY)
+        return reply_with_items(prompt)
+
+    model = stub_llm(slow_first, latency=LATENCY)
+    progress = []
+    started = time.monotonic()
+    results = extract_items_from_files(files, max_workers=4,
+                                       on_progress=lambda name, items, complete: progress.append((name, complete)))
+    elapsed = time.monotonic() - started
+
+    assert [[item.supplier for item in items] for items in results] == [
+        [supplier] * 3 for supplier in ("Альфа", "Бета", "Гамма", "Дельта")]
+    assert [item.name for item in results[1]] == ["Товар Бета-0", "Товар Бета-1", "Товар Бета-2"]
+    assert results[0][2].quantity == 3.0 and results[0][2].price_per_unit == 300.0
+    # Последовательно вышло бы не меньше 5 задержек (у первого файла двойная)
+    assert elapsed < 4 * LATENCY
+    assert 1 < model.max_in_flight <= 4
+    assert len(model.prompts) == 4
+    assert progress[-1] == ("Альфа.docx", True)
+    assert sorted(progress) == sorted((file["name"], True) for file in files)
+
+
+def test_max_workers_limits_requests_in_flight(stub_llm):
+    model = stub_llm(reply_with_items, latency=0.05)
+    results = extract_items_from_files([offer_file(str(i), rows=1) for i in range(4)], max_workers=1)
+
+    assert model.max_in_flight == 1
+    assert [items[0].name for items in results] == [f"Товар {i}-0" for i in range(4)]
+
+
+def test_streamed_items_reach_callback_before_file_is_done(stub_llm):
+    stub_llm(reply_with_items)
+    events = []
+    results = extract_items_from_files(
+        [offer_file("Альфа", rows=4)], max_workers=1,
+        on_progress=lambda name, items, complete: events.append(("done", name, len(items), complete)),
+        on_item=lambda name, item: events.append(("item", name, item.name)))
+
+    assert events == [("item", "Альфа.docx", f"Товар Альфа-{i}") for i in range(4)] + [("done", "Альфа.docx", 4, True)]
+    assert len(results[0]) == 4
+
+
+def test_stream_failure_keeps_received_items_and_marks_file_incomplete(stub_llm):
+    def broken_stream(prompt):
+        if "Бета" not in prompt:
+            return reply_with_items(prompt)
+        # Обрыв соединения после двух позиций: повторить запрос уже нельзя, позиции показаны пользователю
+        return StubStream(['[{"name": "Товар Бета-0", "price_per_unit": 100},',
+                           ' {"name": "Товар Бета-1", "price_per_unit": 200},',
+                           google_exceptions.ServiceUnavailable("connection reset")])
+
+    stub_llm(broken_stream)
+    progress = {}
+    streamed = []
+    results = extract_items_from_files(
+        [offer_file("Альфа"), offer_file("Бета")], max_workers=2,
+        on_progress=lambda name, items, complete: progress.update({name: complete}),
+        on_item=lambda name, item: streamed.append((name, item.name)))
+
+    assert progress == {"Альфа.docx": True, "Бета.docx": False}
+    assert [item.name for item in results[1]] == ["Товар Бета-0", "Товар Бета-1"]
+    assert ("Бета.docx", "Товар Бета-1") in streamed
+    assert len(results[0]) == 3
+
+
+def truncated_without_continuation(prompt):
+    """Ответ обрывается по лимиту токенов, а запрос продолжения завершается ошибкой API."""
+    if "ПРОДОЛЖЕНИЕ" in prompt:
+        return google_exceptions.InvalidArgument("bad request")
+    return StubResponse('[{"name": "Товар Альфа-0", "price_per_unit": 100}, {"name": "Товар Аль', "MAX_TOKENS")
+
+
+def test_truncated_answer_is_not_stored_as_complete(stub_llm):
+    stub_llm(truncated_without_continuation)
+    file_results, progress = {}, []
+    for on_item in (None, lambda name, item: None):  # Обычный и потоковый ответ модели
+        results = extract_new_items([offer_file("Альфа")], file_results, max_workers=1, on_item=on_item,
+                                    on_progress=lambda name, items, complete: progress.append(complete))
+
+        assert [item.name for item in results[0]] == ["Товар Альфа-0"]
+    assert progress == [False, False]
+    assert file_results == {}  # При следующем анализе файл будет извлечен заново
+
+
+def test_truncated_answer_is_not_checkpointed(stub_llm, tmp_path):
+    stub_llm(truncated_without_continuation)
+    path = tmp_path / "Альфа.docx"
+    path.write_bytes(offer_file("Альфа")["data"])
+    checkpoint = tmp_path / ".checkpoints" / "alpha.json"
+
+    assert [item.name for item in _process_path(str(path), str(checkpoint))] == ["Товар Альфа-0"]
+    assert not checkpoint.exists()
+    stub_llm(reply_with_items)
+    assert len(_process_path(str(path), str(checkpoint))) == 3
+    assert checkpoint.exists()
+
+
+def test_failed_tender_does_not_stop_batch(tmp_path, monkeypatch):
+    tenders, output_dir = {}, str(tmp_path / "reports")
+    for tender in ("Сбой", "Норма"):
+        path = tmp_path / f"{tender}.docx"
+        path.write_bytes(offer_file(tender)["data"])
+        tenders[tender] = [str(path)]
+        # Позиции берутся из чекпойнтов: пул процессов не запускается
+        checkpoint = _checkpoint_path(os.path.join(output_dir, tender), str(path), path.read_bytes())
+        os.makedirs(os.path.dirname(checkpoint))
+        with open(checkpoint, "w", encoding="utf-8") as f:
+            json.dump(to_dicts([ExtractedItem(name="Болт", price_per_unit=10.0, supplier=tender)]), f)
+
+    def compare(items, tender_name=None):
+        if tender_name == "Сбой":
+            raise RuntimeError("сбой сравнения")
+        return {"df": pd.DataFrame({"Товар": ["Болт"]}), "insight_text": "вывод"}
+
+    monkeypatch.setattr(pipeline, "compare_items", compare)
+    reports = run_batch(tenders, output_dir, workers=1)
+
+    assert reports["Сбой"] is None
+    assert os.path.isfile(reports["Норма"])
@@ -0,0 +1,95 @@
+# tests/test_table_extractor.py
+
+import pandas as pd
+import pytest
+from document_parser import DocumentTable
+from llm_rows import ExtractedItem
+from table_extractor import detect_header_row, extract_items_from_frame, extract_items_from_tables
+
+HEADER = ["№", "Наименование", "Артикул", "Кол-во", "Ед. изм.", "Цена, руб.", "Сумма, руб."]
+
+
+def body_rows(start: int, count: int) -> list:
+    return [[str(i), f"Подшипник {i}", f"6{i:03d}-2RS", "2", "шт", f"{100 + i},50", f"{2 * (100 + i) + 1},00"]
+            for i in range(start, start + count)]
+
+
+def test_header_found_below_title_rows():
+    frame = pd.DataFrame([["ООО Альфа", None, None, None, None, None, None],
+                          ["Коммерческое предложение №5", None, None, None, None, None, None],
+                          HEADER] + body_rows(1, 2))
+    position, mapping = detect_header_row(frame)
+
+    assert position == 2
+    assert mapping == {"sku": 2, "price_per_unit": 5, "total_price": 6, "quantity": 3, "unit": 4, "name": 1}
+
+
+def test_english_header_and_price_per_unit_before_total():
+    frame = pd.DataFrame([["Item", "Qty", "Unit price", "Amount"], ["Bearing 6205", "4", "1,500.50", "6,002.00"]])
+    position, mapping = detect_header_row(frame)
+
+    assert position == 0
+    assert mapping == {"name": 0, "quantity": 1, "price_per_unit": 2, "total_price": 3}
+
+
+@pytest.mark.parametrize("rows", [
+    [["Наименование", "Описание"], ["Болт", "М10"]],          # Нет колонки цены
+    [["Цена", "Сумма"], ["100", "200"]],                      # Нет колонки наименования
+    [["Болт М10", "10", "150"], ["Гайка М10", "10", "20"]],   # Нет заголовка вовсе
+])
+def test_no_header_without_name_and_price_columns(rows):
+    assert detect_header_row(pd.DataFrame(rows)) == (None, {})
+
+
+def test_frame_items_skip_summary_rows_and_parse_numbers():
+    frame = pd.DataFrame([HEADER] + body_rows(1, 2) + [
+        [None, "Итого", None, None, None, None, "406,00"],
+        [None, "В т.ч. НДС 20%", None, None, None, None, "67,67"],
+    ])
+    items, confidence = extract_items_from_frame(frame)
+
+    assert confidence == 1.0
+    assert items[0] == ExtractedItem(name="Подшипник 1", sku="6001-2RS", quantity=2.0, unit="шт",
+                                     price_per_unit=101.5, total_price=203.0)
+    assert [item.name for item in items] == ["Подшипник 1", "Подшипник 2"]
+
+
+def test_price_derived_from_total_lowers_confidence():
+    frame = pd.DataFrame([["Наименование", "Кол-во", "Сумма"], ["Болт М10", "4", "600"], ["Гайка М10", "5", "50"]])
+    items, confidence = extract_items_from_frame(frame)
+
+    assert [item.price_per_unit for item in items] == [150.0, 10.0]
+    assert confidence == pytest.approx(0.8)
+
+
+def test_continuation_table_uses_header_of_previous_page():
+    tables = [DocumentTable("Страница 1", [HEADER] + body_rows(1, 30)),
+              DocumentTable("Страница 2", body_rows(31, 20))]
+    items, confidence = extract_items_from_tables(tables)
+
+    assert len(items) == 50
+    assert items[30].name == "Подшипник 31" and items[30].sku == "6031-2RS"
+    assert items[-1].price_per_unit == 150.5
+    assert confidence == 1.0
+
+
+def test_continuation_with_other_layout_lowers_confidence():
+    other_layout = [row[:5] for row in body_rows(31, 20)]
+    items, confidence = extract_items_from_tables([DocumentTable("Страница 1", [HEADER] + body_rows(1, 30)),
+                                                   DocumentTable("Страница 2", other_layout)])
+
+    assert len(items) == 30
+    assert confidence == pytest.approx(30 / 50)
+
+
+def test_tables_before_first_header_are_ignored():
+    tables = [DocumentTable("Страница 1", [["ИНН", "7700000000"], ["КПП", "770001001"]]),
+              DocumentTable("Страница 1", [HEADER] + body_rows(1, 3))]
+    items, confidence = extract_items_from_tables(tables)
+
+    assert len(items) == 3
+    assert confidence == 1.0
+
+
+def test_no_items_without_header():
+    assert extract_items_from_tables([DocumentTable("Лист1", body_rows(1, 5))]) == ([], 0.0)
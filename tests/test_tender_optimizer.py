@@ -0,0 +1,79 @@
+# tests/test_tender_optimizer.py
+
+import numpy as np
+import pytest
+from tender_optimizer import optimize_purchase
+
+NAN = np.nan
+SUPPLIERS = ["Альфа", "Бета", "Гамма"]
+NAMES = ["Болт", "Гайка", "Шайба", "Шплинт", "Заклепка"]
+PRICES = [
+    [10, 12, NAN],
+    [20, 15, 14],
+    [NAN, 30, 25],
+    [5, 6, 4],
+    [NAN, NAN, NAN],  # Без предложений — в расчете не участвует
+]
+
+
+def test_best_supplier_and_split():
+    result = optimize_purchase(PRICES, SUPPLIERS, NAMES)
+
+    assert result.rows == 4
+    assert result.totals == {"Альфа": 35.0, "Бета": 63.0, "Гамма": 43.0}
+    assert result.coverage == {"Альфа": 3, "Бета": 4, "Гамма": 3}
+    # Лучший целиком — с наибольшим покрытием, даже если сумма у него больше
+    assert (result.best_supplier, result.best_supplier_total) == ("Бета", 63.0)
+    assert (result.split_total, result.split_covered, result.split_savings) == (53.0, 4, 10.0)
+    assert result.split_allocation == {"Альфа": {"rows": 1, "total": 10.0}, "Гамма": {"rows": 3, "total": 43.0}}
+    assert result.assignment.tolist() == [0, 2, 2, 2]
+    assert result.top_savings[0] == {"name": "Шайба", "supplier": "Гамма", "price": 25.0, "best_supplier_price": 30.0}
+    assert [row["name"] for row in result.top_savings] == ["Шайба", "Болт", "Шплинт", "Гайка"]
+
+
+@pytest.mark.parametrize("max_suppliers, total, allocation", [
+    (1, 63.0, {"Бета": 4}),
+    (2, 53.0, {"Альфа": 1, "Гамма": 3}),
+])
+def test_max_suppliers(max_suppliers, total, allocation):
+    result = optimize_purchase(PRICES, SUPPLIERS, NAMES, max_suppliers=max_suppliers)
+
+    assert result.split_total == total
+    assert {s: a["rows"] for s, a in result.split_allocation.items()} == allocation
+    assert result.split_covered == 4
+    assert result.constraints == {"max_suppliers": max_suppliers}
+
+
+def test_min_order_moves_rows_of_small_supplier():
+    result = optimize_purchase(PRICES, SUPPLIERS, NAMES, min_order=11)
+
+    # У Альфы вышло бы 10 — меньше минимального заказа, болт переходит к следующему по цене
+    assert result.split_allocation == {"Бета": {"rows": 1, "total": 12.0}, "Гамма": {"rows": 3, "total": 43.0}}
+    assert result.split_total == 55.0
+
+
+def test_quantities_scale_prices():
+    result = optimize_purchase(PRICES, SUPPLIERS, NAMES, quantities=[3, 1, 1, 1, NAN])
+
+    assert result.totals["Альфа"] == 55.0
+    assert result.split_total == 73.0
+
+
+def test_full_coverage_only_without_full_offer():
+    prices = [[10, NAN], [NAN, 20]]
+    result = optimize_purchase(prices, ["Альфа", "Бета"], full_coverage_only=True)
+
+    assert result.best_supplier is None
+    assert result.split_total == 30.0 and result.split_covered == 2
+    assert result.to_text() == "Нет данных для сравнения поставщиков."
+
+
+def test_no_offers():
+    result = optimize_purchase([[NAN, NAN]], ["Альфа", "Бета"])
+
+    assert result.rows == 0 and result.best_supplier is None and result.split_total == 0.0
+
+
+def test_matrix_must_match_suppliers():
+    with pytest.raises(ValueError):
+        optimize_purchase([[1.0, 2.0]], SUPPLIERS)
@@ -0,0 +1,109 @@
+# text_chunker.py
+
+import re
+
+# Маркеры границ, которые расставляет document_parser: страницы PDF, листы Excel и таблицы
+SECTION_MARKER = re.compile(r"^--- (Страница|Лист|Таблица)\b.*---\s*$")
+
+# Грубая оценка: для смешанного русского/английского текста ~3 символа на токен
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Быстрая локальная оценка числа токенов без обращения к API."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _split_sections(text: str) -> list:
+    """Делит текст на секции (страницы/листы). Каждая секция — список строк, первая строка может быть маркером."""
+    sections, current = [], []
+    for line in text.splitlines():
+        if SECTION_MARKER.match(line) and current:
+            sections.append(current)
+            current = []
+        current.append(line)
+    if current:
+        sections.append(current)
+    return sections
+
+
+def split_text_into_chunks(text: str, max_tokens: int, overlap_lines: int = 2) -> list:
+    """
+    Делит документ на окна, каждое не больше max_tokens (по оценке).
+    Режем по границам страниц/листов, а слишком большие секции — по строкам.
+    Соседние окна внутри одной секции перекрываются на overlap_lines строк, чтобы не потерять
+    строку таблицы на стыке; к каждому продолжению добавляется маркер секции и строка заголовка таблицы.
+    Возвращает список словарей {"text": ..., "overlaps_previous": bool}.
+    """
+    chunks = []
+    buffer, buffer_tokens = [], 0
+
+    def flush():
+        nonlocal buffer, buffer_tokens
+        if buffer:
+            chunks.append({"text": "\n".join(buffer), "overlaps_previous": False})
+        buffer, buffer_tokens = [], 0
+
+    for section in _split_sections(text):
+        section_tokens = estimate_tokens("\n".join(section))
+        if section_tokens <= max_tokens:
+            # Секция целиком помещается: добавляем к текущему окну или начинаем новое
+            if buffer_tokens + section_tokens > max_tokens:
+                flush()
+            buffer.extend(section)
+            buffer_tokens += section_tokens
+            continue
+
+        # Большая секция: режем по строкам
+        flush()
+        has_marker = bool(SECTION_MARKER.match(section[0]))
+        context = section[:2] if has_marker else section[:1]  # Маркер и заголовок таблицы
+        body_start = len(context)
+        context_tokens = estimate_tokens("\n".join(context))
+        window, window_tokens = list(context), context_tokens
+        first_window = True
+        i = body_start
+        while i < len(section):
+            line = section[i]
+            line_tokens = estimate_tokens(line)
+            if window_tokens + line_tokens > max_tokens and len(window) > len(context):
+                chunks.append({"text": "\n".join(window), "overlaps_previous": not first_window})
+                first_window = False
+                tail = window[len(context):][-overlap_lines:] if overlap_lines else []
+                window = list(context) + tail
+                window_tokens = context_tokens + sum(estimate_tokens(l) for l in tail)
+            window.append(line)
+            window_tokens += line_tokens
+            i += 1
+        if len(window) > len(context) or first_window:
+            chunks.append({"text": "\n".join(window), "overlaps_previous": not first_window})
+    flush()
+    return chunks
+
+
+def _item_key(item) -> tuple:
+    """Ключ для поиска дублей, возникших на перекрытии окон (item — ExtractedItem)."""
+    return tuple(str(value or "").strip().lower()
+                 for value in (item.name, item.sku, item.quantity, item.unit, item.price_per_unit, item.total_price))
+
+
+def merge_chunk_items(chunks: list, chunk_items: list) -> list:
+    """
+    Объединяет позиции из окон в исходном порядке.
+    Позиция из окна, перекрывающегося с предыдущим, отбрасывается, только если такая же позиция
+    была извлечена из предыдущего окна (каждое совпадение гасит не больше одного дубля).
+    """
+    merged = []
+    previous_keys = []
+    for chunk, items in zip(chunks, chunk_items):
+        available = list(previous_keys) if chunk["overlaps_previous"] else []
+        current_keys = []
+        for item in items:
+            key = _item_key(item)
+            current_keys.append(key)
+            if key in available:
+                available.remove(key)
+                continue
+            merged.append(item)
+        previous_keys = current_keys
+    return merged